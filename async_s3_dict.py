@@ -0,0 +1,261 @@
+import asyncio
+from collections import deque
+from io import BytesIO
+
+from botocore.exceptions import ClientError, NoCredentialsError
+
+
+class AsyncS3Dict:
+    """
+    An asyncio counterpart of S3Dict for accessing an S3 bucket.
+
+    Requests run on aiobotocore's non-blocking HTTP client, so one event loop
+    can drive thousands of object operations without a thread per request.
+    At most `max_concurrency` requests are in flight at any time. Use it as
+    an async context manager, or call `close` when done.
+    """
+
+    def __init__(
+        self,
+        bucket_name,
+        region_name,
+        access_key=None,
+        secret_key=None,
+        max_concurrency=64,
+        endpoint_url=None,
+    ):
+        """
+        Initialize the AsyncS3Dict object; the client is created on first use.
+
+        Args:
+            bucket_name (str): Name of the S3 bucket.
+            region_name (str): Region of the S3 bucket.
+            access_key (str, optional): AWS access key. Defaults to None.
+            secret_key (str, optional): AWS secret key. Defaults to None.
+            max_concurrency (int, optional): Maximum number of requests in
+                flight. Defaults to 64.
+            endpoint_url (str, optional): Alternative S3 endpoint, such as a
+                local stand-in server. Defaults to None.
+        """
+        self.bucket_name = bucket_name
+        self.region_name = region_name
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.max_concurrency = max_concurrency
+        self.endpoint_url = endpoint_url
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._client = None
+        self._client_context = None
+        self._client_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._get_client()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the underlying HTTP client and its connections.
+        """
+        if self._client_context is not None:
+            context, self._client_context, self._client = (
+                self._client_context,
+                None,
+                None,
+            )
+            await context.__aexit__(None, None, None)
+
+    async def get(self, key):
+        """
+        Get an object from the S3 bucket using the provided key.
+
+        Args:
+            key (str): Key of the object to retrieve.
+
+        Returns:
+            BytesIO: BytesIO object representing the retrieved object.
+        """
+        client = await self._get_client()
+        async with self._semaphore:
+            try:
+                response = await client.get_object(Bucket=self.bucket_name, Key=key)
+                async with response["Body"] as body:
+                    return BytesIO(await body.read())
+            except NoCredentialsError:
+                raise Exception("No AWS credentials found.")
+
+    async def put(self, key, value):
+        """
+        Put a new object in the S3 bucket.
+
+        Args:
+            key (str): Key of the object to put.
+            value (BytesIO): BytesIO object representing the content of the object.
+        """
+        client = await self._get_client()
+        async with self._semaphore:
+            try:
+                await client.put_object(
+                    Bucket=self.bucket_name, Key=key, Body=value.read()
+                )
+            except NoCredentialsError:
+                raise Exception("No AWS credentials found.")
+
+    async def pop(self, key):
+        """
+        Remove an object from the S3 bucket and return it.
+
+        Args:
+            key (str): Key of the object to remove.
+
+        Returns:
+            BytesIO: BytesIO object representing the removed object.
+        """
+        value = await self.get(key)
+        await self.delete(key)
+        return value
+
+    async def delete(self, key):
+        """
+        Remove an object from the S3 bucket; the async form of `del d[key]`.
+
+        Args:
+            key (str): Key of the object to remove.
+        """
+        client = await self._get_client()
+        async with self._semaphore:
+            try:
+                await client.delete_object(Bucket=self.bucket_name, Key=key)
+            except NoCredentialsError:
+                raise Exception("No AWS credentials found.")
+
+    async def contains(self, key):
+        """
+        Check if an object exists in the S3 bucket; the async form of `key in d`.
+
+        Args:
+            key (str): Key of the object to check.
+
+        Returns:
+            bool: True if the object exists, False otherwise.
+        """
+        client = await self._get_client()
+        async with self._semaphore:
+            try:
+                await client.head_object(Bucket=self.bucket_name, Key=key)
+                return True
+            except NoCredentialsError:
+                raise Exception("No AWS credentials found.")
+            except ClientError as error:
+                if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                    return False
+                raise
+
+    async def keys(self, prefix=""):
+        """
+        Generate the keys from the S3 bucket with an optional prefix filter.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+
+        Yields:
+            str: Key from the S3 bucket.
+        """
+        client = await self._get_client()
+        paginator = client.get_paginator("list_objects_v2")
+        try:
+            async for page in paginator.paginate(
+                Bucket=self.bucket_name, Prefix=prefix
+            ):
+                for obj in page.get("Contents", []):
+                    yield obj["Key"]
+        except NoCredentialsError:
+            raise Exception("No AWS credentials found.")
+
+    def __aiter__(self):
+        return self.keys()
+
+    async def items(self, prefix="", ordered=True, window=None):
+        """
+        Generate tuples of key-value pairs from the S3 bucket with an optional prefix filter.
+
+        Gets run concurrently while the keys are listed, with at most
+        `window` of them in flight or buffered. Leaving the loop early
+        cancels the gets still running.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+            ordered (bool, optional): Yield pairs in listing order if True,
+                otherwise as soon as each get completes. Defaults to True.
+            window (int, optional): Maximum number of gets in flight.
+                Defaults to max_concurrency.
+
+        Yields:
+            tuple: Key-value pair from the S3 bucket.
+        """
+        window = window or self.max_concurrency
+        keys = self.keys(prefix).__aiter__()
+        pending = deque() if ordered else {}
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < window:
+                    try:
+                        key = await keys.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    task = asyncio.ensure_future(self.get(key))
+                    if ordered:
+                        pending.append((key, task))
+                    else:
+                        pending[task] = key
+                if not pending:
+                    return
+                if ordered:
+                    key, task = pending.popleft()
+                    yield key, await task
+                else:
+                    done, _ = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        yield pending.pop(task), task.result()
+        finally:
+            tasks = [task for _, task in pending] if ordered else list(pending)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await keys.aclose()
+
+    async def _get_client(self):
+        """
+        Return the aiobotocore S3 client, creating it on first use.
+
+        Returns:
+            aiobotocore.client.AioBaseClient: The S3 client.
+        """
+        if self._client is not None:
+            return self._client
+        async with self._client_lock:
+            if self._client is None:
+                try:
+                    from aiobotocore.config import AioConfig
+                    from aiobotocore.session import get_session
+                except ImportError:
+                    raise ImportError(
+                        "AsyncS3Dict requires aiobotocore: pip install aiobotocore"
+                    )
+                context = get_session().create_client(
+                    "s3",
+                    region_name=self.region_name,
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    endpoint_url=self.endpoint_url,
+                    config=AioConfig(max_pool_connections=self.max_concurrency),
+                )
+                self._client = await context.__aenter__()
+                self._client_context = context
+        return self._client
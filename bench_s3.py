@@ -0,0 +1,286 @@
+"""
+Benchmark suite for both S3Dict implementations against a local S3 stand-in.
+
+Starts a FakeS3Server with the given injected latency and measures get, put,
+contains, keys, items and delete for each implementation, object size and
+concurrency level. Results are printed, or written with --output, as JSON so
+runs on different commits can be compared. For example:
+
+    python -m logic.bench_s3 --sizes 1KB,1MB,64MB --concurrency 1,16 \\
+        --latency 0.005 --output results.json
+
+Sizes up to 1GB are accepted; the number of objects per run is reduced so
+that no run moves more than --max-bytes.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from io import BytesIO
+
+from logic import logic_urllib, s3_dict
+from logic.s3_fake_server import FakeS3Server
+from logic.s3_transport import Urllib3Transport
+
+BUCKET = "bench"
+REGION = "us-east-1"
+ACCESS_KEY = SECRET_KEY = "bench"
+_UNITS = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3}
+
+
+def make_s3_dict_boto3(endpoint_url, concurrency):
+    return s3_dict.S3Dict(
+        BUCKET,
+        REGION,
+        ACCESS_KEY,
+        SECRET_KEY,
+        max_workers=concurrency,
+        endpoint_url=endpoint_url,
+    )
+
+
+def make_s3_dict_urllib3(endpoint_url, concurrency):
+    transport = Urllib3Transport(
+        REGION, ACCESS_KEY, SECRET_KEY, concurrency, endpoint_url=endpoint_url
+    )
+    return s3_dict.S3Dict(BUCKET, REGION, max_workers=concurrency, transport=transport)
+
+
+def make_logic_urllib(endpoint_url, concurrency):
+    return logic_urllib.S3Dict(
+        BUCKET,
+        REGION,
+        ACCESS_KEY,
+        SECRET_KEY,
+        max_connections=concurrency,
+        endpoint=endpoint_url,
+    )
+
+
+IMPLEMENTATIONS = {
+    "s3_dict[boto3]": make_s3_dict_boto3,
+    "s3_dict[urllib3]": make_s3_dict_urllib3,
+    "logic_urllib": make_logic_urllib,
+}
+
+
+def parse_size(text):
+    """
+    Parse a size such as '1KB', '64MB' or '1GB' into bytes (binary units).
+    """
+    text = text.strip().upper()
+    for unit in sorted(_UNITS, key=len, reverse=True):
+        if text.endswith(unit):
+            return int(float(text[: -len(unit)]) * _UNITS[unit])
+    return int(text)
+
+
+def percentile(values, pct):
+    """
+    Return the nearest-rank percentile of a list of values.
+    """
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(name, impl, size, concurrency, latencies, seconds, count, nbytes):
+    """
+    Build one JSON result record from raw timings.
+    """
+    return {
+        "implementation": impl,
+        "operation": name,
+        "size": size,
+        "concurrency": concurrency,
+        "count": count,
+        "seconds": round(seconds, 6),
+        "ops_per_sec": round(count / seconds, 3) if seconds else None,
+        "mb_per_sec": round(nbytes / seconds / 1024**2, 3) if seconds else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def run_each(fn, keys, concurrency):
+    """
+    Call fn(key) for every key from `concurrency` threads.
+
+    Returns:
+        tuple: Latency of each call and total wall time, in seconds.
+    """
+
+    def timed(key):
+        start = time.perf_counter()
+        fn(key)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, keys))
+    return latencies, time.perf_counter() - start
+
+
+def run_scan(fn, repeat):
+    """
+    Time `repeat` full scans, each one consuming the iterable fn() returns.
+
+    Returns:
+        tuple: Latency of each scan, total wall time and items per scan.
+    """
+    latencies, items = [], 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        items = 0
+        for item in fn():
+            if isinstance(item, tuple):
+                item[1].read()
+            items += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, sum(latencies), items
+
+
+def bench_cell(impl, factory, endpoint_url, size, concurrency, count, repeat, data):
+    """
+    Run every operation for one implementation, size and concurrency level.
+    """
+    d = factory(endpoint_url, concurrency)
+    prefix = f"{impl}/{size}/{concurrency}/"
+    keys = [f"{prefix}{i:06d}" for i in range(count)]
+    results = []
+
+    def record(name, latencies, seconds, ops, nbytes):
+        results.append(
+            summarize(name, impl, size, concurrency, latencies, seconds, ops, nbytes)
+        )
+
+    latencies, seconds = run_each(
+        lambda key: d.put(key, BytesIO(data)), keys, concurrency
+    )
+    record("put", latencies, seconds, count, count * size)
+    latencies, seconds = run_each(lambda key: d.get(key).read(), keys, concurrency)
+    record("get", latencies, seconds, count, count * size)
+    latencies, seconds = run_each(lambda key: key in d, keys, concurrency)
+    record("contains", latencies, seconds, count, 0)
+
+    latencies, seconds, listed = run_scan(lambda: d.keys(prefix), repeat)
+    record("keys", latencies, seconds, listed * repeat, 0)
+    if isinstance(d, logic_urllib.S3Dict):
+        scan = lambda: d.threaded_items(prefix, workers=concurrency)
+    else:
+        scan = lambda: d.items(prefix, ordered=False, max_workers=concurrency)
+    latencies, seconds, listed = run_scan(scan, repeat)
+    record("items", latencies, seconds, listed * repeat, listed * repeat * size)
+
+    def delete(key):
+        del d[key]
+
+    latencies, seconds = run_each(delete, keys, concurrency)
+    record("delete", latencies, seconds, count, 0)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes, concurrency_levels, implementations, latency, count, max_bytes, repeat):
+    """
+    Run the full benchmark grid against a fresh stand-in server.
+
+    Returns:
+        dict: Run metadata and one result record per operation and cell.
+    """
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "latency": latency,
+            "count": count,
+            "max_bytes": max_bytes,
+            "repeat": repeat,
+        },
+        "results": [],
+    }
+    with FakeS3Server(latency=latency) as server:
+        for size in sizes:
+            data = os.urandom(size)
+            cell_count = max(1, min(count, max_bytes // max(size, 1)))
+            for concurrency in concurrency_levels:
+                for impl in implementations:
+                    report["results"].extend(
+                        bench_cell(
+                            impl,
+                            IMPLEMENTATIONS[impl],
+                            server.endpoint_url,
+                            size,
+                            concurrency,
+                            cell_count,
+                            repeat,
+                            data,
+                        )
+                    )
+    return report
+
+
+def main(argv=None):
+    """
+    Run the benchmark from command-line arguments.
+
+    Returns:
+        int: Exit status, 0 once the report is written.
+    """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1KB,64KB,1MB,16MB")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument(
+        "--implementations", default=",".join(IMPLEMENTATIONS), help="Comma-separated"
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added per request"
+    )
+    parser.add_argument("--count", type=int, default=200, help="Objects per run")
+    parser.add_argument(
+        "--max-bytes", default="256MB", help="Cap on the bytes written per run"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="Scans per listing")
+    parser.add_argument("--output", help="File to write the JSON report to")
+    args = parser.parse_args(argv)
+
+    report = run(
+        sizes=[parse_size(size) for size in args.sizes.split(",")],
+        concurrency_levels=[int(c) for c in args.concurrency.split(",")],
+        implementations=args.implementations.split(","),
+        latency=args.latency,
+        count=args.count,
+        max_bytes=parse_size(args.max_bytes),
+        repeat=args.repeat,
+    )
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
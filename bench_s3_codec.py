@@ -0,0 +1,118 @@
+"""
+Benchmark of the S3Dict compression codecs on sample values.
+
+For every installed codec and a few levels, reports the compression ratio
+and the CPU throughput of compression and decompression, with the same
+streaming readers S3Dict uses. Values come from files, from objects under
+a prefix of a bucket, or by default from a JSON sample shaped like the
+industry descriptions of application.py. Run with
+`python -m logic.bench_s3_codec [--bucket NAME --prefix PREFIX] [FILE ...]`.
+"""
+
+import argparse
+import json
+import time
+from io import BytesIO
+
+from logic.s3_codec import CODECS, DecodingReader, EncodingReader, available_codecs
+
+LEVELS = {"gzip": (1, 6, 9), "zstd": (1, 3, 9), "lz4": (0, 9)}
+
+DESCRIPTION = (
+    "Organic cotton is grown without the use of synthetic fertilizers, "
+    "pesticides, and genetically modified organisms (GMOs). This industry "
+    "promotes sustainable farming practices and uses natural methods for pest "
+    "and weed control."
+)
+
+
+def sample_values(count=200):
+    """
+    Build JSON documents resembling the values application.py stores.
+    """
+    return [
+        json.dumps(
+            {
+                "industry": f"Industry {i}",
+                "description": DESCRIPTION,
+                "tags": ["sustainable", "textile", f"region-{i % 7}"],
+                "score": i * 0.37,
+            }
+        ).encode()
+        for i in range(count)
+    ]
+
+
+def load_values(args):
+    if args.bucket:
+        from logic.s3_dict import S3Dict
+
+        s3_dict = S3Dict(args.bucket, args.region)
+        values = []
+        for _, value in s3_dict.items(args.prefix):
+            values.append(value.read())
+            if len(values) == args.limit:
+                break
+        return values
+    if args.files:
+        values = []
+        for path in args.files:
+            with open(path, "rb") as f:
+                values.append(f.read())
+        return values
+    return sample_values()
+
+
+def measure(codec, values):
+    """
+    Compress and decompress every value once.
+
+    Returns:
+        tuple: Raw bytes, compressed bytes, and CPU seconds spent
+            compressing and decompressing.
+    """
+    raw = encoded = 0
+    encode_cpu = decode_cpu = 0.0
+    for value in values:
+        start = time.process_time()
+        data = EncodingReader(BytesIO(value), codec).read()
+        encode_cpu += time.process_time() - start
+        start = time.process_time()
+        decoded = DecodingReader(BytesIO(data), codec).read()
+        decode_cpu += time.process_time() - start
+        assert decoded == value
+        raw += len(value)
+        encoded += len(data)
+    return raw, encoded, encode_cpu, decode_cpu
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("files", nargs="*", help="Files to use as values")
+    parser.add_argument("--bucket", help="Sample objects from this bucket")
+    parser.add_argument("--prefix", default="", help="Prefix of the sampled keys")
+    parser.add_argument("--region", default="us-east-1")
+    parser.add_argument("--limit", type=int, default=500, help="Objects to sample")
+    args = parser.parse_args(argv)
+
+    values = load_values(args)
+    total = sum(map(len, values))
+    print(f"{len(values)} values, {total} bytes, {total / len(values):.0f} on average")
+    print(f"{'codec':<10}{'ratio':>8}{'compress MB/s':>16}{'decompress MB/s':>18}")
+    for name in available_codecs():
+        for level in LEVELS[name]:
+            raw, encoded, encode_cpu, decode_cpu = measure(
+                CODECS[name](level=level), values
+            )
+            print(
+                f"{f'{name}-{level}':<10}{raw / encoded:>8.2f}"
+                f"{raw / 1e6 / max(encode_cpu, 1e-9):>16.1f}"
+                f"{raw / 1e6 / max(decode_cpu, 1e-9):>18.1f}"
+            )
+    missing = sorted(set(CODECS) - set(available_codecs()))
+    if missing:
+        print(f"Not installed: {', '.join(missing)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Micro-benchmark of the per-request cost of SigV4 signing.
+
+Compares SigV4Signer against botocore's S3SigV4Auth, which boto3 runs for
+every request, on a ranged GET. Run with `python -m logic.bench_sign`.
+"""
+
+import timeit
+
+from botocore.auth import S3SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.credentials import Credentials
+
+from logic.s3_sign import SigV4Signer
+
+URL = "https://bucket.s3.eu-west-1.amazonaws.com/some/key%20name"
+HEADERS = {"Range": "bytes=0-1048575"}
+
+
+def sign_with_signer(signer):
+    signer.sign("GET", URL, HEADERS)
+
+
+def sign_with_botocore(auth):
+    request = AWSRequest("GET", URL, headers=dict(HEADERS))
+    request.context["payload_signing_enabled"] = False
+    auth.add_auth(request)
+
+
+def measure(fn, arg, number):
+    """
+    Return the best time per call over five runs, in microseconds.
+    """
+    runs = timeit.repeat(lambda: fn(arg), number=number, repeat=5)
+    return min(runs) / number * 1e6
+
+
+def main(number=20000):
+    signer = SigV4Signer("AKIDEXAMPLE", "secret", "eu-west-1")
+    auth = S3SigV4Auth(Credentials("AKIDEXAMPLE", "secret"), "s3", "eu-west-1")
+    results = {
+        "SigV4Signer": measure(sign_with_signer, signer, number),
+        "botocore S3SigV4Auth": measure(sign_with_botocore, auth, number),
+    }
+    for name, micros in results.items():
+        print(f"{name:<24}{micros:8.1f} us/request")
+
+
+if __name__ == "__main__":
+    main()
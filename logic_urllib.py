@@ -1,26 +1,181 @@
+import http.client
+import queue
 import threading
+from collections import namedtuple
+from datetime import datetime
 from io import BytesIO
-from urllib import request
-import urllib
+from urllib import parse, request
+from xml.etree import ElementTree
+
+from logic.s3_sign import SigV4Signer
+from logic.s3_stream import DEFAULT_BUFFER_SIZE, RangeReader
+
+
+Response = namedtuple('Response', ['status', 'headers', 'data'])
+
+LIST_CHUNK_SIZE = 64 * 1024
+
+
+class ConnectionPool:
+    # Keep-alive HTTP(S) connections shared by every request to the same host.
+    # At most `maxsize` connections per host are open at once; callers block
+    # for a free slot instead of opening more.
+    def __init__(self, maxsize: int = 10, timeout: float = 60):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.stats = {'opened': 0, 'reused': 0, 'dropped': 0}
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, body: bytes = None, headers: dict = None) -> Response:
+        host, path = _split_url(url)
+        with self._slot(host):
+            conn, response = self._send(host, method, path, body, headers or {})
+            data = self._read(host, conn, response, -1)
+        if response.status >= 400:
+            raise request.HTTPError(url, response.status, response.reason, response.headers, BytesIO(data))
+        return Response(response.status, response.headers, data)
+
+    def iter_chunks(self, method: str, url: str, headers: dict = None, chunk_size: int = LIST_CHUNK_SIZE):
+        # Like request(), but yields the body as it arrives. The connection
+        # goes back to the pool once the body has been read to the end.
+        host, path = _split_url(url)
+        with self._slot(host):
+            conn, response = self._send(host, method, path, None, headers or {})
+            if response.status >= 400:
+                data = self._read(host, conn, response, -1)
+                raise request.HTTPError(url, response.status, response.reason, response.headers, BytesIO(data))
+            try:
+                while True:
+                    chunk = self._read(host, conn, response, chunk_size)
+                    if chunk:
+                        yield chunk
+                    # The read that reaches the end already released the
+                    # connection; reading again would release it twice.
+                    if response.isclosed():
+                        return
+            except GeneratorExit:
+                # Abandoned mid-body; the connection cannot be reused.
+                if not response.isclosed():
+                    conn.close()
+                    self._count('dropped')
+                raise
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+    def _send(self, host: tuple, method: str, path: str, body, headers: dict):
+        while True:
+            conn, reused = self._get_conn(host)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                self._count('dropped')
+                if reused:
+                    # The server closed an idle keep-alive connection; retry
+                    # once on a fresh one.
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                self._count('dropped')
+                raise
+
+    def _read(self, host: tuple, conn: http.client.HTTPConnection, response, amt: int) -> bytes:
+        # Read from the response and release the connection once it is done.
+        try:
+            data = response.read() if amt < 0 else response.read(amt)
+        except BaseException:
+            conn.close()
+            self._count('dropped')
+            raise
+        if response.isclosed():
+            if response.will_close:
+                conn.close()
+            else:
+                self._put_conn(host, conn)
+        return data
+
+    def _slot(self, host: tuple) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(self.maxsize)
+            return self._slots[host]
+
+    def _get_conn(self, host: tuple):
+        with self._lock:
+            idle = self._idle.get(host)
+            if idle:
+                self.stats['reused'] += 1
+                return idle.pop(), True
+            self.stats['opened'] += 1
+        scheme, netloc = host
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def _put_conn(self, host: tuple, conn: http.client.HTTPConnection):
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+            self.stats['dropped'] += 1
+        conn.close()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
 
 
 class S3Dict:
-    def __init__(self, bucket: str, region: str, access_key: str, secret_key: str):
+    def __init__(self, bucket: str, region: str, access_key: str, secret_key: str,
+                 pool: ConnectionPool = None, max_connections: int = 10, endpoint: str = None):
         self.bucket = bucket
         self.region = region
+        # Path-style base URL of an S3-compatible server, such as a local
+        # stand-in; defaults to the bucket's virtual-hosted AWS endpoint.
+        self.endpoint = endpoint
         self.access_key = access_key
         self.secret_key = secret_key
+        # Pass the same pool to several instances to share connections.
+        self.pool = pool or ConnectionPool(maxsize=max_connections)
+        # Requests are signed with SigV4 when keys are given; without them
+        # only public objects can be read.
+        self.signer = SigV4Signer(access_key, secret_key, region) if access_key and secret_key else None
     
     def get(self, key: str) -> BytesIO:
         url = self._get_url(key)
-        response = request.urlopen(url)
-        return BytesIO(response.read())
+        response = self.pool.request('GET', url, headers=self._sign('GET', url))
+        return BytesIO(response.data)
+    
+    def open(self, key: str, buffer_size: int = DEFAULT_BUFFER_SIZE) -> RangeReader:
+        # Ranged GETs pinned to the ETag seen at open time.
+        url = self._get_url(key)
+        head = self.pool.request('HEAD', url, headers=self._sign('HEAD', url))
+        etag = head.headers.get('ETag')
+
+        def fetch(start: int, end: int) -> bytes:
+            headers = {'Range': f'bytes={start}-{end}'}
+            if etag:
+                headers['If-Match'] = etag
+            return self.pool.request('GET', url, headers=self._sign('GET', url, headers)).data
+
+        return RangeReader(fetch, int(head.headers['Content-Length']), buffer_size, etag)
+
+    get_stream = open
     
     def put(self, key: str, value: BytesIO):
         url = self._get_url(key)
         data=value.read()
-        req = urllib.request.Request(url, data=data, method='POST')
-        request.urlopen(req)
+        self.pool.request('PUT', url, body=data, headers=self._sign('PUT', url))
     
     def pop(self, key: str) -> BytesIO:
         value = self.get(key)
@@ -39,16 +194,90 @@ class S3Dict:
     def __contains__(self, key: str) -> bool:
         url = self._get_url(key)
         try:
-            request.urlopen(url)
+            self.pool.request('HEAD', url, headers=self._sign('HEAD', url))
             return True
-        except request.HTTPError:
-            return False
+        except request.HTTPError as e:
+            # Only a missing key means absent; throttling or access errors
+            # must not pass for one.
+            if e.code == 404:
+                return False
+            raise
     
-    def keys(self, prefix: str = ''):
-        url = self._get_url(prefix)
-        response = request.urlopen(url)
-        keys = [line.decode().split('<Key>')[1].split('</Key>')[0] for line in response]
-        yield from keys
+    def keys(self, prefix: str = '', metadata: bool = False):
+        for entry in self.list_objects(prefix):
+            yield entry if metadata else entry['Key']
+
+    def list_objects(self, prefix: str = '', start_after: str = '', prefetch: int = 1000):
+        # ListObjectsV2 entries (Key, Size, ETag, LastModified) in listing
+        # order. A background thread parses each page as it streams in and
+        # moves on to the next page while the caller consumes this one; at
+        # most `prefetch` entries are buffered.
+        entries = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def list_pages():
+            try:
+                token = None
+                while True:
+                    token = self._list_page(prefix, start_after, token, entries, stop)
+                    if token is None:
+                        break
+            except Exception as error:
+                _put(entries, error, stop)
+            _put(entries, _DONE, stop)
+
+        thread = threading.Thread(target=list_pages, daemon=True)
+        thread.start()
+        try:
+            while True:
+                entry = entries.get()
+                if entry is _DONE:
+                    return
+                if isinstance(entry, Exception):
+                    raise entry
+                yield entry
+        finally:
+            stop.set()
+            thread.join()
+
+    def _list_page(self, prefix: str, start_after: str, token: str, entries: queue.Queue,
+                   stop: threading.Event) -> str:
+        # Parse one page with an event-based parser, pushing each entry as
+        # soon as its element ends. Returns the continuation token, or None
+        # on the last page.
+        query = {'list-type': '2', 'prefix': prefix}
+        if token:
+            query['continuation-token'] = token
+        elif start_after:
+            query['start-after'] = start_after
+        url = self._get_url('') + '?' + parse.urlencode(query, quote_via=parse.quote)
+
+        parser = ElementTree.XMLPullParser(events=('start', 'end'))
+        root = None
+        truncated = False
+        next_token = None
+        chunks = self.pool.iter_chunks('GET', url, headers=self._sign('GET', url))
+        try:
+            for chunk in chunks:
+                parser.feed(chunk)
+                for event, elem in parser.read_events():
+                    if root is None:
+                        root = elem
+                    if event != 'end':
+                        continue
+                    tag = _local_name(elem.tag)
+                    if tag == 'Contents':
+                        root.remove(elem)
+                        if not _put(entries, _list_entry(elem), stop):
+                            return None
+                    elif tag == 'IsTruncated':
+                        truncated = elem.text == 'true'
+                    elif tag == 'NextContinuationToken':
+                        next_token = elem.text
+        finally:
+            chunks.close()
+        parser.close()
+        return next_token if truncated else None
     
     def items(self, prefix: str = ''):
         keys = self.keys(prefix)
@@ -57,26 +286,112 @@ class S3Dict:
             yield key, value
     
     def _get_url(self, key: str) -> str:
-        base_url = f"https://{self.bucket}.s3.{self.region}.amazonaws.com/"
-        return base_url + key
+        if self.endpoint:
+            base_url = f"{self.endpoint.rstrip('/')}/{self.bucket}/"
+        else:
+            base_url = f"https://{self.bucket}.s3.{self.region}.amazonaws.com/"
+        return base_url + parse.quote(key)
     
+    def _sign(self, method: str, url: str, headers: dict = None) -> dict:
+        if self.signer is None:
+            return headers or {}
+        return self.signer.sign(method, url, headers)
+
     def _delete(self, key: str):
         url = self._get_url(key)
-        request.urlopen(url, method='DELETE')
+        self.pool.request('DELETE', url, headers=self._sign('DELETE', url))
 
-    def _threaded_items(self, prefix: str):
-        keys = self.keys(prefix)
-        for key in keys:
-            value = self.get(key)
-            yield key, value
-    
-    def threaded_items(self, prefix: str = ''):
-        keys = self.keys(prefix)
-        threads = []
-        for key in keys:
-            t = threading.Thread(target=self._threaded_items, args=(key,))
-            t.start()
-            threads.append(t)
+    def pool_stats(self) -> dict:
+        return dict(self.pool.stats)
+
+    def threaded_items(self, prefix: str = '', workers: int = 8, queue_size: int = 64):
+        # Listing feeds a bounded queue of keys, a fixed pool of workers fetches
+        # them and results come back through a second bounded queue, so memory
+        # stays flat no matter how many keys the prefix holds.
+        keys = queue.Queue(maxsize=queue_size)
+        results = queue.Queue(maxsize=queue_size)
+        stop = threading.Event()
+
+        def list_keys():
+            try:
+                for key in self.keys(prefix):
+                    if not _put(keys, key, stop):
+                        return
+            except Exception as error:
+                _put(results, (None, None, error), stop)
+            for _ in range(workers):
+                _put(keys, _DONE, stop)
+
+        def fetch():
+            while not stop.is_set():
+                try:
+                    key = keys.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if key is _DONE:
+                    break
+                try:
+                    item = (key, self.get(key), None)
+                except Exception as error:
+                    item = (key, None, error)
+                if not _put(results, item, stop):
+                    return
+            _put(results, _DONE, stop)
+
+        threads = [threading.Thread(target=list_keys, daemon=True)]
+        threads += [threading.Thread(target=fetch, daemon=True) for _ in range(workers)]
         for t in threads:
-            t.join()
+            t.start()
+        try:
+            finished = 0
+            while finished < workers:
+                item = results.get()
+                if item is _DONE:
+                    finished += 1
+                    continue
+                key, value, error = item
+                if error is not None:
+                    raise error
+                yield key, value
+        finally:
+            # Threads poll the stop flag, so an early exit by the consumer
+            # unblocks them within one queue timeout.
+            stop.set()
+            for t in threads:
+                t.join()
+
+
+_DONE = object()
+
+
+def _split_url(url: str):
+    parts = parse.urlsplit(url)
+    path = parts.path or '/'
+    if parts.query:
+        path += '?' + parts.query
+    return (parts.scheme, parts.netloc), path
+
 
+def _local_name(tag: str) -> str:
+    return tag.rpartition('}')[2]
+
+
+def _list_entry(elem: ElementTree.Element) -> dict:
+    fields = {_local_name(child.tag): child.text for child in elem}
+    modified = fields.get('LastModified')
+    return {
+        'Key': fields['Key'],
+        'Size': int(fields.get('Size') or 0),
+        'ETag': fields.get('ETag'),
+        'LastModified': datetime.fromisoformat(modified) if modified else None,
+    }
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
@@ -0,0 +1,332 @@
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from urllib.parse import quote, unquote
+
+CacheEntry = namedtuple("CacheEntry", ["data", "etag", "fresh"])
+DiskEntry = namedtuple("DiskEntry", ["data", "etag", "fresh", "path"])
+
+
+class MemoryCache:
+    """
+    A thread-safe, in-memory LRU cache of object bodies bounded by total size.
+
+    Entries are considered fresh for `ttl` seconds. Once stale they are kept
+    so the caller can revalidate them with their ETag instead of downloading
+    the body again.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl=60):
+        """
+        Initialize the cache.
+
+        Args:
+            max_bytes (int, optional): Maximum total size of the cached bodies.
+                Defaults to 64 MiB.
+            ttl (float, optional): Seconds an entry is served without
+                revalidation. Defaults to 60.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "revalidations": 0,
+            "evictions": 0,
+        }
+
+    def lookup(self, key):
+        """
+        Look up an entry and mark it as recently used.
+
+        A fresh entry counts as a hit and a missing one as a miss. Stale
+        entries are counted separately and returned with `fresh` set to False
+        so the caller can revalidate them.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            CacheEntry: The entry, or None if the key is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            data, etag, expires = entry
+            fresh = time.monotonic() < expires
+            self._stats["hits" if fresh else "stale"] += 1
+            return CacheEntry(data, etag, fresh)
+
+    def store(self, key, data, etag):
+        """
+        Add or replace an entry, evicting least recently used ones if needed.
+
+        Args:
+            key (str): Key of the object.
+            data (bytes): Body of the object.
+            etag (str): ETag of the object.
+        """
+        with self._lock:
+            self._remove(key)
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = (data, etag, time.monotonic() + self.ttl)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (evicted, _, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self._stats["evictions"] += 1
+
+    def revalidated(self, key):
+        """
+        Mark a stale entry as fresh again after the server confirmed its ETag.
+
+        Args:
+            key (str): Key of the object.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                data, etag, _ = entry
+                self._entries[key] = (data, etag, time.monotonic() + self.ttl)
+                self._stats["revalidations"] += 1
+
+    def invalidate(self, key):
+        """
+        Drop an entry.
+
+        Args:
+            key (str): Key of the object.
+        """
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        """
+        Drop every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: Hits, misses, stale lookups, revalidations, evictions,
+                entries and bytes.
+        """
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._size)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+
+class DiskCache:
+    """
+    A persistent on-disk cache of object bodies keyed by bucket, key and ETag.
+
+    Files are written to a temporary name and renamed into place, so several
+    processes can share one directory. Reads are served through read-only
+    memory maps rather than copies. When the directory grows beyond
+    `max_bytes`, the least recently used files are removed.
+    """
+
+    def __init__(self, directory, max_bytes=1024 * 1024 * 1024, ttl=0):
+        """
+        Initialize the cache.
+
+        Args:
+            directory (str | os.PathLike): Directory holding the cached files;
+                created if missing.
+            max_bytes (int, optional): Maximum disk usage. Defaults to 1 GiB.
+            ttl (float, optional): Seconds an entry is served without
+                revalidation. Defaults to 0, which always revalidates.
+        """
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._usage = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "revalidations": 0,
+            "evictions": 0,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+
+    def lookup(self, bucket, key):
+        """
+        Find the cached copy of an object and map it into memory.
+
+        Args:
+            bucket (str): Name of the bucket.
+            key (str): Key of the object.
+
+        Returns:
+            DiskEntry: The entry with a read-only memoryview of the body,
+                or None if the object is not cached.
+        """
+        key_dir = self._key_dir(bucket, key)
+        try:
+            names = [name for name in os.listdir(key_dir) if not name.startswith(".")]
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            path = os.path.join(key_dir, name)
+            try:
+                stat = os.stat(path)
+                data = _map(path)
+            except FileNotFoundError:
+                # Evicted or replaced by another process meanwhile.
+                continue
+            now = time.time()
+            os.utime(path, (now, stat.st_mtime))
+            fresh = now - stat.st_mtime < self.ttl
+            self._count("hits" if fresh else "stale")
+            return DiskEntry(data, unquote(name), fresh, path)
+        self._count("misses")
+        return None
+
+    def store(self, bucket, key, etag, stream):
+        """
+        Write an object to the cache and map the cached copy into memory.
+
+        Args:
+            bucket (str): Name of the bucket.
+            key (str): Key of the object.
+            etag (str): ETag of the object.
+            stream (file-like): Readable file object with the body.
+
+        Returns:
+            memoryview: Read-only view of the cached body.
+        """
+        key_dir = self._key_dir(bucket, key)
+        os.makedirs(key_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=key_dir, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                shutil.copyfileobj(stream, f, 1024 * 1024)
+                size = f.tell()
+            path = os.path.join(key_dir, quote(etag, safe=""))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        for name in os.listdir(key_dir):
+            if not name.startswith(".") and os.path.join(key_dir, name) != path:
+                _unlink(os.path.join(key_dir, name))
+        data = _map(path)
+        self._add_usage(size)
+        return data
+
+    def invalidate(self, bucket, key):
+        """
+        Drop every cached copy of an object.
+
+        Args:
+            bucket (str): Name of the bucket.
+            key (str): Key of the object.
+        """
+        key_dir = self._key_dir(bucket, key)
+        try:
+            names = os.listdir(key_dir)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.startswith("."):
+                _unlink(os.path.join(key_dir, name))
+
+    def revalidated(self, entry):
+        """
+        Mark a stale entry as fresh again after the server confirmed its ETag.
+
+        Args:
+            entry (DiskEntry): Entry returned by `lookup`.
+        """
+        now = time.time()
+        try:
+            os.utime(entry.path, (now, now))
+        except FileNotFoundError:
+            return
+        self._count("revalidations")
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+            dict: Hits, misses, stale lookups, revalidations and evictions.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _key_dir(self, bucket, key):
+        digest = hashlib.sha256(f"{bucket}/{key}".encode()).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    yield path, os.stat(path)
+                except FileNotFoundError:
+                    pass
+
+    def _add_usage(self, size):
+        with self._lock:
+            if self._usage is None:
+                self._usage = sum(stat.st_size for _, stat in self._files())
+            else:
+                self._usage += size
+            if self._usage <= self.max_bytes:
+                return
+            # Other processes write to the same directory, so re-scan it
+            # before evicting rather than trusting the running total.
+            files = sorted(self._files(), key=lambda item: item[1].st_atime)
+            self._usage = sum(stat.st_size for _, stat in files)
+            for path, stat in files:
+                if self._usage <= self.max_bytes:
+                    break
+                _unlink(path)
+                self._usage -= stat.st_size
+                self._stats["evictions"] += 1
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b"")
+        return memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,194 @@
+from collections.abc import Mapping
+from datetime import datetime, timedelta, timezone
+
+# How far S3's clock, and the start of uploads still in progress, may lag
+# behind the local clock when a listing starts.
+CLOCK_SKEW = timedelta(minutes=5)
+
+
+class Checkpoint:
+    """
+    What an incremental listing of a prefix has seen, to resume from.
+
+    A checkpoint holds a time, the ETags of the keys listed with a
+    LastModified from that time on, and optionally a manifest mapping
+    every listed key to its ETag. With a manifest, changes are detected by
+    ETag and deletions are reported. Without one, objects modified from
+    the checkpoint's time on and not in its boundary are reported.
+
+    That time is not the latest LastModified listed but the start of the
+    listing minus CLOCK_SKEW, since an object written while the prefix is
+    listed can be dated before objects already listed. Timestamp
+    checkpoints still miss deletions, and objects dated more than
+    CLOCK_SKEW before the listing started that were not yet visible in it:
+    multipart uploads, which S3 dates by their initiation, and other slow
+    uploads completing after the listing, or any write when S3's clock
+    lags further behind the local one.
+    """
+
+    def __init__(self, modified=None, boundary=None, etags=None):
+        """
+        Initialize the checkpoint.
+
+        Args:
+            modified (datetime, optional): Time from which objects are
+                compared with the boundary; naive datetimes are taken as
+                UTC. Defaults to None, for the beginning of time.
+            boundary (dict, optional): ETags of the keys already seen that
+                were modified from `modified` on. Defaults to None, for
+                none.
+            etags (dict, optional): Manifest of the ETag of every key seen.
+                Defaults to None, for a timestamp-only checkpoint.
+        """
+        if modified is not None and modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        self.modified = modified
+        self.boundary = dict(boundary or {})
+        self.etags = etags
+
+    @classmethod
+    def coerce(cls, since):
+        """
+        Build a checkpoint from any value accepted as `since`.
+
+        Args:
+            since (Checkpoint | datetime | dict): A checkpoint, a
+                LastModified time, which includes the objects modified at
+                that time, or a manifest of ETags by key.
+
+        Returns:
+            Checkpoint: The checkpoint.
+
+        Raises:
+            TypeError: If `since` is none of these.
+        """
+        if isinstance(since, cls):
+            return since
+        if isinstance(since, datetime):
+            # Nothing modified at that time has been seen yet.
+            return cls(modified=since)
+        if isinstance(since, Mapping):
+            return cls(etags=dict(since))
+        raise TypeError(f"Cannot resume from {type(since).__name__}")
+
+    def changed(self, entry):
+        """
+        Tell whether a listing entry is new or changed since the checkpoint.
+
+        Args:
+            entry (dict): Listing entry with Key, ETag and LastModified.
+
+        Returns:
+            bool: True if the object should be processed again.
+        """
+        if self.etags is not None:
+            return self.etags.get(entry["Key"]) != entry["ETag"]
+        if self.modified is None:
+            return True
+        if entry["LastModified"] < self.modified:
+            return False
+        return self.boundary.get(entry["Key"]) != entry["ETag"]
+
+    def to_dict(self):
+        """
+        Convert the checkpoint to JSON-serializable data.
+
+        Returns:
+            dict: Data for `from_dict`.
+        """
+        return {
+            "modified": self.modified.isoformat() if self.modified else None,
+            "boundary": self.boundary,
+            "etags": self.etags,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Rebuild a checkpoint saved with `to_dict`.
+
+        Args:
+            data (dict): Saved checkpoint.
+
+        Returns:
+            Checkpoint: The checkpoint.
+        """
+        modified = data.get("modified")
+        return cls(
+            modified=datetime.fromisoformat(modified) if modified else None,
+            boundary=data.get("boundary"),
+            etags=data.get("etags"),
+        )
+
+
+class ChangeListing:
+    """
+    An iterable over the keys under a prefix changed since a checkpoint.
+
+    The prefix is listed once and every entry is compared with the
+    checkpoint using its listing metadata alone, with no HEAD requests.
+    After iteration, `deleted` holds the keys of the checkpoint's manifest
+    that are gone (always empty for timestamp checkpoints), and
+    `checkpoint` the Checkpoint to resume from next time, of the same kind
+    as the one given; both are None until the listing is exhausted.
+    """
+
+    def __init__(self, list_objects, prefix, since, fetch=None):
+        """
+        Initialize the listing; nothing is requested until it is iterated.
+
+        Args:
+            list_objects (callable): Called with the prefix, returns the
+                listing entries with Key, ETag and LastModified.
+            prefix (str): Prefix to list.
+            since (Checkpoint | datetime | dict): Checkpoint to compare
+                with; see `Checkpoint.coerce`.
+            fetch (callable, optional): Called with the iterator of changed
+                keys; what it returns is iterated instead, such as the
+                keys' values. Defaults to None, for the keys themselves.
+        """
+        self.prefix = prefix
+        self.since = Checkpoint.coerce(since)
+        self.deleted = None
+        self.checkpoint = None
+        self._list_objects = list_objects
+        self._fetch = fetch
+
+    def __iter__(self):
+        keys = self._changed_keys()
+        if self._fetch is None:
+            return keys
+        return iter(self._fetch(keys))
+
+    def _changed_keys(self):
+        since = self.since
+        # Anything written from now on is dated after this, clocks allowing.
+        modified = _now() - CLOCK_SKEW
+        if since.modified is not None and since.modified > modified:
+            modified = since.modified
+        boundary = {}
+        etags = None
+        if since.etags is not None:
+            # Keys of the manifest outside the prefix are carried over.
+            etags = {
+                key: etag
+                for key, etag in since.etags.items()
+                if not key.startswith(self.prefix)
+            }
+        for entry in self._list_objects(self.prefix):
+            key = entry["Key"]
+            if entry["LastModified"] >= modified:
+                boundary[key] = entry["ETag"]
+            if etags is not None:
+                etags[key] = entry["ETag"]
+            if since.changed(entry):
+                yield key
+        if etags is None:
+            self.deleted = []
+        else:
+            self.deleted = sorted(key for key in since.etags if key not in etags)
+        self.checkpoint = Checkpoint(modified, boundary, etags)
+
+
+def _now():
+    return datetime.now(timezone.utc)
@@ -0,0 +1,179 @@
+import os
+import threading
+
+# boto3 and botocore.config are imported on first use: importing them and
+# building a session takes a few hundred milliseconds, which would otherwise
+# be paid by every process that imports s3_dict.
+_lock = threading.Lock()
+_sessions = {}
+_idle = {}
+# Per session: a lock creating its clients one at a time, since
+# Session.client is not thread-safe.
+_creating = {}
+# Per pool: the class of its clients, to look up methods without a lease.
+_classes = {}
+
+
+def get_session(region_name=None, access_key=None, secret_key=None):
+    """
+    Return the process-wide boto3 session for a region and credentials.
+
+    Sessions are created once and reused, since resolving credentials and
+    loading the service models is the slow part of creating a client.
+
+    Args:
+        region_name (str, optional): AWS region. Defaults to None.
+        access_key (str, optional): AWS access key. Defaults to None, for
+            the default credential chain.
+        secret_key (str, optional): AWS secret key. Defaults to None.
+
+    Returns:
+        boto3.session.Session: The shared session.
+    """
+    key = (region_name, access_key, secret_key)
+    with _lock:
+        return _get_session(key)
+
+
+def _get_session(key):
+    session = _sessions.get(key)
+    if session is None:
+        import boto3.session
+
+        region_name, access_key, secret_key = key
+        session = _sessions[key] = boto3.session.Session(
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region_name,
+        )
+    return session
+
+
+def clear():
+    """
+    Drop every cached session and client.
+    """
+    with _lock:
+        _sessions.clear()
+        _idle.clear()
+        _creating.clear()
+        _classes.clear()
+
+
+def _after_fork():
+    # A forked child must not reuse its parent's connections, and the locks
+    # may have been held by a thread that does not exist in the child.
+    global _lock
+    _lock = threading.Lock()
+    _sessions.clear()
+    _idle.clear()
+    _creating.clear()
+    _classes.clear()
+
+
+class SharedClient:
+    """
+    A lazily created boto3 S3 client, shared process-wide.
+
+    Nothing is imported or created until the first request. Each request
+    then leases a low-level client from a process-wide pool keyed by the
+    credentials, region, endpoint and connection pool size, and gives it
+    back when the call returns, so no two threads use a client at the same
+    time and idle clients are reused by every SharedClient with the same
+    settings. All clients of a pool are created from one session, which
+    makes every client after the first cheap.
+    """
+
+    def __init__(
+        self,
+        region_name=None,
+        access_key=None,
+        secret_key=None,
+        endpoint_url=None,
+        max_pool_connections=10,
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            region_name (str, optional): AWS region. Defaults to None.
+            access_key (str, optional): AWS access key. Defaults to None.
+            secret_key (str, optional): AWS secret key. Defaults to None.
+            endpoint_url (str, optional): URL of an S3-compatible service.
+                Defaults to None, for AWS.
+            max_pool_connections (int, optional): Connections kept by each
+                leased client. Defaults to 10.
+        """
+        self._key = (
+            region_name,
+            access_key,
+            secret_key,
+            endpoint_url,
+            max_pool_connections,
+        )
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if not callable(getattr(self._client_class(), name, None)):
+            # Instance attributes and properties, such as meta.
+            client = self._lease()
+            try:
+                return getattr(client, name)
+            finally:
+                self._release(client)
+
+        def call(*args, **kwargs):
+            client = self._lease()
+            try:
+                return getattr(client, name)(*args, **kwargs)
+            finally:
+                self._release(client)
+
+        return call
+
+    def _client_class(self):
+        cls = _classes.get(self._key)
+        if cls is None:
+            self._release(self._lease())
+            cls = _classes[self._key]
+        return cls
+
+    def _lease(self):
+        with _lock:
+            idle = _idle.get(self._key)
+            if idle:
+                return idle.pop()
+        # Created without the lock, which would hold up every other lease
+        # for as long as a client takes to create.
+        client = self._create()
+        with _lock:
+            _classes.setdefault(self._key, type(client))
+        return client
+
+    def _release(self, client):
+        with _lock:
+            _idle.setdefault(self._key, []).append(client)
+
+    def _create(self):
+        from botocore.config import Config
+
+        region_name, access_key, secret_key, endpoint_url, connections = self._key
+        session_key = (region_name, access_key, secret_key)
+        with _lock:
+            session = _get_session(session_key)
+            creating = _creating.setdefault(session_key, threading.Lock())
+        with creating:
+            return session.client(
+                "s3",
+                endpoint_url=endpoint_url,
+                # Retries are left to RetryingTransport rather than stacked
+                # on botocore's.
+                config=Config(
+                    max_pool_connections=connections,
+                    retries={"total_max_attempts": 1},
+                ),
+            )
+
+
+os.register_at_fork(after_in_child=_after_fork)
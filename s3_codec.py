@@ -0,0 +1,509 @@
+import io
+import threading
+import time
+import zlib
+
+# User metadata key (x-amz-meta-codec) naming the codec an object is stored with.
+CODEC_METADATA = "codec"
+CHUNK_SIZE = 1024 * 1024
+
+
+class GzipCodec:
+    """
+    gzip compression with zlib, always available.
+    """
+
+    name = "gzip"
+
+    def __init__(self, level=6):
+        """
+        Initialize the codec.
+
+        Args:
+            level (int, optional): Compression level, 1 to 9. Defaults to 6.
+        """
+        self.level = level
+
+    def compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 31)
+
+    def decoder(self, stream):
+        return _PushDecoder(stream, _ZlibDecompressor(zlib.decompressobj(31)))
+
+
+class ZstdCodec:
+    """
+    Zstandard compression; needs the `zstandard` package.
+    """
+
+    name = "zstd"
+
+    def __init__(self, level=3):
+        """
+        Initialize the codec.
+
+        Args:
+            level (int, optional): Compression level, 1 to 22. Defaults to 3.
+
+        Raises:
+            ImportError: If `zstandard` is not installed.
+        """
+        import zstandard
+
+        self.level = level
+        self._zstd = zstandard
+
+    def compressor(self):
+        return self._zstd.ZstdCompressor(level=self.level).compressobj()
+
+    def decoder(self, stream):
+        return _ZstdDecoder(stream, self._zstd)
+
+
+class Lz4Codec:
+    """
+    LZ4 frame compression; needs the `lz4` package.
+    """
+
+    name = "lz4"
+
+    def __init__(self, level=0):
+        """
+        Initialize the codec.
+
+        Args:
+            level (int, optional): Compression level, 0 (fast) to 16.
+                Defaults to 0.
+
+        Raises:
+            ImportError: If `lz4` is not installed.
+        """
+        import lz4.frame
+
+        self.level = level
+        self._frame = lz4.frame
+
+    def compressor(self):
+        return _Lz4Compressor(self._frame.LZ4FrameCompressor(self.level))
+
+    def decoder(self, stream):
+        return _PushDecoder(
+            stream, _Lz4Decompressor(self._frame.LZ4FrameDecompressor())
+        )
+
+
+CODECS = {"gzip": GzipCodec, "zstd": ZstdCodec, "lz4": Lz4Codec}
+
+
+def get_codec(codec):
+    """
+    Resolve a codec name to a codec with its default settings.
+
+    Args:
+        codec (str | object): Name in CODECS, or a codec instance, which is
+            returned as is.
+
+    Returns:
+        object: The codec.
+
+    Raises:
+        ValueError: If the name is unknown.
+        ImportError: If the codec's package is not installed.
+    """
+    if not isinstance(codec, str):
+        return codec
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}, expected one of {list(CODECS)}")
+    return CODECS[codec]()
+
+
+def available_codecs():
+    """
+    List the codecs whose packages are installed.
+
+    Returns:
+        list: Names of the usable codecs.
+    """
+    names = []
+    for name, codec in CODECS.items():
+        try:
+            codec()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+class CodecStats:
+    """
+    Thread-safe per-codec counters of bytes and CPU time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codecs = {}
+
+    def record(self, name, direction, raw, encoded, cpu_seconds):
+        """
+        Add one compressed or decompressed object to the counters.
+
+        Args:
+            name (str): Name of the codec.
+            direction (str): 'encode' or 'decode'.
+            raw (int): Uncompressed size in bytes.
+            encoded (int): Compressed size in bytes.
+            cpu_seconds (float): CPU time spent in the codec.
+        """
+        with self._lock:
+            counts = self._codecs.setdefault(
+                name,
+                {
+                    "encoded_objects": 0,
+                    "encoded_raw_bytes": 0,
+                    "encoded_bytes": 0,
+                    "encode_cpu_seconds": 0.0,
+                    "decoded_objects": 0,
+                    "decoded_raw_bytes": 0,
+                    "decoded_bytes": 0,
+                    "decode_cpu_seconds": 0.0,
+                },
+            )
+            counts[f"{direction}d_objects"] += 1
+            counts[f"{direction}d_raw_bytes"] += raw
+            counts[f"{direction}d_bytes"] += encoded
+            counts[f"{direction}_cpu_seconds"] += cpu_seconds
+
+    def snapshot(self):
+        """
+        Return a copy of the counters.
+
+        Returns:
+            dict: For each codec used, the objects, uncompressed and
+                compressed bytes and CPU seconds in each direction, and the
+                compression ratio of the uploads.
+        """
+        with self._lock:
+            codecs = {name: dict(counts) for name, counts in self._codecs.items()}
+        for counts in codecs.values():
+            encoded = counts["encoded_bytes"]
+            counts["ratio"] = counts["encoded_raw_bytes"] / encoded if encoded else None
+        return codecs
+
+
+class EncodingReader(io.RawIOBase):
+    """
+    A readable stream of the compressed content of another stream.
+
+    The source is read and compressed a chunk at a time, so values of any
+    size are compressed in constant memory.
+    """
+
+    def __init__(self, stream, codec, head=b"", stats=None):
+        """
+        Initialize the reader.
+
+        Args:
+            stream (file-like): Readable file object with the raw content.
+            codec (object): Codec to compress with.
+            head (bytes, optional): Raw data already read from the start of
+                `stream`. Defaults to b''.
+            stats (CodecStats, optional): Counters updated once the stream
+                is exhausted. Defaults to None.
+        """
+        self._stream = stream
+        self._codec = codec
+        self._compressor = codec.compressor()
+        self._head = head
+        self._stats = stats
+        self._pending = memoryview(b"")
+        self._raw = self._encoded = 0
+        self._cpu = 0.0
+        self._done = False
+
+    @property
+    def raw_bytes(self):
+        """
+        int: Uncompressed bytes read from the source so far.
+        """
+        return self._raw
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            self._fill()
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _fill(self):
+        if self._head:
+            chunk, self._head = self._head, b""
+        else:
+            chunk = self._stream.read(CHUNK_SIZE)
+        start = time.thread_time()
+        if chunk:
+            self._raw += len(chunk)
+            out = self._compressor.compress(chunk)
+        else:
+            out = self._compressor.flush()
+            self._done = True
+        self._cpu += time.thread_time() - start
+        self._encoded += len(out)
+        self._pending = memoryview(out)
+        if self._done and self._stats is not None:
+            self._stats.record(
+                self._codec.name, "encode", self._raw, self._encoded, self._cpu
+            )
+
+
+class DecodingReader(io.RawIOBase):
+    """
+    A readable stream of the decompressed content of a compressed stream.
+
+    The source is read and decompressed a chunk at a time, so objects of
+    any size are decompressed in constant memory.
+    """
+
+    def __init__(self, stream, codec, stats=None):
+        """
+        Initialize the reader.
+
+        Args:
+            stream (file-like): Readable file object with compressed content.
+            codec (object): Codec the content was compressed with.
+            stats (CodecStats, optional): Counters updated once the stream
+                is exhausted. Defaults to None.
+        """
+        self._source = _CountingReader(stream)
+        self._codec = codec
+        self._decoder = codec.decoder(self._source)
+        self._stats = stats
+        self._pending = memoryview(b"")
+        self._raw = 0
+        self._cpu = 0.0
+        self._done = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            self._fill()
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+    def _fill(self):
+        # Output is bounded by CHUNK_SIZE, so a small chunk of a highly
+        # compressed object is expanded over several reads.
+        start, read_cpu = time.thread_time(), self._source.cpu
+        out = self._decoder.read(CHUNK_SIZE)
+        self._cpu += time.thread_time() - start - (self._source.cpu - read_cpu)
+        self._raw += len(out)
+        self._pending = memoryview(out)
+        self._done = not out
+        if self._done and self._stats is not None:
+            self._stats.record(
+                self._codec.name, "decode", self._raw, self._source.bytes, self._cpu
+            )
+
+
+class _CountingReader:
+    # Counts the bytes read from a stream and the CPU time spent reading
+    # them, which is not the codec's.
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes = 0
+        self.cpu = 0.0
+
+    def read(self, size=-1):
+        start = time.thread_time()
+        data = self._stream.read(size)
+        self.cpu += time.thread_time() - start
+        self.bytes += len(data)
+        return data
+
+
+class _PushDecoder:
+    # Decoders read at most `size` decompressed bytes at a time, b"" at the
+    # end, and raise EOFError if the stream ends inside a frame. This one
+    # feeds the stream a chunk at a time to a decompressor whose
+    # decompress() returns at most max_length bytes, and whose needs_input
+    # tells whether more can be returned without more input.
+    def __init__(self, stream, decompressor):
+        self._stream = stream
+        self._decompressor = decompressor
+
+    def read(self, size):
+        while True:
+            chunk = b""
+            if self._decompressor.needs_input:
+                chunk = self._stream.read(CHUNK_SIZE)
+                if not chunk:
+                    out = self._decompressor.flush()
+                    if not self._decompressor.eof:
+                        raise _truncated()
+                    return out
+            out = self._decompressor.decompress(chunk, size)
+            if out:
+                return out
+
+
+class _ZlibDecompressor:
+    # Decompressors share this interface: decompress() returns at most
+    # max_length bytes, and needs_input tells whether more can be returned
+    # without more input.
+    def __init__(self, decompressor):
+        self._decompressor = decompressor
+
+    @property
+    def needs_input(self):
+        return not self._decompressor.unconsumed_tail
+
+    @property
+    def eof(self):
+        return self._decompressor.eof
+
+    def decompress(self, data, max_length):
+        data = self._decompressor.unconsumed_tail + data
+        return self._decompressor.decompress(data, max_length)
+
+    def flush(self):
+        return self._decompressor.flush()
+
+
+class _Lz4Decompressor:
+    # LZ4FrameDecompressor bounds its output itself but has no flush().
+    def __init__(self, decompressor):
+        self._decompressor = decompressor
+
+    @property
+    def needs_input(self):
+        return self._decompressor.needs_input
+
+    @property
+    def eof(self):
+        return self._decompressor.eof
+
+    def decompress(self, data, max_length):
+        return self._decompressor.decompress(data, max_length)
+
+    def flush(self):
+        return b""
+
+
+class _ZstdDecoder:
+    # zstandard's stream reader bounds its output, but ends quietly on a
+    # truncated stream, so the frames are followed on the way in.
+    def __init__(self, stream, zstandard):
+        self._frames = _ZstdFrames(stream)
+        self._reader = zstandard.ZstdDecompressor().stream_reader(
+            self._frames, read_size=CHUNK_SIZE, read_across_frames=True
+        )
+
+    def read(self, size):
+        out = self._reader.read(size)
+        if not out and not self._frames.complete:
+            raise _truncated()
+        return out
+
+
+class _ZstdFrames:
+    # Follows the frame and block headers of a zstd stream as it is read,
+    # without decompressing it, to tell whether it ends between frames.
+    # See RFC 8878, section 3.1.
+    def __init__(self, stream):
+        self._stream = stream
+        self._state = "magic"
+        self._header = bytearray()
+        self._skip = 0
+        self._checksum = False
+
+    @property
+    def complete(self):
+        return self._state == "magic" and not self._header and not self._skip
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        view = memoryview(data)
+        position = 0
+        while position < len(data) and self._state != "unknown":
+            if self._skip:
+                n = min(self._skip, len(data) - position)
+                self._skip -= n
+                position += n
+                continue
+            n = min(self._needed() - len(self._header), len(data) - position)
+            self._header += view[position : position + n]
+            position += n
+            if len(self._header) == self._needed():
+                self._parse(bytes(self._header))
+                self._header.clear()
+        return data
+
+    def _needed(self):
+        if self._state == "descriptor":
+            return 1
+        if self._state == "header":
+            return self._header_size
+        if self._state == "block":
+            return 3
+        # Magic numbers, checksums and skippable frame sizes.
+        return 4
+
+    def _parse(self, header):
+        value = int.from_bytes(header, "little")
+        if self._state == "magic":
+            if value == 0xFD2FB528:
+                self._state = "descriptor"
+            elif value & 0xFFFFFFF0 == 0x184D2A50:
+                self._state = "skippable"
+            else:
+                # Not zstd; the decompressor raises.
+                self._state = "unknown"
+        elif self._state == "descriptor":
+            single_segment = value >> 5 & 1
+            self._checksum = bool(value >> 2 & 1)
+            self._header_size = (
+                (0 if single_segment else 1)
+                + (0, 1, 2, 4)[value & 3]
+                + (single_segment, 2, 4, 8)[value >> 6]
+            )
+            self._state = "header" if self._header_size else "block"
+        elif self._state == "header":
+            self._state = "block"
+        elif self._state == "block":
+            # Run-length blocks hold a single byte whatever their size.
+            self._skip = 1 if value >> 1 & 3 == 1 else value >> 3
+            if value & 1:
+                self._state = "checksum" if self._checksum else "magic"
+        elif self._state == "skippable":
+            self._skip = value
+            self._state = "magic"
+        else:
+            self._state = "magic"
+
+
+def _truncated():
+    return EOFError(
+        "Compressed stream ended before the end-of-stream marker was reached"
+    )
+
+
+class _Lz4Compressor:
+    # Writes the LZ4 frame header before the first block.
+    def __init__(self, compressor):
+        self._compressor = compressor
+        self._header = compressor.begin()
+
+    def compress(self, data):
+        out, self._header = self._header + self._compressor.compress(data), b""
+        return out
+
+    def flush(self):
+        out, self._header = self._header + self._compressor.flush(), b""
+        return out
@@ -1,12 +1,42 @@
-import boto3
-from botocore.exceptions import NoCredentialsError
-from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError, NoCredentialsError
+from logic.s3_changes import ChangeListing
+from logic.s3_clients import SharedClient
+from logic.s3_codec import (
+    CODEC_METADATA,
+    CodecStats,
+    DecodingReader,
+    EncodingReader,
+    get_codec,
+)
+from logic.s3_index import KeyIndex
+from logic.s3_listing import ParallelListing
+from logic.s3_metrics import InstrumentedTransport
+from logic.s3_pack import PackedS3Dict
+from logic.s3_retry import AdaptiveConcurrency, RetryingTransport, RetryPolicy
+from logic.s3_sync import HASH_CACHE_NAME
+from logic.s3_sync import sync as sync_directory
+from logic.s3_stream import DEFAULT_BUFFER_SIZE, RangeReader
+from logic.s3_write_buffer import WriteBehindBuffer
+from io import BufferedReader, BytesIO
+from collections import deque, namedtuple
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
 
-import urllib3
-import hashlib
-import hmac
-import base64
+import mmap
+import multiprocessing
+import os
+import tempfile
+
+_SENTINEL = object()
+_DELETE_BATCH_SIZE = 1000
+_MIN_PART_SIZE = 5 * 1024 * 1024
+_SHARED_MEMORY_THRESHOLD = 256 * 1024
 
 
 class S3Dict:
@@ -14,7 +44,27 @@ class S3Dict:
     A class for accessing an S3 bucket with a dict-like interface.
     """
 
-    def __init__(self, bucket_name, region_name, access_key=None, secret_key=None):
+    def __init__(
+        self,
+        bucket_name,
+        region_name,
+        access_key=None,
+        secret_key=None,
+        max_workers=10,
+        multipart_threshold=8 * 1024 * 1024,
+        part_size=8 * 1024 * 1024,
+        cache=None,
+        disk_cache=None,
+        transport=None,
+        write_behind=False,
+        write_buffer_bytes=64 * 1024 * 1024,
+        metrics=None,
+        retry_policy=None,
+        adaptive_concurrency=False,
+        codec=None,
+        compress_min_size=1024,
+        endpoint_url=None,
+    ):
         """
         Initialize the S3Dict object with the bucket name, region, and optional access/secret keys.
 
@@ -23,102 +73,626 @@ class S3Dict:
             region_name (str): Region of the S3 bucket.
             access_key (str, optional): AWS access key. Defaults to None.
             secret_key (str, optional): AWS secret key. Defaults to None.
+            max_workers (int, optional): Default number of concurrent requests
+                used by the bulk operations. Defaults to 10.
+            multipart_threshold (int, optional): Values of at least this many
+                bytes are uploaded with a multipart upload. Defaults to 8 MiB.
+            part_size (int, optional): Size of each multipart upload part;
+                at least 5 MiB. Defaults to 8 MiB.
+            cache (MemoryCache, optional): Read-through cache used by get.
+                Defaults to None, which disables caching.
+            disk_cache (DiskCache, optional): Persistent cache used by get,
+                behind `cache` if both are set. Defaults to None.
+            transport (object, optional): Client every request is sent
+                through: a boto3 S3 client, a Urllib3Transport or a
+                MemoryTransport. Defaults to None, for a SharedClient: boto3
+                clients created on first use from the region and keys and
+                shared by every S3Dict of the process.
+            write_behind (bool, optional): Make `d[key] = value` return once
+                the value is buffered and upload it in the background; see
+                `flush`. Defaults to False.
+            write_buffer_bytes (int, optional): Maximum size of the values
+                buffered in write-behind mode; writes block beyond it.
+                Defaults to 64 MiB.
+            metrics (Metrics, optional): Records the latency, bytes, errors
+                and retries of every request; see `stats`. Defaults to None,
+                which leaves the client uninstrumented.
+            retry_policy (RetryPolicy, optional): How throttled, transient
+                and connection failures are retried. Defaults to None, for
+                a RetryPolicy with its default settings.
+            adaptive_concurrency (bool, optional): Run every request under
+                an AdaptiveConcurrency limit of at most max_workers, which
+                backs off when S3 throttles and recovers while requests
+                succeed; see `concurrency`. Defaults to False.
+            codec (str | object, optional): Codec values are compressed with
+                on upload: 'gzip', 'zstd' or 'lz4' (see s3_codec), or a codec
+                instance. The codec is recorded in the object's metadata, and
+                compressed objects are decompressed on read whatever this is
+                set to. Defaults to None, which stores values as they are.
+            compress_min_size (int, optional): Values smaller than this many
+                bytes are stored uncompressed. Defaults to 1024.
+            endpoint_url (str, optional): URL of an S3-compatible service
+                the default client connects to. Defaults to None, for AWS.
         """
         self.bucket_name = bucket_name
         self.region_name = region_name
         self.access_key = access_key
         self.secret_key = secret_key
-        self.s3 = boto3.resource(
-            "s3",
-            region_name=self.region_name,
-            aws_access_key_id=self.access_key,
-            aws_secret_access_key=self.secret_key,
+        self.max_workers = max_workers
+        self.multipart_threshold = multipart_threshold
+        self.part_size = max(part_size, _MIN_PART_SIZE)
+        self.cache = cache
+        self.disk_cache = disk_cache
+        self.index = None
+        self.client = transport or SharedClient(
+            self.region_name,
+            self.access_key,
+            self.secret_key,
+            endpoint_url,
+            max_pool_connections=max_workers,
+        )
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.concurrency = (
+            AdaptiveConcurrency(max_workers) if adaptive_concurrency else None
+        )
+        self.client = RetryingTransport(
+            self.client, self.retry_policy, self.concurrency
         )
+        self.metrics = metrics
+        self.codec = get_codec(codec) if codec is not None else None
+        self.compress_min_size = compress_min_size
+        self._codec_stats = CodecStats()
+        if metrics is not None:
+            self.client = InstrumentedTransport(self.client, metrics)
+        self.write_buffer = (
+            WriteBehindBuffer(
+                lambda key, data: self._put(key, BytesIO(data)),
+                write_buffer_bytes,
+                max_workers,
+            )
+            if write_behind
+            else None
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Flush buffered writes and stop the write-behind workers.
+
+        Later writes are uploaded directly. Does nothing unless write-behind
+        mode is enabled. Leaving a `with` block on the S3Dict closes it.
+
+        Raises:
+            WriteBehindError: If buffered writes failed since the last flush;
+                its `errors` maps each key to its exception.
+        """
+        write_buffer, self.write_buffer = self.write_buffer, None
+        if write_buffer is not None:
+            write_buffer.close()
+
+    def flush(self):
+        """
+        Wait until every buffered write is stored in the bucket.
+
+        Does nothing unless write-behind mode is enabled.
+
+        Raises:
+            WriteBehindError: If buffered writes failed since the last flush;
+                its `errors` maps each key to its exception.
+        """
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
 
     def get(self, key):
         """
         Get an object from the S3 bucket using the provided key.
 
+        When a disk cache is configured, objects served from it are returned
+        as a RangeReader over a memory map of the cached file instead of a
+        BytesIO copy.
+
         Args:
             key (str): Key of the object to retrieve.
 
         Returns:
-            BytesIO: BytesIO object representing the retrieved object.
+            BytesIO | RangeReader: Readable file object with the content of
+                the object, a RangeReader when served from the disk cache.
         """
+        data = self._get_data(key)
+        if isinstance(data, memoryview):
+            return RangeReader(
+                lambda start, end: bytes(data[start : end + 1]), len(data)
+            )
+        return BytesIO(data)
+
+    def get_buffer(self, key):
+        """
+        Get an object's body as a read-only buffer.
+
+        With a disk cache configured, the buffer is a zero-copy view of the
+        memory-mapped cache file.
+
+        Args:
+            key (str): Key of the object to retrieve.
+
+        Returns:
+            memoryview: Read-only view of the object's body.
+        """
+        return memoryview(self._get_data(key)).toreadonly()
+
+    def _get_data(self, key):
+        """
+        Get an object's body, going through the configured caches.
+
+        Args:
+            key (str): Key of the object to retrieve.
+
+        Returns:
+            bytes | memoryview: Body of the object.
+        """
+        if self.write_buffer is not None:
+            data = self.write_buffer.get(key)
+            if data is not None:
+                return data
         try:
-            obj = self.s3.Object(self.bucket_name, key)
-            return BytesIO(obj.get()["Body"].read())
+            if self.cache is None and self.disk_cache is None:
+                return self._body(self._get_object(key)).read()
+            return self._get_cached(key)
         except NoCredentialsError:
             raise Exception("No AWS credentials found.")
-        
-    def get_urllib(self, key):
-        # Create the HTTP connection pool
-        http = urllib3.PoolManager()
-
-        # Generate the S3 request URL
-        endpoint = f'https://{self.bucket_name}.s3.amazonaws.com/{key}'
-        # endpoint = 'https://smartexaibucket.s3.eu-west-1.amazonaws.com/Hemp+Industry'
-
-        # Generate the signature for the request
-        http_method = 'GET'
-        content_md5 = ''
-        content_type = ''
-        date = ''
-        canonicalized_amz_headers = ''
-        canonicalized_resource = f'/{self.bucket_name}/{key}'
-
-        string_to_sign = f'{http_method}\n{content_md5}\n{content_type}\n{date}\n{canonicalized_amz_headers}{canonicalized_resource}'
-
-        signature = base64.b64encode(
-            hmac.new(self.secret_key.encode('utf-8'), string_to_sign.encode('utf-8'), hashlib.sha1).digest()
-        ).decode('utf-8')
-
-        # Create the headers with the AWS access keys and signature
-        headers = {
-            'Host': f'{self.bucket_name}.s3.amazonaws.com',
-            'Date': date,
-            'Authorization': f'AWS {self.access_key}:{signature}'
-        }
 
-        # Send the request
-        response = http.request(http_method, endpoint, headers=headers)
+    def _get_cached(self, key):
+        """
+        Get an object's body through the memory and disk caches.
+
+        Fresh entries are served locally, the memory cache first. Stale
+        entries are revalidated with If-None-Match, so an unchanged object
+        costs a 304 and no body.
+
+        Args:
+            key (str): Key of the object to retrieve.
+
+        Returns:
+            bytes | memoryview: Body of the object.
+        """
+        entry = disk_entry = None
+        if self.cache is not None:
+            entry = self.cache.lookup(key)
+            if entry is not None and entry.fresh:
+                return entry.data
+        if self.disk_cache is not None:
+            disk_entry = self.disk_cache.lookup(self.bucket_name, key)
+            if disk_entry is not None and disk_entry.fresh:
+                return self._promote(key, disk_entry)
+        cached = entry or disk_entry
+        try:
+            if cached is None:
+                response = self._get_object(key)
+            else:
+                response = self._get_object(key, IfNoneMatch=cached.etag)
+        except ClientError as error:
+            if cached is not None and error.response["Error"]["Code"] in (
+                "304",
+                "NotModified",
+            ):
+                if cached is entry:
+                    self.cache.revalidated(key)
+                    return entry.data
+                self.disk_cache.revalidated(disk_entry)
+                return self._promote(key, disk_entry)
+            raise
+        body, etag = self._body(response), response["ETag"]
+        if self.cache is None:
+            return self.disk_cache.store(self.bucket_name, key, etag, body)
+        data = body.read()
+        self.cache.store(key, data, etag)
+        if self.disk_cache is not None:
+            self.disk_cache.store(self.bucket_name, key, etag, BytesIO(data))
+        return data
+
+    def _get_object(self, key, **kwargs):
+        """
+        Send a GetObject request.
+
+        Args:
+            key (str): Key of the object.
+            **kwargs: Extra GetObject arguments, such as Range or IfMatch.
+
+        Returns:
+            dict: The GetObject response.
+        """
+        return self.client.get_object(Bucket=self.bucket_name, Key=key, **kwargs)
 
-        # Get the response data
-        response_data = response.data.decode('utf-8')
+    def _body(self, response):
+        """
+        Get the body of a GetObject response, decompressed if it was stored
+        with a codec.
 
-        # Print the response
-        print(response_data)
+        Args:
+            response (dict): The GetObject response.
 
-    def put_urllib(self, key, value):
-        # Create a PoolManager instance
-        http = urllib3.PoolManager()
+        Returns:
+            file-like: Readable body.
+        """
+        name = response.get("Metadata", {}).get(CODEC_METADATA)
+        if name is None:
+            return response["Body"]
+        codec = self.codec if getattr(self.codec, "name", None) == name else None
+        return DecodingReader(
+            response["Body"], codec or get_codec(name), self._codec_stats
+        )
 
-        # Define the URL and file path
-        # Generate the S3 request URL
-        endpoint = f'https://{self.bucket_name}.s3.amazonaws.com/{key}'
-        
-        # Make the PUT request
-        response = http.request('PUT', endpoint, body=value)
+    def _head_object(self, key):
+        """
+        Send a HeadObject request.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            dict: The HeadObject response.
+        """
+        try:
+            return self.client.head_object(Bucket=self.bucket_name, Key=key)
+        except NoCredentialsError:
+            raise Exception("No AWS credentials found.")
+
+    def _promote(self, key, disk_entry):
+        """
+        Copy a disk cache entry into the memory cache, if there is one.
 
-        # Get the response status code
-        status_code = response.status
+        Args:
+            key (str): Key of the object.
+            disk_entry (DiskEntry): Entry found in the disk cache.
+
+        Returns:
+            bytes | memoryview: Body of the object.
+        """
+        if self.cache is None:
+            return disk_entry.data
+        data = bytes(disk_entry.data)
+        self.cache.store(key, data, disk_entry.etag)
+        return data
+
+    def _invalidate(self, key):
+        """
+        Drop a key from the memory and disk caches.
+
+        Args:
+            key (str): Key of the object.
+        """
+        if self.cache is not None:
+            self.cache.invalidate(key)
+        if self.disk_cache is not None:
+            self.disk_cache.invalidate(self.bucket_name, key)
+
+    def stream(self, key):
+        """
+        Stream an object's body from a single GET, bypassing the caches.
+
+        Unlike `open`, nothing is requested before the body, and the body
+        is read once from start to end.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            file-like: Readable body, decompressed if the object was stored
+                with a codec.
+        """
+        try:
+            return self._body(self._get_object(key))
+        except NoCredentialsError:
+            raise Exception("No AWS credentials found.")
+
+    def open(self, key, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Open an object as a seekable read-only file without downloading it.
 
-        # Print the response status code
-        print(f'Status code: {status_code}')
+        Data is fetched with ranged GETs as it is read, so memory use stays
+        constant regardless of the object size. Every range is requested with
+        the ETag seen when the object was opened, so a concurrent overwrite
+        fails the read instead of mixing two versions.
+
+        Compressed objects cannot be read by range; they are streamed from
+        a single GET through the decompressor instead, without seeking.
+
+        Args:
+            key (str): Key of the object to open.
+            buffer_size (int, optional): Size of the read-ahead buffer.
+                Defaults to DEFAULT_BUFFER_SIZE.
+
+        Returns:
+            RangeReader: File object supporting read, readinto, seek and
+                iter_chunks, or a BufferedReader for compressed objects.
+        """
+        head = self._head_object(key)
+        etag = head["ETag"]
+        if CODEC_METADATA in head.get("Metadata", {}):
+            response = self._get_object(key, IfMatch=etag)
+            return BufferedReader(self._body(response), buffer_size)
+
+        def fetch(start, end):
+            response = self._get_object(key, Range=f"bytes={start}-{end}", IfMatch=etag)
+            return response["Body"].read()
+
+        return RangeReader(fetch, head["ContentLength"], buffer_size, etag)
+
+    get_stream = open
+
+    def download(self, key, dest=None, part_size=None, workers=None):
+        """
+        Download an object with concurrent ranged GETs.
+
+        Each part is written straight to its offset in the destination, with
+        no intermediate copies or concatenation. Every part is checked against
+        the object's size and ETag, so an object overwritten mid-download is
+        reported instead of producing a mix of two versions.
+
+        Args:
+            key (str): Key of the object to download.
+            dest (str | os.PathLike | bytearray | memoryview, optional): File
+                path to write through a memory map, or a writable buffer at
+                least as large as the object. Defaults to None, which
+                allocates a new bytearray.
+            part_size (int, optional): Size of each ranged GET. Defaults to
+                the instance's part_size.
+            workers (int, optional): Number of concurrent GETs. Defaults to
+                the instance's max_workers.
+
+        Returns:
+            bytearray | str | os.PathLike | memoryview: The destination holding the object.
+        """
+        part_size = part_size or self.part_size
+        workers = workers or self.max_workers
+        head = self._head_object(key)
+        size, etag = head["ContentLength"], head["ETag"]
+        if CODEC_METADATA in head.get("Metadata", {}):
+            return self._download_decoded(key, dest, etag)
+
+        if isinstance(dest, (str, os.PathLike)):
+
+            def write(f):
+                f.truncate(size)
+                if size:
+                    with mmap.mmap(f.fileno(), size) as mapped:
+                        # The view is released before the map is closed.
+                        with memoryview(mapped) as view:
+                            self._download_parts(
+                                key, view, size, etag, part_size, workers
+                            )
+                        mapped.flush()
+
+            _write_file(dest, write)
+            return dest
+
+        result = bytearray(size) if dest is None else dest
+        target = memoryview(result).cast("B")
+        if len(target) < size:
+            raise ValueError(
+                f"Destination holds {len(target)} bytes, object has {size}"
+            )
+        self._download_parts(key, target, size, etag, part_size, workers)
+        return result
+
+    def _download_decoded(self, key, dest, etag):
+        """
+        Download a compressed object, decompressing it as it streams in.
+
+        Its uncompressed size is only known at the end, so a file or
+        buffer destination is written sequentially rather than by range.
+
+        Args:
+            key (str): Key of the object to download.
+            dest (str | os.PathLike | bytearray | memoryview | None): As for
+                `download`.
+            etag (str): Expected ETag of the object.
+
+        Returns:
+            bytearray | str | os.PathLike | memoryview: The destination holding the object.
+        """
+        body = self._body(self._get_object(key, IfMatch=etag))
+        if isinstance(dest, (str, os.PathLike)):
+
+            def write(f):
+                while chunk := body.read(1024 * 1024):
+                    f.write(chunk)
+
+            _write_file(dest, write)
+            return dest
+        if dest is None:
+            return bytearray(body.read())
+        target = memoryview(dest).cast("B")
+        filled = 0
+        while chunk := body.read(1024 * 1024):
+            if filled + len(chunk) > len(target):
+                raise ValueError(
+                    f"Destination holds {len(target)} bytes, object is larger"
+                )
+            target[filled : filled + len(chunk)] = chunk
+            filled += len(chunk)
+        return dest
+
+    def _download_parts(self, key, target, size, etag, part_size, workers):
+        """
+        Fill `target` with the object's bytes using concurrent ranged GETs.
+
+        Args:
+            key (str): Key of the object to download.
+            target (memoryview): Writable byte view of at least `size` bytes.
+            size (int): Expected size of the object.
+            etag (str): Expected ETag of the object.
+            part_size (int): Size of each ranged GET.
+            workers (int): Number of concurrent GETs.
+        """
+
+        def fetch(start):
+            end = min(start + part_size, size) - 1
+            response = self._get_object(key, Range=f"bytes={start}-{end}", IfMatch=etag)
+            content_range = response.get("ContentRange", "")
+            if (
+                response["ETag"] != etag
+                or response["ContentLength"] != end - start + 1
+                or not content_range.endswith(f"/{size}")
+            ):
+                raise Exception(f"Object {key} changed during download")
+            body = response["Body"]
+            filled = 0
+            with target[start : end + 1] as view:
+                while filled < len(view):
+                    chunk = body.read(min(len(view) - filled, 1024 * 1024))
+                    if not chunk:
+                        raise Exception(
+                            f"Object {key} ended before byte {start + filled}"
+                        )
+                    view[filled : filled + len(chunk)] = chunk
+                    filled += len(chunk)
+
+        # Running parts are waited for on failure, so none is still writing
+        # to `target` once this returns.
+        try:
+            for _ in _prefetch(
+                fetch,
+                range(0, size, part_size),
+                workers,
+                2 * workers,
+                ordered=False,
+                wait_on_exit=True,
+            ):
+                pass
+        except NoCredentialsError:
+            raise Exception("No AWS credentials found.")
+
+    def put_raw(self, key, value):
+        """
+        Put an object as is, without compressing it with the codec.
+
+        Its size and ETag are then those of the value itself, as computed
+        from a local file.
+
+        Args:
+            key (str): Key of the object to put.
+            value (file-like): Readable file object with the content.
+        """
+        self._discard_buffered(key)
+        self._put(key, value, compress=False)
 
     def put(self, key, value):
         """
         Put a new object in the S3 bucket.
 
+        Values of at least `multipart_threshold` bytes are sent as a multipart
+        upload with parts uploaded concurrently, so they are never buffered
+        in memory as a whole.
+
         Args:
             key (str): Key of the object to put.
-            value (BytesIO): BytesIO object representing the content of the object.
+            value (BytesIO): BytesIO object, or any readable file object,
+                representing the content of the object.
+        """
+        self._discard_buffered(key)
+        self._put(key, value)
+
+    def _put(self, key, value, compress=True):
+        """
+        Upload a value, bypassing the write buffer.
+
+        Values of at least `compress_min_size` bytes are compressed as they
+        are read when a codec is set.
+
+        Args:
+            key (str): Key of the object to put.
+            value (file-like): Readable file object with the content.
+            compress (bool, optional): Apply the codec, if any. Defaults to
+                True; False stores the value as is, so its ETag and size
+                are those of the content.
         """
+        head = _read_up_to(value, self.multipart_threshold)
+        extra = {}
+        encoder = None
+        if compress and self.codec is not None and len(head) >= self.compress_min_size:
+            value = encoder = EncodingReader(value, self.codec, head, self._codec_stats)
+            head = _read_up_to(value, self.multipart_threshold)
+            extra["Metadata"] = {CODEC_METADATA: self.codec.name}
         try:
-            self.put_urllib(key, value)
-            self.s3.Object(self.bucket_name, key).put(Body=value)
+            if len(head) >= self.multipart_threshold:
+                etag, size = self._multipart_upload(key, head, value, extra)
+            else:
+                etag = self.client.put_object(
+                    Bucket=self.bucket_name, Key=key, Body=head, **extra
+                )["ETag"]
+                size = len(head)
         except NoCredentialsError:
             raise Exception("No AWS credentials found.")
+        finally:
+            self._invalidate(key)
+        if self.index is not None:
+            # The index keeps the stored size, like listings, and the
+            # uncompressed size beside it.
+            raw_size = encoder.raw_bytes if encoder is not None else None
+            self.index.add(key, size, etag, raw_size=raw_size)
+
+    def _multipart_upload(self, key, head, stream, extra=None):
+        """
+        Upload a large value as a multipart upload.
+
+        Parts are read from `stream` on demand and at most 2 * max_workers of
+        them are held in memory. A failed part is retried on its own under
+        the retry policy; if it keeps failing the whole upload is aborted.
+
+        Args:
+            key (str): Key of the object to put.
+            head (bytes): Data already read from the start of the value.
+            stream (file-like): Readable file object holding the rest of the value.
+            extra (dict, optional): Extra CreateMultipartUpload arguments,
+                such as Metadata. Defaults to None.
+
+        Returns:
+            tuple: ETag and size in bytes of the uploaded object.
+        """
+        client = self.client
+        upload_id = client.create_multipart_upload(
+            Bucket=self.bucket_name, Key=key, **(extra or {})
+        )["UploadId"]
+
+        def upload_part(part):
+            number, data = part
+            return client.upload_part(
+                Bucket=self.bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=data,
+            )["ETag"]
+
+        try:
+            parts = []
+            size = 0
+            for (number, data), etag in _prefetch(
+                upload_part,
+                _iter_parts(head, stream, self.part_size),
+                self.max_workers,
+                2 * self.max_workers,
+            ):
+                parts.append({"PartNumber": number, "ETag": etag})
+                size += len(data)
+            response = client.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except BaseException:
+            client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=key, UploadId=upload_id
+            )
+            raise
+        return response["ETag"], size
 
     def pop(self, key):
         """
@@ -131,10 +705,15 @@ class S3Dict:
             BytesIO: BytesIO object representing the removed object.
         """
         obj = self.get(key)
+        self._discard_buffered(key)
         try:
-            self.s3.Object(self.bucket_name, key).delete()
+            self.client.delete_object(Bucket=self.bucket_name, Key=key)
         except NoCredentialsError:
             raise Exception("No AWS credentials found.")
+        finally:
+            self._invalidate(key)
+        if self.index is not None:
+            self.index.discard(key)
         return obj
 
     def __getitem__(self, key):
@@ -153,67 +732,800 @@ class S3Dict:
         """
         Put a new object in the S3 bucket.
 
+        In write-behind mode the value is read into the write buffer and
+        uploaded in the background. A later write to the same key before the
+        upload starts replaces it, so only the latest value is uploaded.
+
         Args:
             key (str): Key of the object to put.
             value (BytesIO): BytesIO object representing the content of the object.
         """
-        self.put(key, value)
+        if self.write_buffer is None:
+            self.put(key, value)
+        else:
+            self.write_buffer.add(key, value.read())
 
     def __delitem__(self, key):
         """
         Remove an object from the S3 bucket.
 
+        The object is checked with a HEAD request rather than downloaded.
+
         Args:
             key (str): Key of the object to remove.
+
+        Raises:
+            KeyError: If the object does not exist.
+        """
+        if not self._discard_buffered(key):
+            try:
+                self._head_object(key)
+            except ClientError as error:
+                if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                    raise KeyError(key) from error
+                raise
+        try:
+            self.client.delete_object(Bucket=self.bucket_name, Key=key)
+        finally:
+            self._invalidate(key)
+        if self.index is not None:
+            self.index.discard(key)
+
+    def _discard_buffered(self, key):
+        """
+        Cancel a buffered write of a key before writing or deleting it directly.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            bool: True if a buffered write was pending or in progress.
+        """
+        if self.write_buffer is None or self.write_buffer.get(key) is None:
+            return False
+        self.write_buffer.discard(key)
+        return True
+
+    def delete_many(self, keys, max_workers=None):
+        """
+        Delete many objects with batched DeleteObjects requests.
+
+        Keys are sent in batches of up to 1000, and batches run concurrently.
+        A failure never stops the other batches; it is reported per key.
+
+        Args:
+            keys (iterable): Keys of the objects to delete; consumed lazily.
+            max_workers (int, optional): Number of concurrent batches.
+                Defaults to the instance's max_workers.
+
+        Returns:
+            DeleteResult: Keys deleted and a mapping of failed keys to errors.
         """
-        self.pop(key)
+        max_workers = max_workers or self.max_workers
+
+        def delete_batch(batch):
+            for key in batch:
+                self._discard_buffered(key)
+            try:
+                response = self.client.delete_objects(
+                    Bucket=self.bucket_name,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except NoCredentialsError:
+                raise Exception("No AWS credentials found.")
+            except Exception as error:
+                return {key: str(error) for key in batch}
+            return {
+                error["Key"]: f"{error['Code']}: {error['Message']}"
+                for error in response.get("Errors", [])
+            }
+
+        result = DeleteResult([], {})
+        batches = _batched(keys, _DELETE_BATCH_SIZE)
+        for batch, errors in _prefetch(
+            delete_batch, batches, max_workers, 2 * max_workers, ordered=False
+        ):
+            result.errors.update(errors)
+            result.deleted.extend(key for key in batch if key not in errors)
+            for key in batch:
+                self._invalidate(key)
+                if self.index is not None and key not in errors:
+                    self.index.discard(key)
+        return result
+
+    def clear(self, prefix=""):
+        """
+        Delete every object under a prefix.
+
+        Args:
+            prefix (str, optional): Prefix of the keys to delete. Defaults to '',
+                which empties the bucket.
+
+        Returns:
+            DeleteResult: Keys deleted and a mapping of failed keys to errors.
+        """
+        # Buffered writes are not listed yet, so store them first.
+        self.flush()
+        return self.delete_many(self.keys(prefix))
 
     def __contains__(self, key):
         """
         Check if an object exists in the S3 bucket.
 
+        Answered from the write buffer or the key index when they know
+        the key.
+
         Args:
             key (str): Key of the object to check.
 
         Returns:
             bool: True if the object exists, False otherwise.
+
+        Raises:
+            ClientError: If the HEAD request fails for any reason other than
+                a missing object, once retries are exhausted.
         """
+        if self.write_buffer is not None and self.write_buffer.get(key) is not None:
+            return True
+        index = self._usable_index(key)
+        if index is not None:
+            return key in index
         try:
-            self.s3.Object(self.bucket_name, key).load()
+            self._head_object(key)
             return True
-        except NoCredentialsError:
-            raise Exception("No AWS credentials found.")
-        except Exception:
-            return False
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
 
-    def keys(self, prefix=""):
+    def keys(self, prefix="", since=None):
         """
         Generate the keys from the S3 bucket with an optional prefix filter.
 
+        With `since`, only the keys new or changed since that checkpoint
+        are listed, judged from the listing metadata alone; the returned
+        ChangeListing then also reports deleted keys and the checkpoint to
+        store for the next run once it is exhausted.
+
         Args:
             prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+            since (Checkpoint | datetime | dict, optional): Checkpoint of a
+                previous run, a LastModified time to list the keys modified
+                from, or a manifest mapping keys to ETags. Defaults to
+                None, for every key.
+
+        Returns:
+            iterator | ChangeListing: Keys from the S3 bucket.
+        """
+        if since is not None:
+            return ChangeListing(self.list_objects, prefix, since)
+        return self._keys(prefix)
+
+    def _keys(self, prefix):
+        """
+        Generate the keys under a prefix, from the key index when it covers it.
+
+        Args:
+            prefix (str): Prefix to filter the keys.
 
         Yields:
             str: Key from the S3 bucket.
         """
+        index = self._usable_index(prefix)
+        if index is not None:
+            yield from index.keys(prefix)
+            return
+        for entry in self.list_objects(prefix):
+            yield entry["Key"]
+
+    def parallel_keys(
+        self, prefix="", shards=16, boundaries=None, ordered=True, max_workers=None
+    ):
+        """
+        List the keys under a prefix as concurrently paginated shards.
+
+        Shards are the key ranges between `boundaries` if given, otherwise
+        the common prefixes under `prefix`, or failing that `shards` ranges
+        split on the character after the prefix. The returned listing's
+        `requests` attribute counts the ListObjectsV2 calls made.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+            shards (int, optional): Number of shards when splitting by
+                character. Defaults to 16.
+            boundaries (list, optional): Keys to split the key space at.
+                Defaults to None.
+            ordered (bool, optional): Yield keys in listing order if True,
+                otherwise as they arrive. Defaults to True.
+            max_workers (int, optional): Number of shards listed at once.
+                Defaults to the instance's max_workers.
+
+        Returns:
+            ParallelListing: Iterable of keys.
+        """
+        return ParallelListing(
+            self.client,
+            self.bucket_name,
+            prefix,
+            shards=shards,
+            boundaries=boundaries,
+            ordered=ordered,
+            max_workers=max_workers or self.max_workers,
+        )
+
+    def packed(self, prefix="packed/", shard_size=8 * 1024 * 1024):
+        """
+        Open a packed store of small values under a prefix of the bucket.
+
+        Values are batched into shard objects with an index of their
+        offsets, so a write costs a fraction of a PUT and a read is one
+        ranged GET; see PackedS3Dict.
+
+        Args:
+            prefix (str, optional): Prefix of the shard and index objects.
+                Defaults to 'packed/'.
+            shard_size (int, optional): Pending bytes that trigger a flush.
+                Defaults to 8 MiB.
+
+        Returns:
+            PackedS3Dict: Dict-like store sharing this S3Dict's client.
+        """
+        return PackedS3Dict(self, prefix, shard_size)
+
+    def sync(
+        self,
+        local_dir,
+        prefix="",
+        direction="upload",
+        compare="etag",
+        delete=False,
+        dry_run=False,
+        max_workers=None,
+        hash_cache=HASH_CACHE_NAME,
+    ):
+        """
+        Mirror a local directory to a prefix of the bucket, or the reverse.
+
+        Only files that are new or differ by size and ETag, or by size and
+        modification time, are transferred, concurrently and streamed from
+        and to disk; see s3_sync.sync.
+
+        Args:
+            local_dir (str | os.PathLike): Local directory.
+            prefix (str, optional): Prefix the directory maps to.
+                Defaults to ''.
+            direction (str, optional): 'upload' or 'download'.
+                Defaults to 'upload'.
+            compare (str, optional): 'etag' or 'mtime'. Defaults to 'etag'.
+            delete (bool, optional): Remove the destination's extra files or
+                objects. Defaults to False.
+            dry_run (bool, optional): Only report what would change.
+                Defaults to False.
+            max_workers (int, optional): Number of concurrent transfers.
+                Defaults to the instance's max_workers.
+            hash_cache (str | os.PathLike, optional): File caching the local
+                files' ETags, relative to `local_dir`; None disables it.
+                Defaults to '.s3_sync_cache.json'.
+
+        Returns:
+            SyncResult: Paths transferred and deleted, the count left
+                unchanged, the bytes transferred and the failures.
+        """
+        return sync_directory(
+            self,
+            local_dir,
+            prefix,
+            direction,
+            compare,
+            delete,
+            dry_run,
+            max_workers,
+            hash_cache,
+        )
+
+    def __len__(self):
+        """
+        Count the objects in the bucket.
+
+        Answered from the key index when it covers the whole bucket,
+        otherwise by listing the bucket.
+
+        Returns:
+            int: Number of objects.
+        """
+        index = self._usable_index("")
+        if index is not None:
+            return len(index)
+        return sum(1 for _ in self.list_objects())
+
+    def metadata(self, key):
+        """
+        Get the size, ETag and modification time of an object.
+
+        Answered from the key index when one covers the key, otherwise with
+        a HEAD request.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            dict: Size, ETag and LastModified of the object. Size is the
+                stored size, compressed for objects stored with a codec;
+                the index adds RawSize, the size `get` returns, for values
+                it saw compressed by this S3Dict.
+
+        Raises:
+            KeyError: If the object does not exist.
+        """
+        index = self._usable_index(key)
+        if index is not None:
+            meta = index.metadata(key)
+            if meta is None:
+                raise KeyError(key)
+            return meta
+        try:
+            head = self._head_object(key)
+        except ClientError as error:
+            if error.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                raise KeyError(key) from error
+            raise
+        return {
+            "Size": head["ContentLength"],
+            "ETag": head["ETag"],
+            "LastModified": head["LastModified"],
+        }
+
+    def build_index(self, prefix="", max_staleness=300):
+        """
+        Build a local key index from one listing of a prefix.
+
+        Once built, `__contains__`, `__len__`, `keys` and `metadata` are
+        answered locally for keys under the prefix. This instance's own puts
+        and deletes are written through; changes made elsewhere become
+        visible on `refresh_index`, or at the latest when the index is
+        older than `max_staleness` and is rebuilt on the next lookup.
+
+        Args:
+            prefix (str, optional): Prefix to index. Defaults to ''.
+            max_staleness (float, optional): Maximum age of the index in
+                seconds before it is rebuilt. Defaults to 300.
+
+        Returns:
+            KeyIndex: The new index.
+        """
+        index = KeyIndex(prefix, max_staleness)
+        index.load(self.list_objects(prefix))
+        self.index = index
+        return index
+
+    def refresh_index(self):
+        """
+        Add the keys listed after the last listed key to the index.
+
+        This is a cheap incremental refresh for prefixes whose new keys sort
+        last, such as time-stamped keys. Other changes need `build_index`.
+        Keys this instance wrote through to the index do not move the
+        listing position, so keys other writers created before them are
+        still picked up.
+
+        Raises:
+            ValueError: If no index was built.
+        """
+        index = self.index
+        if index is None:
+            raise ValueError("No key index to refresh; call build_index first")
+        index.extend(self.list_objects(index.prefix, start_after=index.last_listed))
+
+    def _usable_index(self, key):
+        """
+        Return the key index if it covers `key`, rebuilding it when stale.
+
+        Args:
+            key (str): Key or prefix about to be looked up.
+
+        Returns:
+            KeyIndex: The index, or None if there is none or it does not cover the key.
+        """
+        index = self.index
+        if index is None or not index.covers(key):
+            return None
+        if index.is_stale():
+            index.load(self.list_objects(index.prefix))
+        return index
+
+    def list_objects(self, prefix="", start_after=""):
+        """
+        Generate listing entries with their metadata using ListObjectsV2.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+            start_after (str, optional): Only list keys after this one.
+                Defaults to ''.
+
+        Yields:
+            dict: Entry with Key, Size, ETag and LastModified.
+        """
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
         try:
-            bucket = self.s3.Bucket(self.bucket_name)
-            for obj in bucket.objects.filter(Prefix=prefix):
-                yield obj.key
+            while True:
+                page = self.client.list_objects_v2(**kwargs)
+                yield from page.get("Contents", [])
+                if not page.get("IsTruncated"):
+                    return
+                kwargs.pop("StartAfter", None)
+                kwargs["ContinuationToken"] = page["NextContinuationToken"]
         except NoCredentialsError:
             raise Exception("No AWS credentials found.")
 
-    def items(self, prefix=""):
+    def pool_stats(self):
+        """
+        Report connection reuse of the transport, when it tracks it.
+
+        Returns:
+            dict: Counts of connections opened, reused and dropped; empty
+                for transports that keep no statistics.
+        """
+        pool_stats = getattr(self.client, "pool_stats", None)
+        return pool_stats() if pool_stats is not None else {}
+
+    def codec_stats(self):
+        """
+        Report the bytes and CPU time of compression and decompression.
+
+        Returns:
+            dict: Per-codec counters from `CodecStats.snapshot`.
+        """
+        return self._codec_stats.snapshot()
+
+    def stats(self):
+        """
+        Report the request metrics, when they are enabled.
+
+        Returns:
+            dict: Per-operation metrics from `Metrics.snapshot`; empty when
+                the S3Dict was created without metrics.
+        """
+        return self.metrics.snapshot() if self.metrics is not None else {}
+
+    def items(self, prefix="", ordered=True, window=None, max_workers=None, since=None):
         """
         Generate tuples of key-value pairs from the S3 bucket with an optional prefix filter.
 
+        Objects are fetched concurrently while the keys are listed. At most
+        `window` gets are in flight or buffered at any time, so memory use is
+        bounded by the window and not by the number of keys under the prefix.
+        With `since`, only the objects new or changed since that checkpoint
+        are fetched, as for `keys`.
+
         Args:
             prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+            ordered (bool, optional): Yield pairs in listing order if True,
+                otherwise as soon as each get completes. Defaults to True.
+            window (int, optional): Maximum number of gets in flight.
+                Defaults to twice the number of workers.
+            max_workers (int, optional): Number of worker threads.
+                Defaults to the instance's max_workers.
+            since (Checkpoint | datetime | dict, optional): Checkpoint of a
+                previous run, a LastModified time to list the keys modified
+                from, or a manifest mapping keys to ETags. Defaults to
+                None, for every object.
+
+        Returns:
+            iterator | ChangeListing: Key-value pairs from the S3 bucket;
+                a ChangeListing with the deleted keys and next checkpoint
+                when `since` is given.
+        """
+        max_workers = max_workers or self.max_workers
+        window = window or 2 * max_workers
+
+        def fetch(keys):
+            return _prefetch(self.get, keys, max_workers, window, ordered)
+
+        if since is not None:
+            return ChangeListing(self.list_objects, prefix, since, fetch)
+        return fetch(self.keys(prefix))
+
+    def items_map(
+        self,
+        fn,
+        prefix="",
+        io_workers=None,
+        cpu_workers=None,
+        ordered=True,
+        window=None,
+        shared_memory_threshold=_SHARED_MEMORY_THRESHOLD,
+    ):
+        """
+        Apply a CPU-bound function to every object under a prefix in a process pool.
+
+        Objects are fetched on I/O threads and each body is handed to `fn`
+        in a worker process as soon as it arrives, so parsing runs on every
+        core while the next objects download. Bodies of at least
+        `shared_memory_threshold` bytes reach the workers through shared
+        memory rather than being pickled down a pipe. At most `window`
+        objects are fetched or transformed but not yet yielded.
+
+        Args:
+            fn (callable): Picklable function, such as a module-level one,
+                called with the body as bytes; its result must be picklable.
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+            io_workers (int, optional): Number of fetching threads.
+                Defaults to the instance's max_workers.
+            cpu_workers (int, optional): Number of worker processes.
+                Defaults to the number of CPUs.
+            ordered (bool, optional): Yield results in listing order if
+                True, otherwise in the order the objects arrive.
+                Defaults to True.
+            window (int, optional): Maximum number of objects in flight.
+                Defaults to twice the number of worker processes.
+            shared_memory_threshold (int, optional): Size from which bodies
+                go through shared memory. Defaults to 256 KiB.
 
         Yields:
-            tuple: Key-value pair from the S3 bucket.
+            tuple: Key and fn(body).
         """
-        with ThreadPoolExecutor() as executor:
-            for key in self.keys(prefix):
-                future = executor.submit(self.get, key)
+        io_workers = io_workers or self.max_workers
+        cpu_workers = cpu_workers or os.cpu_count() or 1
+        window = window or 2 * cpu_workers
+        # Forking would copy the I/O threads' locks in whatever state they are.
+        methods = multiprocessing.get_all_start_methods()
+        processes = ProcessPoolExecutor(
+            max_workers=cpu_workers,
+            mp_context=multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            ),
+        )
+
+        def fetch(key):
+            return _submit_transform(
+                processes, fn, self._get_data(key), shared_memory_threshold
+            )
+
+        try:
+            if ordered:
+                for key, future in _prefetch(
+                    fetch, self.keys(prefix), io_workers, window
+                ):
+                    yield key, future.result()
+            else:
+                yield from _prefetch_transforms(
+                    fetch, self.keys(prefix), io_workers, window
+                )
+        finally:
+            processes.shutdown(wait=True, cancel_futures=True)
+
+
+DeleteResult = namedtuple("DeleteResult", ["deleted", "errors"])
+
+
+def _batched(iterable, size):
+    """
+    Split an iterable into tuples of at most `size` items.
+
+    Args:
+        iterable (iterable): Items to split; consumed lazily.
+        size (int): Maximum number of items per batch.
+
+    Yields:
+        tuple: Consecutive batches.
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield tuple(batch)
+            batch = []
+    if batch:
+        yield tuple(batch)
+
+
+def _iter_parts(head, stream, part_size):
+    """
+    Split `head` followed by the rest of `stream` into numbered parts.
+
+    Args:
+        head (bytes): Data already read from the stream.
+        stream (file-like): Readable file object with the remaining data.
+        part_size (int): Size of every part but the last.
+
+    Yields:
+        tuple: (part number starting at 1, bytes of the part).
+    """
+    number = 1
+    pending = head
+    while True:
+        if len(pending) < part_size:
+            pending += _read_up_to(stream, part_size - len(pending))
+        if not pending:
+            return
+        yield number, pending[:part_size]
+        pending = pending[part_size:]
+        number += 1
+
+
+def _read_up_to(stream, size):
+    """
+    Read from `stream` until `size` bytes are collected or it is exhausted.
+
+    Args:
+        stream (file-like): Readable file object.
+        size (int): Number of bytes wanted.
+
+    Returns:
+        bytes: At most `size` bytes; fewer only at the end of the stream.
+    """
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def _submit_transform(processes, fn, data, shared_memory_threshold):
+    """
+    Submit fn(data) to a process pool, through shared memory for large data.
+
+    Args:
+        processes (ProcessPoolExecutor): Pool to run fn in.
+        fn (callable): Picklable function called with the data as bytes.
+        data (bytes | memoryview): Data to transform.
+        shared_memory_threshold (int): Size from which data is passed
+            through shared memory.
+
+    Returns:
+        Future: Future of fn(data).
+    """
+    if len(data) < shared_memory_threshold:
+        return processes.submit(fn, bytes(data))
+    shm = SharedMemory(create=True, size=len(data))
+    try:
+        shm.buf[: len(data)] = data
+        future = processes.submit(_transform_shared, fn, shm.name, len(data))
+    except BaseException:
+        _release(shm)
+        raise
+    # Also runs when the future is cancelled.
+    future.add_done_callback(lambda _: _release(shm))
+    return future
+
+
+def _transform_shared(fn, name, size):
+    """
+    Run fn on data read from a shared memory block, in a worker process.
+
+    Args:
+        fn (callable): Function called with the data as bytes.
+        name (str): Name of the shared memory block.
+        size (int): Size of the data.
+
+    Returns:
+        object: fn(data).
+    """
+    try:
+        shm = SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching registers the block with the worker's
+        # resource tracker, which would unlink it again or warn at exit.
+        shm = SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+    try:
+        data = bytes(shm.buf[:size])
+    finally:
+        shm.close()
+    return fn(data)
+
+
+def _release(shm):
+    shm.close()
+    shm.unlink()
+
+
+def _write_file(dest, write):
+    """
+    Write a file through a temporary file that replaces it once complete.
+
+    Args:
+        dest (str | os.PathLike): Path of the file.
+        write (callable): Called with the temporary file, opened in 'wb+'.
+    """
+    directory = os.path.dirname(os.path.abspath(dest))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".download")
+    try:
+        with os.fdopen(fd, "wb+") as f:
+            write(f)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _prefetch(fn, keys, max_workers, window, ordered=True, wait_on_exit=False):
+    """
+    Apply `fn` to every key on a thread pool, keeping at most `window` calls in flight.
+
+    Args:
+        fn (callable): Function called with each key.
+        keys (iterable): Keys to process; consumed lazily.
+        max_workers (int): Number of worker threads.
+        window (int): Maximum number of submitted but not yet yielded calls.
+        ordered (bool, optional): Preserve the order of `keys`. Defaults to True.
+        wait_on_exit (bool, optional): When stopped early, wait for the calls
+            already running to finish. Defaults to False.
+
+    Yields:
+        tuple: (key, fn(key)) pairs.
+    """
+    keys = iter(keys)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = deque() if ordered else {}
+    try:
+        while True:
+            while len(pending) < window:
+                key = next(keys, _SENTINEL)
+                if key is _SENTINEL:
+                    break
+                future = executor.submit(fn, key)
+                if ordered:
+                    pending.append((key, future))
+                else:
+                    pending[future] = key
+            if not pending:
+                return
+            if ordered:
+                key, future = pending.popleft()
                 yield key, future.result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+    finally:
+        # Cancel whatever has not started yet if the consumer stops early.
+        executor.shutdown(wait=wait_on_exit, cancel_futures=True)
+
+
+def _prefetch_transforms(fn, keys, max_workers, window):
+    """
+    Apply `fn`, which returns a Future, to every key and yield the results as they finish.
+
+    Unlike an unordered `_prefetch`, a key waits for its own future only,
+    not for those of the keys submitted before it, and `window` bounds the
+    keys being submitted and awaited together.
+
+    Args:
+        fn (callable): Function called with each key, returning a Future.
+        keys (iterable): Keys to process; consumed lazily.
+        max_workers (int): Number of worker threads.
+        window (int): Maximum number of keys submitted but not yet yielded.
+
+    Yields:
+        tuple: (key, result of fn(key)) pairs.
+    """
+    keys = iter(keys)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    # Future -> (key, whether the future is the call of fn rather than the
+    # future it returned).
+    pending = {}
+    try:
+        while True:
+            while len(pending) < window:
+                key = next(keys, _SENTINEL)
+                if key is _SENTINEL:
+                    break
+                pending[executor.submit(fn, key)] = (key, True)
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, submitting = pending.pop(future)
+                if submitting:
+                    pending[future.result()] = (key, False)
+                else:
+                    yield key, future.result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,407 @@
+import threading
+import time
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, unquote, urlsplit
+from xml.etree import ElementTree
+
+from botocore.exceptions import ClientError
+
+from logic.s3_transport import MemoryTransport
+
+
+class FakeS3Server:
+    """
+    A local, S3-compatible HTTP server backed by a MemoryTransport.
+
+    Serves the object, listing, batch delete and multipart operations used
+    by both S3Dict implementations over keep-alive HTTP/1.1, path-style
+    (`http://host:port/bucket/key`). Signatures are accepted but not
+    checked. Every request can be delayed by `latency` seconds to stand in
+    for the round trip to S3, and requests beyond `max_in_flight` are
+    answered with 503 SlowDown, as S3 does under excessive request rates.
+    """
+
+    def __init__(
+        self, latency=0, host="127.0.0.1", port=0, transport=None, max_in_flight=None
+    ):
+        """
+        Initialize the server; it listens once started.
+
+        Args:
+            latency (float, optional): Seconds each request is delayed by.
+                Defaults to 0.
+            host (str, optional): Address to listen on. Defaults to 127.0.0.1.
+            port (int, optional): Port to listen on. Defaults to 0, which
+                picks a free port.
+            transport (MemoryTransport, optional): Store holding the objects.
+                Defaults to a new, empty one.
+            max_in_flight (int, optional): Number of requests served at once
+                before the rest are throttled. Defaults to None, for no limit.
+        """
+        self.latency = latency
+        self.host = host
+        self.port = port
+        self.transport = transport or MemoryTransport()
+        self.max_in_flight = max_in_flight
+        self.throttled = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def endpoint_url(self):
+        """
+        str: Base URL of the running server.
+        """
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Start serving requests on a background thread.
+
+        Returns:
+            FakeS3Server: The server itself.
+        """
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop the server and close its socket.
+        """
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._thread.join()
+            self._httpd = None
+
+    def _admit(self):
+        """
+        Count a request in, unless too many are already being served.
+
+        Returns:
+            bool: True if the request may be served; `_leave` must follow.
+        """
+        with self._lock:
+            if self.max_in_flight is not None and self._in_flight >= self.max_in_flight:
+                self.throttled += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def _leave(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, Nagle's
+    # algorithm and delayed ACKs add ~40ms to every small response.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        fake = self.server.fake
+        parts = urlsplit(self.path)
+        bucket, _, key = unquote(parts.path[1:]).partition("/")
+        query = dict(parse_qsl(parts.query, keep_blank_values=True))
+        body = self._read_body()
+        admitted = fake._admit()
+        try:
+            if not admitted:
+                raise ClientError(
+                    {
+                        "Error": {
+                            "Code": "SlowDown",
+                            "Message": "Reduce your request rate.",
+                        },
+                        "ResponseMetadata": {"HTTPStatusCode": 503},
+                    },
+                    method,
+                )
+            if fake.latency:
+                time.sleep(fake.latency)
+            status, headers, data = self._handle(
+                fake.transport, method, bucket, key, query, body
+            )
+        except ClientError as error:
+            status = error.response["ResponseMetadata"]["HTTPStatusCode"]
+            headers, data = {}, b""
+            if method != "HEAD" and status != 304:
+                headers = _XML
+                data = _element(
+                    "Error",
+                    Code=error.response["Error"]["Code"],
+                    Message=error.response["Error"]["Message"],
+                )
+        finally:
+            if admitted:
+                fake._leave()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if method != "HEAD" and status not in (204, 304):
+            self.wfile.write(data)
+
+    def _handle(self, store, method, bucket, key, query, body):
+        """
+        Run one request against the store.
+
+        Returns:
+            tuple: Status, response headers and response body.
+        """
+        if method == "GET" and not key:
+            return 200, _XML, _list_result(store, bucket, query)
+        if method in ("GET", "HEAD"):
+            kwargs = {
+                name: self.headers[header]
+                for name, header in (
+                    ("Range", "Range"),
+                    ("IfMatch", "If-Match"),
+                    ("IfNoneMatch", "If-None-Match"),
+                )
+                if self.headers[header] is not None
+            }
+            if method == "HEAD":
+                response = store.head_object(Bucket=bucket, Key=key)
+                return 200, _object_headers(response), b""
+            response = store.get_object(Bucket=bucket, Key=key, **kwargs)
+            data = response["Body"].read()
+            status = 206 if "ContentRange" in response else 200
+            return status, _object_headers(response), data
+        if method == "PUT" and not key:
+            return 200, {}, b""
+        if method == "PUT" and "uploadId" in query:
+            response = store.upload_part(
+                Bucket=bucket,
+                Key=key,
+                UploadId=query["uploadId"],
+                PartNumber=int(query["partNumber"]),
+                Body=body,
+            )
+            return 200, {"ETag": response["ETag"]}, b""
+        if method == "PUT":
+            response = store.put_object(
+                Bucket=bucket, Key=key, Body=body, Metadata=self._metadata()
+            )
+            return 200, {"ETag": response["ETag"]}, b""
+        if method == "POST" and "delete" in query:
+            keys = [
+                elem.text
+                for elem in ElementTree.fromstring(body).iter()
+                if _local(elem) == "Key"
+            ]
+            response = store.delete_objects(
+                Bucket=bucket, Delete={"Objects": [{"Key": k} for k in keys]}
+            )
+            root = ElementTree.Element("DeleteResult")
+            for error in response.get("Errors", []):
+                elem = ElementTree.SubElement(root, "Error")
+                for name in ("Key", "Code", "Message"):
+                    ElementTree.SubElement(elem, name).text = error[name]
+            return 200, _XML, ElementTree.tostring(root)
+        if method == "POST" and "uploads" in query:
+            response = store.create_multipart_upload(
+                Bucket=bucket, Key=key, Metadata=self._metadata()
+            )
+            return (
+                200,
+                _XML,
+                _element(
+                    "InitiateMultipartUploadResult",
+                    Bucket=bucket,
+                    Key=key,
+                    UploadId=response["UploadId"],
+                ),
+            )
+        if method == "POST" and "uploadId" in query:
+            parts = []
+            for elem in ElementTree.fromstring(body).iter():
+                if _local(elem) == "Part":
+                    fields = {_local(child): child.text for child in elem}
+                    parts.append(
+                        {
+                            "PartNumber": int(fields["PartNumber"]),
+                            "ETag": fields["ETag"],
+                        }
+                    )
+            response = store.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=query["uploadId"],
+                MultipartUpload={"Parts": parts},
+            )
+            return (
+                200,
+                _XML,
+                _element(
+                    "CompleteMultipartUploadResult",
+                    Bucket=bucket,
+                    Key=key,
+                    ETag=response["ETag"],
+                ),
+            )
+        if method == "DELETE" and "uploadId" in query:
+            store.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=query["uploadId"]
+            )
+            return 204, {}, b""
+        if method == "DELETE":
+            store.delete_object(Bucket=bucket, Key=key)
+            return 204, {}, b""
+        return 400, _XML, _element("Error", Code="BadRequest", Message=method)
+
+    def _metadata(self):
+        return {
+            name.lower()[len(_META_PREFIX) :]: value
+            for name, value in self.headers.items()
+            if name.lower().startswith(_META_PREFIX)
+        }
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            body = _read_chunks(self.rfile)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        streaming = self.headers.get("x-amz-content-sha256", "")
+        if "aws-chunked" in self.headers.get(
+            "Content-Encoding", ""
+        ) or streaming.startswith("STREAMING-"):
+            body = _decode_aws_chunked(body)
+        return body
+
+
+_XML = {"Content-Type": "application/xml"}
+_META_PREFIX = "x-amz-meta-"
+
+
+def _list_result(store, bucket, query):
+    kwargs = {"Bucket": bucket, "Prefix": query.get("prefix", "")}
+    for name, arg in (
+        ("delimiter", "Delimiter"),
+        ("start-after", "StartAfter"),
+        ("continuation-token", "ContinuationToken"),
+        ("max-keys", "MaxKeys"),
+    ):
+        if query.get(name):
+            kwargs[arg] = int(query[name]) if arg == "MaxKeys" else query[name]
+    page = store.list_objects_v2(**kwargs)
+    encode = quote if query.get("encoding-type") == "url" else (lambda text: text)
+    root = ElementTree.Element(
+        "ListBucketResult", xmlns="http://s3.amazonaws.com/doc/2006-03-01/"
+    )
+    for name, value in (
+        ("Name", bucket),
+        ("Prefix", encode(kwargs["Prefix"])),
+        ("KeyCount", str(page["KeyCount"])),
+        ("IsTruncated", str(page["IsTruncated"]).lower()),
+        ("NextContinuationToken", page.get("NextContinuationToken")),
+        ("EncodingType", query.get("encoding-type")),
+    ):
+        if value is not None:
+            ElementTree.SubElement(root, name).text = value
+    for obj in page.get("Contents", []):
+        elem = ElementTree.SubElement(root, "Contents")
+        ElementTree.SubElement(elem, "Key").text = encode(obj["Key"])
+        ElementTree.SubElement(elem, "LastModified").text = obj[
+            "LastModified"
+        ].strftime("%Y-%m-%dT%H:%M:%S.000Z")
+        ElementTree.SubElement(elem, "ETag").text = obj["ETag"]
+        ElementTree.SubElement(elem, "Size").text = str(obj["Size"])
+    for common_prefix in page.get("CommonPrefixes", []):
+        elem = ElementTree.SubElement(root, "CommonPrefixes")
+        ElementTree.SubElement(elem, "Prefix").text = encode(common_prefix["Prefix"])
+    return ElementTree.tostring(root)
+
+
+def _object_headers(response):
+    headers = {
+        "ETag": response["ETag"],
+        "Content-Length": str(response["ContentLength"]),
+        "Last-Modified": format_datetime(response["LastModified"], usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    if "ContentRange" in response:
+        headers["Content-Range"] = response["ContentRange"]
+    for name, value in response.get("Metadata", {}).items():
+        headers[_META_PREFIX + name] = value
+    return headers
+
+
+def _element(tag, **children):
+    root = ElementTree.Element(tag)
+    for name, text in children.items():
+        ElementTree.SubElement(root, name).text = text
+    return ElementTree.tostring(root)
+
+
+def _local(elem):
+    return elem.tag.rsplit("}", 1)[-1]
+
+
+def _read_chunks(rfile):
+    chunks = []
+    while True:
+        size = int(rfile.readline().split(b";")[0], 16)
+        if size == 0:
+            # Skip any trailers up to the blank line.
+            while rfile.readline() not in (b"\r\n", b"\n", b""):
+                pass
+            return b"".join(chunks)
+        chunks.append(rfile.read(size))
+        rfile.readline()
+
+
+def _decode_aws_chunked(body):
+    """
+    Strip the chunk headers and trailers of an aws-chunked body.
+
+    Args:
+        body (bytes): Encoded body.
+
+    Returns:
+        bytes: Decoded body.
+    """
+    chunks, pos = [], 0
+    while pos < len(body):
+        end = body.index(b"\r\n", pos)
+        size = int(body[pos:end].split(b";")[0], 16)
+        if size == 0:
+            break
+        chunks.append(body[end + 2 : end + 2 + size])
+        pos = end + 2 + size + 2
+    return b"".join(chunks)
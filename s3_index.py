@@ -0,0 +1,215 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+
+class KeyIndex:
+    """
+    A local, sorted index of the keys under a prefix with their metadata.
+
+    Keys are kept in one sorted list and sizes and modification times in
+    parallel typed arrays, so large listings stay compact. Membership and
+    metadata lookups are binary searches; `len` is constant time.
+    `last_listed` is the greatest key seen in a listing, where incremental
+    listings resume; keys added locally do not move it.
+
+    Sizes are the stored sizes that listings report, which for objects
+    stored with a codec are the compressed sizes. The uncompressed size is
+    known only for values compressed locally, and kept for those alone.
+    """
+
+    def __init__(self, prefix="", max_staleness=300):
+        """
+        Initialize an empty index.
+
+        Args:
+            prefix (str, optional): Prefix covered by the index. Defaults to ''.
+            max_staleness (float, optional): Seconds after which the index
+                must be rebuilt from a full listing. Defaults to 300.
+        """
+        self.prefix = prefix
+        self.max_staleness = max_staleness
+        self.refreshed_at = None
+        self.last_listed = ""
+        self._keys = []
+        self._etags = []
+        self._sizes = array("q")
+        self._mtimes = array("d")
+        self._raw_sizes = {}
+        self._lock = threading.RLock()
+
+    def load(self, entries):
+        """
+        Replace the index with the entries of a full listing.
+
+        Args:
+            entries (iterable): ListObjectsV2 entries with Key, Size, ETag and
+                LastModified, in listing order.
+        """
+        keys, etags, sizes, mtimes = [], [], array("q"), array("d")
+        for entry in entries:
+            keys.append(entry["Key"])
+            etags.append(entry["ETag"])
+            sizes.append(entry["Size"])
+            mtimes.append(entry["LastModified"].timestamp())
+        with self._lock:
+            self._keys, self._etags, self._sizes, self._mtimes = (
+                keys,
+                etags,
+                sizes,
+                mtimes,
+            )
+            self._raw_sizes = {}
+            self.last_listed = keys[-1] if keys else ""
+            self.refreshed_at = time.monotonic()
+
+    def extend(self, entries):
+        """
+        Merge the entries of an incremental listing into the index.
+
+        Args:
+            entries (iterable): ListObjectsV2 entries with Key, Size, ETag and
+                LastModified.
+        """
+        last_listed = self.last_listed
+        for entry in entries:
+            self.add(entry["Key"], entry["Size"], entry["ETag"], entry["LastModified"])
+            last_listed = max(last_listed, entry["Key"])
+        with self._lock:
+            self.last_listed = last_listed
+            self.refreshed_at = time.monotonic()
+
+    def add(self, key, size, etag, last_modified=None, raw_size=None):
+        """
+        Add or update one key.
+
+        Args:
+            key (str): Key of the object.
+            size (int): Stored size of the object in bytes.
+            etag (str): ETag of the object.
+            last_modified (datetime, optional): Modification time. Defaults
+                to now.
+            raw_size (int, optional): Uncompressed size of an object stored
+                with a codec. Defaults to None, for unknown or uncompressed.
+        """
+        mtime = (last_modified or datetime.now(timezone.utc)).timestamp()
+        with self._lock:
+            if raw_size is None:
+                self._raw_sizes.pop(key, None)
+            else:
+                self._raw_sizes[key] = raw_size
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                self._etags[i] = etag
+                self._sizes[i] = size
+                self._mtimes[i] = mtime
+                return
+            self._keys.insert(i, key)
+            self._etags.insert(i, etag)
+            self._sizes.insert(i, size)
+            self._mtimes.insert(i, mtime)
+
+    def discard(self, key):
+        """
+        Remove a key if it is indexed.
+
+        Args:
+            key (str): Key of the object.
+        """
+        with self._lock:
+            i = self._find(key)
+            if i is not None:
+                del self._keys[i]
+                del self._etags[i]
+                del self._sizes[i]
+                del self._mtimes[i]
+                self._raw_sizes.pop(key, None)
+
+    def metadata(self, key):
+        """
+        Return the indexed metadata of a key.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            dict: Size, ETag and LastModified, and RawSize when the
+                uncompressed size is known, or None if the key is not
+                indexed.
+        """
+        with self._lock:
+            i = self._find(key)
+            if i is None:
+                return None
+            meta = {
+                "Size": self._sizes[i],
+                "ETag": self._etags[i],
+                "LastModified": datetime.fromtimestamp(self._mtimes[i], timezone.utc),
+            }
+            if key in self._raw_sizes:
+                meta["RawSize"] = self._raw_sizes[key]
+            return meta
+
+    def keys(self, prefix=""):
+        """
+        Return the indexed keys starting with a prefix, in listing order.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+
+        Returns:
+            list: Matching keys.
+        """
+        with self._lock:
+            start = bisect_left(self._keys, prefix)
+            end = start
+            while end < len(self._keys) and self._keys[end].startswith(prefix):
+                end += 1
+            return self._keys[start:end]
+
+    @property
+    def last_key(self):
+        """
+        str: The greatest indexed key, or '' if the index is empty.
+        """
+        with self._lock:
+            return self._keys[-1] if self._keys else ""
+
+    def covers(self, key):
+        """
+        Check whether a key or prefix falls under the indexed prefix.
+
+        Args:
+            key (str): Key or prefix to check.
+
+        Returns:
+            bool: True if the index can answer for it.
+        """
+        return key.startswith(self.prefix)
+
+    def is_stale(self):
+        """
+        Check whether the index is older than its staleness bound.
+
+        Returns:
+            bool: True if it must be rebuilt before use.
+        """
+        return (
+            self.refreshed_at is None
+            or time.monotonic() - self.refreshed_at > self.max_staleness
+        )
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._find(key) is not None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _find(self, key):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return i
+        return None
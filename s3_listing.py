@@ -0,0 +1,236 @@
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import NoCredentialsError
+
+# Characters used to split a prefix's key space when it has no common
+# prefixes to shard on, in S3 (UTF-8 byte) order.
+_SPLIT_ALPHABET = "-.0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ_abcdefghijklmnopqrstuvwxyz"
+_DONE = object()
+# Entries requested by the discovery probe, S3's largest page.
+_PROBE_SIZE = 1000
+# Sorts after every key sharing a common prefix.
+_PAST_PREFIX = "\U0010ffff"
+
+
+class ParallelListing:
+    """
+    An iterable over the keys under a prefix, listed as concurrent shards.
+
+    The key space is split into disjoint shards, either at caller-supplied
+    boundaries, at the common prefixes found with a delimiter, or by the
+    next character after the prefix. Each shard is paginated on its own
+    thread. Common prefixes are discovered from a single page listed with
+    the delimiter; when the prefix has more entries than that page holds,
+    everything after it is listed as one more shard. After iteration,
+    `requests` holds the number of ListObjectsV2 calls made, including the
+    discovery call.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket_name,
+        prefix="",
+        shards=16,
+        boundaries=None,
+        delimiter="/",
+        ordered=True,
+        max_workers=10,
+        buffer_size=1000,
+    ):
+        """
+        Initialize the listing; nothing is requested until it is iterated.
+
+        Args:
+            client (botocore.client.S3): Low-level S3 client.
+            bucket_name (str): Name of the S3 bucket.
+            prefix (str, optional): Prefix to list. Defaults to ''.
+            shards (int, optional): Number of shards when splitting by
+                character. Defaults to 16.
+            boundaries (list, optional): Sorted keys to split the key space
+                at. Defaults to None, which discovers shards.
+            delimiter (str, optional): Delimiter used to discover common
+                prefixes. Defaults to '/'.
+            ordered (bool, optional): Yield keys in listing order if True,
+                otherwise as each shard produces them. Defaults to True.
+            max_workers (int, optional): Number of shards listed at once.
+                Defaults to 10.
+            buffer_size (int, optional): Keys buffered per shard in ordered
+                mode, or in total otherwise. Defaults to 1000.
+        """
+        self.client = client
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.shards = shards
+        self.boundaries = boundaries
+        self.delimiter = delimiter
+        self.ordered = ordered
+        self.max_workers = max_workers
+        self.buffer_size = buffer_size
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            yield from self._iter_keys()
+        except NoCredentialsError:
+            raise Exception("No AWS credentials found.")
+
+    def _iter_keys(self):
+        loose_keys = []
+        if self.boundaries is not None:
+            ranges = _ranges(self.prefix, self.boundaries)
+        else:
+            common_prefixes, loose_keys, rest_after = self._discover()
+            if len(common_prefixes) > 1:
+                ranges = [
+                    (common_prefix, "", None) for common_prefix in common_prefixes
+                ]
+                if rest_after is not None:
+                    ranges.append((self.prefix, rest_after, None))
+            else:
+                loose_keys = []
+                ranges = _ranges(self.prefix, _split_points(self.prefix, self.shards))
+
+        stop = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            if self.ordered:
+                queues = [queue.Queue(maxsize=self.buffer_size) for _ in ranges]
+                for shard, shard_queue in zip(ranges, queues):
+                    executor.submit(self._list_shard, shard, shard_queue, stop)
+                # Shards are disjoint and submitted in key order, so reading
+                # them one after the other keeps the listing order.
+                streams = (_drain(shard_queue) for shard_queue in queues)
+                merged = (key for stream in streams for key in stream)
+                yield from heapq.merge(loose_keys, merged)
+            else:
+                shared = queue.Queue(maxsize=self.buffer_size)
+                for shard in ranges:
+                    executor.submit(self._list_shard, shard, shared, stop)
+                yield from loose_keys
+                finished = 0
+                while finished < len(ranges):
+                    item = shared.get()
+                    if item is _DONE:
+                        finished += 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield item
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _discover(self):
+        """
+        List one page of the prefix with the delimiter.
+
+        Returns:
+            tuple: Common prefixes and keys directly under the prefix in the
+                page, at most _PROBE_SIZE of them together, and the key to
+                list the rest of the prefix after, or None if the page
+                holds everything.
+        """
+        page = self._list(
+            Bucket=self.bucket_name,
+            Prefix=self.prefix,
+            Delimiter=self.delimiter,
+            MaxKeys=_PROBE_SIZE,
+        )
+        common_prefixes = [p["Prefix"] for p in page.get("CommonPrefixes", [])]
+        keys = [obj["Key"] for obj in page.get("Contents", [])]
+        if not page.get("IsTruncated"):
+            return common_prefixes, keys, None
+        last = [common_prefix + _PAST_PREFIX for common_prefix in common_prefixes[-1:]]
+        return common_prefixes, keys, max(last + keys[-1:])
+
+    def _list_shard(self, shard, out, stop):
+        """
+        Paginate one shard, pushing its keys and then _DONE to `out`.
+
+        Args:
+            shard (tuple): Prefix, exclusive lower key ('' for none) and
+                inclusive upper key (None for none).
+            out (queue.Queue): Queue receiving the keys.
+            stop (threading.Event): Set when the consumer has gone away.
+        """
+        prefix, start_after, end = shard
+        kwargs = {"Bucket": self.bucket_name, "Prefix": prefix}
+        if start_after:
+            kwargs["StartAfter"] = start_after
+        try:
+            while True:
+                page = self._list(**kwargs)
+                for obj in page.get("Contents", []):
+                    if end is not None and obj["Key"] > end:
+                        _put(out, _DONE, stop)
+                        return
+                    if not _put(out, obj["Key"], stop):
+                        return
+                if not page.get("IsTruncated"):
+                    break
+                kwargs.pop("StartAfter", None)
+                kwargs["ContinuationToken"] = page["NextContinuationToken"]
+        except Exception as error:
+            _put(out, error, stop)
+        _put(out, _DONE, stop)
+
+    def _list(self, **kwargs):
+        with self._lock:
+            self.requests += 1
+        return self.client.list_objects_v2(**kwargs)
+
+
+def _ranges(prefix, boundaries):
+    """
+    Turn sorted boundaries into (prefix, after, up_to) shards covering everything.
+
+    Args:
+        prefix (str): Prefix shared by every shard.
+        boundaries (list): Sorted keys; each one closes a shard.
+
+    Returns:
+        list: Shards as (prefix, exclusive lower key, inclusive upper key).
+    """
+    bounds = [""] + sorted(set(boundaries)) + [None]
+    return [(prefix, lower, upper) for lower, upper in zip(bounds, bounds[1:])]
+
+
+def _split_points(prefix, shards):
+    """
+    Pick `shards - 1` boundaries spread over the character after the prefix.
+
+    Args:
+        prefix (str): Prefix being listed.
+        shards (int): Number of shards wanted.
+
+    Returns:
+        list: Sorted boundary keys.
+    """
+    shards = max(1, min(shards, len(_SPLIT_ALPHABET)))
+    step = len(_SPLIT_ALPHABET) / shards
+    return [prefix + _SPLIT_ALPHABET[int(i * step)] for i in range(1, shards)]
+
+
+def _drain(shard_queue):
+    while True:
+        item = shard_queue.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
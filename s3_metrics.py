@@ -0,0 +1,282 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+
+# Upper bounds, in seconds, of the latency histogram buckets; slower
+# requests fall in a final, unbounded bucket.
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+OperationEvent = namedtuple(
+    "OperationEvent",
+    [
+        "operation",
+        "method",
+        "seconds",
+        "bytes_in",
+        "bytes_out",
+        "error",
+        "retries",
+    ],
+)
+
+# Client method -> operation it is counted under.
+_OPERATIONS = {
+    "get_object": "get",
+    "head_object": "head",
+    "put_object": "put",
+    "create_multipart_upload": "put",
+    "upload_part": "put",
+    "complete_multipart_upload": "put",
+    "abort_multipart_upload": "put",
+    "list_objects_v2": "list",
+    "delete_object": "delete",
+    "delete_objects": "delete",
+}
+_NOT_FOUND = ("404", "NoSuchKey", "NotFound")
+_NOT_MODIFIED = ("304", "NotModified")
+
+
+class Metrics:
+    """
+    Thread-safe request metrics, kept per operation.
+
+    Each S3 request is counted under one of get, head, put, list or delete
+    with its latency histogram, bytes received and sent, errors, missing
+    keys, unchanged conditional GETs, retries and the number of requests
+    in flight. Callbacks receive an OperationEvent for every request, to
+    forward them to a metrics system.
+    """
+
+    def __init__(self, callbacks=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initialize empty metrics.
+
+        Args:
+            callbacks (iterable, optional): Functions called with an
+                OperationEvent after each request. Defaults to none.
+            buckets (tuple, optional): Ascending upper bounds, in seconds, of
+                the latency histogram buckets. Defaults to DEFAULT_BUCKETS.
+        """
+        self.callbacks = list(callbacks)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def add_callback(self, callback):
+        """
+        Register a function called with an OperationEvent after each request.
+
+        Args:
+            callback (callable): Function to call.
+        """
+        self.callbacks.append(callback)
+
+    def started(self, operation):
+        """
+        Count a request of an operation as in flight.
+
+        Args:
+            operation (str): Name of the operation.
+        """
+        with self._lock:
+            self._op(operation)["in_flight"] += 1
+
+    def finished(self, event):
+        """
+        Record a completed request and pass it to the callbacks.
+
+        Args:
+            event (OperationEvent): The request.
+        """
+        with self._lock:
+            op = self._op(event.operation)
+            op["in_flight"] -= 1
+            op["requests"] += 1
+            op["bytes_in"] += event.bytes_in
+            op["bytes_out"] += event.bytes_out
+            op["retries"] += event.retries
+            op["seconds"] += event.seconds
+            op["max_seconds"] = max(op["max_seconds"], event.seconds)
+            bucket = bisect.bisect_left(self.buckets, event.seconds)
+            op["histogram"][bucket] += 1
+            if event.error is not None:
+                code = _error_code(event.error)
+                if code in _NOT_FOUND:
+                    op["not_found"] += 1
+                elif code in _NOT_MODIFIED:
+                    op["not_modified"] += 1
+                else:
+                    op["errors"] += 1
+        for callback in self.callbacks:
+            callback(event)
+
+    def snapshot(self):
+        """
+        Return a copy of the metrics of every operation seen so far.
+
+        Returns:
+            dict: For each operation, its requests, errors, not_found,
+                not_modified, retries, bytes_in, bytes_out, in_flight,
+                total and maximum seconds, p50 and p99 latency estimates in
+                seconds (the upper bound of their histogram bucket) and the
+                histogram as [upper bound, count] pairs, the last bound
+                being None.
+        """
+        with self._lock:
+            ops = {
+                name: dict(op, histogram=list(op["histogram"]))
+                for name, op in self._ops.items()
+            }
+        bounds = list(self.buckets) + [None]
+        for op in ops.values():
+            counts = op["histogram"]
+            op["p50"] = self._percentile(counts, 0.5, op["max_seconds"])
+            op["p99"] = self._percentile(counts, 0.99, op["max_seconds"])
+            op["histogram"] = [list(pair) for pair in zip(bounds, counts)]
+        return ops
+
+    def reset(self):
+        """
+        Clear the counters, keeping the callbacks.
+        """
+        with self._lock:
+            self._ops = {}
+
+    def _op(self, operation):
+        op = self._ops.get(operation)
+        if op is None:
+            op = self._ops[operation] = {
+                "requests": 0,
+                "errors": 0,
+                "not_found": 0,
+                "not_modified": 0,
+                "retries": 0,
+                "bytes_in": 0,
+                "bytes_out": 0,
+                "in_flight": 0,
+                "seconds": 0.0,
+                "max_seconds": 0.0,
+                "histogram": [0] * (len(self.buckets) + 1),
+            }
+        return op
+
+    def _percentile(self, counts, fraction, max_seconds):
+        total = sum(counts)
+        if not total:
+            return None
+        seen = 0
+        for i, count in enumerate(counts):
+            seen += count
+            if seen >= fraction * total:
+                return self.buckets[i] if i < len(self.buckets) else max_seconds
+
+
+class InstrumentedTransport:
+    """
+    Wraps an S3 client and records every request it makes in a Metrics.
+
+    Latency is measured until the response headers arrive; the time spent
+    reading a streamed GET body is not included. Methods that are not S3
+    requests are passed through unchanged.
+    """
+
+    def __init__(self, client, metrics):
+        """
+        Initialize the wrapper.
+
+        Args:
+            client (object): A boto3 S3 client, Urllib3Transport or
+                MemoryTransport.
+            metrics (Metrics): Where the requests are recorded.
+        """
+        self.client = client
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        operation = _OPERATIONS.get(name)
+        if operation is None:
+            return attr
+
+        def call(**kwargs):
+            return self._call(operation, name, attr, kwargs)
+
+        return call
+
+    def _call(self, operation, method, fn, kwargs):
+        metrics = self.metrics
+        # Measured up front: the request consumes a streamed body.
+        bytes_out = _bytes_out(kwargs.get("Body"))
+        metrics.started(operation)
+        start = time.perf_counter()
+        response = error = None
+        try:
+            response = fn(**kwargs)
+            return response
+        except Exception as exc:
+            error = exc
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            result = response
+            if error is not None:
+                result = getattr(error, "response", None)
+            metrics.finished(
+                OperationEvent(
+                    operation,
+                    method,
+                    seconds,
+                    _bytes_in(method, response),
+                    bytes_out,
+                    error,
+                    _retries(result),
+                )
+            )
+
+
+def _bytes_in(method, response):
+    if method == "get_object" and response:
+        return response.get("ContentLength") or 0
+    return 0
+
+
+def _bytes_out(body):
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return len(body)
+    try:
+        pos = body.tell()
+        end = body.seek(0, 2)
+        body.seek(pos)
+        return end - pos
+    except (AttributeError, OSError, ValueError):
+        return 0
+
+
+def _retries(response):
+    if not isinstance(response, dict):
+        return 0
+    return response.get("ResponseMetadata", {}).get("RetryAttempts", 0)
+
+
+def _error_code(error):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
@@ -0,0 +1,452 @@
+import struct
+import threading
+import time
+import zlib
+from io import BytesIO
+
+_ENTRY = struct.Struct("<HQI")
+_TOMBSTONE = 0xFFFFFFFF
+_SEGMENT_MAGIC = b"S3PACK1\n"
+
+
+class PackedS3Dict:
+    """
+    A dict-like store packing many small values into shared shard objects.
+
+    Writes are batched in memory; each flush appends the batch to the
+    bucket as one shard object holding the values back to back, plus one
+    index segment mapping every key to its shard, offset and length.
+    Deletes are written as tombstones in the next segment. The merged
+    index is kept in memory, so `in`, `keys` and `len` need no requests and
+    a get is a single ranged GET.
+
+    Shards are never modified. `compact` rewrites the live values of
+    shards left sparse by overwrites and deletes into new shards and
+    removes the old ones. The store assumes a single writer at a time.
+    """
+
+    def __init__(self, s3_dict, prefix="packed/", shard_size=8 * 1024 * 1024):
+        """
+        Initialize the store; the index is loaded on first use.
+
+        Args:
+            s3_dict (S3Dict): Store whose bucket and client hold the shards.
+            prefix (str, optional): Prefix of the shard and index objects.
+                Defaults to 'packed/'.
+            shard_size (int, optional): Pending bytes that trigger a flush,
+                and the target size of compacted shards. Defaults to 8 MiB.
+        """
+        self.s3_dict = s3_dict
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self._lock = threading.RLock()
+        self._entries = None
+        self._shards = {}
+        self._segments = []
+        self._pending = {}
+        self._pending_size = 0
+        self._last_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def get(self, key):
+        """
+        Get a value with one ranged GET, or from the pending batch.
+
+        Args:
+            key (str): Key of the value.
+
+        Returns:
+            BytesIO: The value.
+
+        Raises:
+            KeyError: If the key is not stored.
+        """
+        return BytesIO(self.get_bytes(key))
+
+    def get_bytes(self, key):
+        """
+        Get a value as bytes.
+
+        Args:
+            key (str): Key of the value.
+
+        Returns:
+            bytes: The value.
+
+        Raises:
+            KeyError: If the key is not stored.
+        """
+        with self._lock:
+            entries = self._index()
+            if key in self._pending:
+                value = self._pending[key]
+                if value is None:
+                    raise KeyError(key)
+                return value
+            entry = entries.get(key)
+        if entry is None:
+            raise KeyError(key)
+        shard, offset, length = entry
+        if length == 0:
+            return b""
+        response = self.s3_dict.client.get_object(
+            Bucket=self.s3_dict.bucket_name,
+            Key=self._shard_key(shard),
+            Range=f"bytes={offset}-{offset + length - 1}",
+        )
+        return response["Body"].read()
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def put(self, key, value):
+        """
+        Add a value to the pending batch, flushing it once it is full.
+
+        Args:
+            key (str): Key of the value.
+            value (BytesIO | bytes): The value, or a readable file object
+                holding it.
+        """
+        data = value.read() if hasattr(value, "read") else bytes(value)
+        with self._lock:
+            self._index()
+            self._replace_pending(key, data)
+            full = self._pending_size >= self.shard_size
+        if full:
+            self.flush()
+
+    def __delitem__(self, key):
+        """
+        Delete a value by writing a tombstone with the next flush.
+
+        Args:
+            key (str): Key of the value.
+
+        Raises:
+            KeyError: If the key is not stored.
+        """
+        with self._lock:
+            if key not in self:
+                raise KeyError(key)
+            self._replace_pending(key, None)
+
+    def __contains__(self, key):
+        with self._lock:
+            entries = self._index()
+            if key in self._pending:
+                return self._pending[key] is not None
+            return key in entries
+
+    def keys(self, prefix=""):
+        """
+        Return the stored keys starting with a prefix, in sorted order.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+
+        Returns:
+            list: Matching keys, pending writes included.
+        """
+        with self._lock:
+            keys = {key for key in self._index() if key.startswith(prefix)}
+            for key, value in self._pending.items():
+                if key.startswith(prefix):
+                    if value is None:
+                        keys.discard(key)
+                    else:
+                        keys.add(key)
+        return sorted(keys)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self, prefix=""):
+        """
+        Generate key-value pairs, fetching values shard by shard.
+
+        A shard is read whole when most of it is wanted, otherwise with one
+        ranged GET per value.
+
+        Args:
+            prefix (str, optional): Prefix to filter the keys. Defaults to ''.
+
+        Yields:
+            tuple: Key and BytesIO value; pending writes first, then the
+                stored values grouped by shard.
+        """
+        with self._lock:
+            entries = self._index()
+            pending, by_shard = [], {}
+            for key in self.keys(prefix):
+                if key in self._pending:
+                    pending.append((key, self._pending[key]))
+                else:
+                    shard, offset, length = entries[key]
+                    by_shard.setdefault(shard, []).append((key, offset, length))
+            sizes = {shard: self._shards[shard][0] for shard in by_shard}
+        for key, value in pending:
+            yield key, BytesIO(value)
+        for shard, members in sorted(by_shard.items()):
+            if 2 * sum(length for _, _, length in members) < sizes[shard]:
+                for key, _, _ in members:
+                    yield key, self.get(key)
+                continue
+            data = self._read(self._shard_key(shard))
+            for key, offset, length in members:
+                yield key, BytesIO(data[offset : offset + length])
+
+    def flush(self):
+        """
+        Write the pending batch as a new shard and index segment.
+        """
+        with self._lock:
+            if not self._pending:
+                return
+            self._index()
+            self._write(list(self._pending.items()))
+            self._pending = {}
+            self._pending_size = 0
+
+    def compact(self, min_live_ratio=0.5):
+        """
+        Rewrite shards whose share of live bytes fell below a ratio.
+
+        Their live values are copied into new shards, then the old shards
+        and their index segments are deleted. Tombstones of keys still
+        deleted are carried over, so older segments cannot resurrect them.
+
+        Args:
+            min_live_ratio (float, optional): Shards with a smaller live
+                fraction are rewritten. Defaults to 0.5.
+
+        Returns:
+            dict: Number of shards rewritten and bytes reclaimed.
+        """
+        self.flush()
+        with self._lock:
+            entries = self._index()
+            sparse = {
+                shard
+                for shard, (size, live) in self._shards.items()
+                if live < size * min_live_ratio
+            }
+            # Segments without a shard hold only tombstones.
+            dropped = sparse | {s for s in self._segments if s not in self._shards}
+            if not sparse:
+                return {"shards": 0, "bytes": 0}
+            # Counted before rewriting moves the live values out of them.
+            reclaimed = sum(size - live for size, live in map(self._shards.get, sparse))
+            live = {}
+            for key, (shard, offset, length) in entries.items():
+                if shard in sparse:
+                    live.setdefault(shard, []).append((key, offset, length))
+            tombstones = self._carried_tombstones(dropped, entries)
+            batch, size = [], 0
+            for shard in sorted(live):
+                data = self._read(self._shard_key(shard))
+                for key, offset, length in sorted(live[shard], key=lambda e: e[1]):
+                    batch.append((key, data[offset : offset + length]))
+                    size += length
+                    if size >= self.shard_size:
+                        self._write(batch)
+                        batch, size = [], 0
+            self._write(batch + [(key, None) for key in tombstones])
+            self.s3_dict.delete_many(
+                [self._segment_key(shard) for shard in sorted(dropped)]
+                + [self._shard_key(shard) for shard in sorted(sparse)]
+            )
+            self._segments = [s for s in self._segments if s not in dropped]
+            for shard in sparse:
+                del self._shards[shard]
+            return {"shards": len(sparse), "bytes": reclaimed}
+
+    def stats(self):
+        """
+        Describe the shards.
+
+        Returns:
+            dict: Number of keys, shards and segments, and total and live
+                bytes stored.
+        """
+        with self._lock:
+            entries = self._index()
+            return {
+                "keys": len(entries),
+                "shards": len(self._shards),
+                "segments": len(self._segments),
+                "bytes": sum(size for size, _ in self._shards.values()),
+                "live_bytes": sum(live for _, live in self._shards.values()),
+            }
+
+    def refresh(self):
+        """
+        Reload the index from the bucket, dropping pending writes.
+        """
+        with self._lock:
+            self._entries = None
+            self._pending = {}
+            self._pending_size = 0
+            self._index()
+
+    def _index(self):
+        """
+        Return the merged index, loading it from the segments if needed.
+
+        Returns:
+            dict: Key -> (shard id, offset, length) of every live value.
+        """
+        if self._entries is not None:
+            return self._entries
+        entries, self._shards, self._segments = {}, {}, []
+        segment_prefix = self.prefix + "index/"
+        for key in self.s3_dict.keys(segment_prefix):
+            shard = int(key[len(segment_prefix) :].split(".")[0])
+            self._segments.append(shard)
+        self._segments.sort()
+        for shard in self._segments:
+            self._last_id = max(self._last_id, shard)
+            records = _decode_segment(self._read(self._segment_key(shard)))
+            size = sum(length for _, _, length in records if length != _TOMBSTONE)
+            if any(length != _TOMBSTONE for _, _, length in records):
+                self._shards[shard] = [size, 0]
+            for key, offset, length in records:
+                self._apply(entries, shard, key, offset, length)
+        self._entries = entries
+        return entries
+
+    def _apply(self, entries, shard, key, offset, length):
+        """
+        Apply one index record to the merged index and the live byte counts.
+        """
+        old = entries.pop(key, None)
+        if old is not None and old[0] in self._shards:
+            self._shards[old[0]][1] -= old[2]
+        if length != _TOMBSTONE:
+            entries[key] = (shard, offset, length)
+            self._shards[shard][1] += length
+
+    def _replace_pending(self, key, data):
+        old = self._pending.pop(key, None)
+        if old is not None:
+            self._pending_size -= len(old)
+        self._pending[key] = data
+        if data is not None:
+            self._pending_size += len(data)
+
+    def _carried_tombstones(self, dropped, entries):
+        """
+        List the deleted keys whose tombstones live in dropped segments.
+        """
+        tombstones = []
+        for shard in sorted(dropped):
+            for key, _, length in _decode_segment(self._read(self._segment_key(shard))):
+                if length == _TOMBSTONE and key not in entries:
+                    tombstones.append(key)
+        return sorted(set(tombstones))
+
+    def _write(self, values):
+        """
+        Store values and tombstones as a new shard and index segment, and
+        apply them to the merged index.
+
+        Args:
+            values (list): (key, bytes) pairs, with None for a tombstone.
+        """
+        if not values:
+            return
+        entries = self._entries
+        shard = self._next_id()
+        records, chunks, offset = [], [], 0
+        for key, value in values:
+            if value is None:
+                records.append((key, 0, _TOMBSTONE))
+            else:
+                records.append((key, offset, len(value)))
+                chunks.append(value)
+                offset += len(value)
+        if chunks:
+            self._put(self._shard_key(shard), b"".join(chunks))
+        # The segment is written last: a shard no segment points to is
+        # never read, so a failed write leaves the store consistent.
+        self._put(self._segment_key(shard), _encode_segment(records))
+        self._segments.append(shard)
+        if chunks:
+            self._shards[shard] = [offset, 0]
+        for key, offset, length in records:
+            self._apply(entries, shard, key, offset, length)
+
+    def _read(self, key):
+        response = self.s3_dict.client.get_object(
+            Bucket=self.s3_dict.bucket_name, Key=key
+        )
+        return response["Body"].read()
+
+    def _put(self, key, data):
+        self.s3_dict.client.put_object(
+            Bucket=self.s3_dict.bucket_name, Key=key, Body=data
+        )
+
+    def _next_id(self):
+        # Increasing ids order the segments; time-based so that ids stay
+        # increasing across processes writing one after another.
+        self._last_id = max(self._last_id + 1, time.time_ns())
+        return self._last_id
+
+    def _shard_key(self, shard):
+        return f"{self.prefix}data/{shard:020d}.pack"
+
+    def _segment_key(self, shard):
+        return f"{self.prefix}index/{shard:020d}.idx"
+
+
+def _encode_segment(records):
+    """
+    Serialize index records to a compressed segment.
+
+    Args:
+        records (list): (key, offset, length) tuples; a length of
+            0xFFFFFFFF marks a tombstone.
+
+    Returns:
+        bytes: The segment.
+    """
+    parts = []
+    for key, offset, length in records:
+        encoded = key.encode()
+        parts.append(_ENTRY.pack(len(encoded), offset, length))
+        parts.append(encoded)
+    return _SEGMENT_MAGIC + zlib.compress(b"".join(parts))
+
+
+def _decode_segment(data):
+    """
+    Parse a segment written by `_encode_segment`.
+
+    Args:
+        data (bytes): The segment.
+
+    Returns:
+        list: (key, offset, length) tuples.
+    """
+    if not data.startswith(_SEGMENT_MAGIC):
+        raise ValueError("Not a pack index segment")
+    body = zlib.decompress(data[len(_SEGMENT_MAGIC) :])
+    records, pos = [], 0
+    while pos < len(body):
+        key_length, offset, length = _ENTRY.unpack_from(body, pos)
+        pos += _ENTRY.size
+        records.append((body[pos : pos + key_length].decode(), offset, length))
+        pos += key_length
+    return records
@@ -0,0 +1,289 @@
+import random
+import threading
+import time
+
+import urllib3
+from botocore.exceptions import ClientError, HTTPClientError
+from botocore.exceptions import ConnectionError as BotocoreConnectionError
+
+# Error codes S3 answers with when a request should be slowed down.
+THROTTLE_CODES = frozenset(
+    (
+        "SlowDown",
+        "Throttling",
+        "ThrottlingException",
+        "RequestLimitExceeded",
+        "TooManyRequests",
+        "503",
+        "429",
+    )
+)
+# Error codes of transient server-side failures.
+TRANSIENT_CODES = frozenset(
+    ("InternalError", "ServiceUnavailable", "RequestTimeout", "500", "502", "504")
+)
+_NETWORK_ERRORS = (
+    BotocoreConnectionError,
+    HTTPClientError,
+    urllib3.exceptions.HTTPError,
+    ConnectionError,
+    TimeoutError,
+)
+# Client methods that send a request; anything else is passed through.
+_REQUESTS = frozenset(
+    (
+        "get_object",
+        "head_object",
+        "put_object",
+        "create_multipart_upload",
+        "upload_part",
+        "complete_multipart_upload",
+        "abort_multipart_upload",
+        "list_objects_v2",
+        "delete_object",
+        "delete_objects",
+    )
+)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for transient S3 failures.
+
+    Throttling (503 SlowDown and similar), transient 5xx errors and
+    connection failures are retried. Everything else, notably 404s, failed
+    preconditions and access errors, is raised at once.
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.05, max_delay=5.0):
+        """
+        Initialize the policy.
+
+        Args:
+            max_attempts (int, optional): Attempts per request, including
+                the first; 1 disables retries. Defaults to 5.
+            base_delay (float, optional): Backoff ceiling in seconds after
+                the first failure; it doubles with every attempt.
+                Defaults to 0.05.
+            max_delay (float, optional): Largest backoff ceiling in seconds.
+                Defaults to 5.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_throttle(self, error):
+        """
+        Tell whether an error asks the client to slow down.
+
+        Args:
+            error (Exception): The error raised by a request.
+
+        Returns:
+            bool: True for throttling responses.
+        """
+        return _error_code(error) in THROTTLE_CODES
+
+    def is_retryable(self, error):
+        """
+        Tell whether a request that raised an error may succeed if resent.
+
+        Args:
+            error (Exception): The error raised by a request.
+
+        Returns:
+            bool: True for throttling, transient server errors and
+                connection failures.
+        """
+        if isinstance(error, ClientError):
+            code = _error_code(error)
+            return code in THROTTLE_CODES or code in TRANSIENT_CODES
+        return isinstance(error, _NETWORK_ERRORS)
+
+    def backoff(self, attempt):
+        """
+        Pick a random delay before a retry.
+
+        Args:
+            attempt (int): Number of attempts already made, from 1.
+
+        Returns:
+            float: Seconds to wait, up to the attempt's backoff ceiling.
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+
+class AdaptiveConcurrency:
+    """
+    Limits concurrent requests with additive increase, multiplicative decrease.
+
+    Every request holds a slot while it runs. Each window of successful
+    requests raises the limit by one, up to `maximum`; a throttled request
+    halves it, at most once per window, so a burst of throttling responses
+    to requests sent together counts as one signal.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=None, decrease=0.5):
+        """
+        Initialize the controller.
+
+        Args:
+            maximum (int): Highest limit.
+            minimum (int, optional): Lowest limit. Defaults to 1.
+            initial (int, optional): Starting limit. Defaults to maximum.
+            decrease (float, optional): Factor the limit is multiplied by
+                when throttled. Defaults to 0.5.
+        """
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease = decrease
+        self.limit = initial or maximum
+        self._in_flight = 0
+        self._successes = 0
+        self._started = 0
+        self._cut_at = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Wait for a free slot and take it.
+
+        Returns:
+            int: Sequence number of the request, passed back to `throttled`.
+        """
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+            self._started += 1
+            return self._started
+
+    def release(self):
+        """
+        Give a slot back.
+        """
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify()
+
+    def succeeded(self):
+        """
+        Record a successful request; a full window of them raises the limit.
+        """
+        with self._cond:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self._successes = 0
+                self.limit += 1
+                self._cond.notify()
+
+    def throttled(self, sequence):
+        """
+        Record a throttled request and cut the limit.
+
+        Requests started before the last cut do not cut it again.
+
+        Args:
+            sequence (int): Sequence number returned by `acquire`.
+        """
+        with self._cond:
+            if sequence <= self._cut_at:
+                return
+            self._cut_at = self._started
+            self._successes = 0
+            self.limit = max(self.minimum, int(self.limit * self.decrease))
+
+
+class RetryingTransport:
+    """
+    Wraps an S3 client to retry transient failures, optionally under an
+    AdaptiveConcurrency limit.
+
+    Retried calls report the number of retries in
+    `ResponseMetadata.RetryAttempts`, like botocore. Streamed request
+    bodies are rewound before each retry.
+    """
+
+    def __init__(self, client, policy, concurrency=None, sleep=time.sleep):
+        """
+        Initialize the wrapper.
+
+        Args:
+            client (object): A boto3 S3 client, Urllib3Transport or
+                MemoryTransport.
+            policy (RetryPolicy): Which failures to retry and how long to wait.
+            concurrency (AdaptiveConcurrency, optional): Limit every request
+                runs under. Defaults to None, for no limit.
+            sleep (callable, optional): Function used to wait between
+                attempts. Defaults to time.sleep.
+        """
+        self.client = client
+        self.policy = policy
+        self.concurrency = concurrency
+        self._sleep = sleep
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if name not in _REQUESTS:
+            return attr
+
+        def call(**kwargs):
+            return self._call(attr, kwargs)
+
+        return call
+
+    def _call(self, fn, kwargs):
+        policy, concurrency = self.policy, self.concurrency
+        body = kwargs.get("Body")
+        start = _tell(body)
+        attempt = 1
+        while True:
+            sequence = concurrency.acquire() if concurrency is not None else None
+            try:
+                response = fn(**kwargs)
+            except Exception as error:
+                if concurrency is not None:
+                    concurrency.release()
+                    if policy.is_throttle(error):
+                        concurrency.throttled(sequence)
+                if attempt >= policy.max_attempts or not policy.is_retryable(error):
+                    _set_retries(getattr(error, "response", None), attempt - 1)
+                    raise
+            else:
+                if concurrency is not None:
+                    concurrency.release()
+                    concurrency.succeeded()
+                _set_retries(response, attempt - 1)
+                return response
+            if start is not None:
+                body.seek(start)
+            self._sleep(policy.backoff(attempt))
+            attempt += 1
+
+
+def _error_code(error):
+    response = getattr(error, "response", None)
+    if not isinstance(response, dict):
+        return None
+    code = response.get("Error", {}).get("Code")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    if code in (None, "") and status is not None:
+        return str(status)
+    return code
+
+
+def _tell(body):
+    if body is None or isinstance(body, (bytes, bytearray, memoryview)):
+        return None
+    try:
+        return body.tell()
+    except (AttributeError, OSError):
+        return None
+
+
+def _set_retries(response, retries):
+    if retries and isinstance(response, dict):
+        metadata = response.setdefault("ResponseMetadata", {})
+        metadata["RetryAttempts"] = metadata.get("RetryAttempts", 0) + retries
@@ -0,0 +1,241 @@
+import hashlib
+import hmac
+from datetime import datetime, timezone
+from functools import lru_cache
+from urllib.parse import parse_qsl, quote, unquote, urlsplit
+
+ALGORITHM = "AWS4-HMAC-SHA256"
+UNSIGNED_PAYLOAD = "UNSIGNED-PAYLOAD"
+STREAMING_PAYLOAD = "STREAMING-AWS4-HMAC-SHA256-PAYLOAD"
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Bytes added around each chunk of a streaming upload besides its hex size:
+# ";chunk-signature=", the 64-character signature and two CRLFs.
+_CHUNK_OVERHEAD = len(";chunk-signature=") + 64 + 4
+
+
+class SigV4Signer:
+    """
+    Signs HTTP requests to S3 with AWS Signature Version 4.
+
+    The derived signing key is cached per date, region and service, and the
+    sorted layout of each set of header names is computed once, so signing a
+    request costs two SHA-256 digests and one HMAC. Bodies are not hashed:
+    requests are signed with UNSIGNED-PAYLOAD, a caller-supplied payload
+    hash, or as a streaming upload whose chunks are signed as they are sent.
+    """
+
+    def __init__(
+        self, access_key, secret_key, region, service="s3", session_token=None
+    ):
+        """
+        Initialize the signer.
+
+        Args:
+            access_key (str): AWS access key.
+            secret_key (str): AWS secret key.
+            region (str): Region of the endpoint.
+            service (str, optional): Service name. Defaults to 's3'.
+            session_token (str, optional): Session token of temporary
+                credentials. Defaults to None.
+        """
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.service = service
+        self.session_token = session_token
+        self._scope_suffix = f"/{region}/{service}/aws4_request"
+        self._credential = f"{ALGORITHM} Credential={access_key}/"
+        self._layouts = {}
+
+    def sign(self, method, url, headers=None, payload_hash=UNSIGNED_PAYLOAD, now=None):
+        """
+        Sign a request.
+
+        Every header passed in is signed, along with host, x-amz-date and
+        x-amz-content-sha256.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Full URL, with its path and query already quoted.
+            headers (dict, optional): Headers to send. Defaults to None.
+            payload_hash (str, optional): Hex SHA-256 of the body,
+                UNSIGNED_PAYLOAD or STREAMING_PAYLOAD. Defaults to
+                UNSIGNED_PAYLOAD.
+            now (datetime, optional): Signing time. Defaults to now.
+
+        Returns:
+            dict: The headers to send, including Authorization.
+        """
+        amz_date, scope = self._scope(now)
+        signature, headers = self._sign(
+            method, url, headers, payload_hash, amz_date, scope
+        )
+        return headers
+
+    def sign_streaming(
+        self,
+        method,
+        url,
+        stream,
+        size,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        headers=None,
+        now=None,
+    ):
+        """
+        Sign a streaming (aws-chunked) upload.
+
+        The body is read from `stream` in chunks of `chunk_size` bytes and each
+        chunk is signed as it is produced, chained to the request signature,
+        so the body is never hashed ahead of time or held in memory.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Full URL, with its path and query already quoted.
+            stream (file-like): Readable file object with `size` bytes.
+            size (int): Size of the decoded body in bytes.
+            chunk_size (int, optional): Size of each signed chunk; S3 requires
+                at least 8 KiB for all but the last. Defaults to 64 KiB.
+            headers (dict, optional): Headers to send. Defaults to None.
+            now (datetime, optional): Signing time. Defaults to now.
+
+        Returns:
+            tuple: The headers to send and an iterator over the encoded body.
+        """
+        headers = dict(headers or {})
+        headers["Content-Encoding"] = "aws-chunked"
+        headers["Content-Length"] = str(streaming_content_length(size, chunk_size))
+        headers["x-amz-decoded-content-length"] = str(size)
+        amz_date, scope = self._scope(now)
+        signature, headers = self._sign(
+            method, url, headers, STREAMING_PAYLOAD, amz_date, scope
+        )
+        body = self._signed_chunks(stream, chunk_size, signature, amz_date, scope)
+        return headers, body
+
+    def signing_key(self, datestamp):
+        """
+        Return the signing key for a date, derived once and then cached.
+
+        Args:
+            datestamp (str): Date as YYYYMMDD.
+
+        Returns:
+            bytes: The signing key.
+        """
+        return _signing_key(self.secret_key, datestamp, self.region, self.service)
+
+    def _scope(self, now):
+        now = now or datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        return amz_date, amz_date[:8] + self._scope_suffix
+
+    def _sign(self, method, url, headers, payload_hash, amz_date, scope):
+        parts = urlsplit(url)
+        headers = dict(headers or {})
+        headers["x-amz-date"] = amz_date
+        headers["x-amz-content-sha256"] = payload_hash
+        if self.session_token:
+            headers["x-amz-security-token"] = self.session_token
+        values = {name.lower(): value for name, value in headers.items()}
+        values.setdefault("host", parts.netloc)
+        names, signed_headers = self._layout(values)
+        canonical_headers = "".join(
+            f"{name}:{' '.join(str(values[name]).split())}\n" for name in names
+        )
+        canonical_request = "\n".join(
+            [
+                method,
+                _canonical_path(parts.path),
+                _canonical_query(parts.query),
+                canonical_headers,
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        string_to_sign = "\n".join(
+            [ALGORITHM, amz_date, scope, _sha256(canonical_request.encode())]
+        )
+        signature = self._hmac(scope[:8], string_to_sign)
+        headers["Authorization"] = (
+            f"{self._credential}{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        return signature, headers
+
+    def _layout(self, values):
+        """
+        Return the sorted header names and the SignedHeaders value for a set of
+        header names, computed once per distinct set.
+        """
+        key = frozenset(values)
+        layout = self._layouts.get(key)
+        if layout is None:
+            names = sorted(values)
+            layout = self._layouts[key] = (names, ";".join(names))
+        return layout
+
+    def _signed_chunks(self, stream, chunk_size, signature, amz_date, scope):
+        prefix = "\n".join(["AWS4-HMAC-SHA256-PAYLOAD", amz_date, scope])
+        while True:
+            chunk = stream.read(chunk_size)
+            string_to_sign = "\n".join(
+                [prefix, signature, EMPTY_SHA256, _sha256(chunk)]
+            )
+            signature = self._hmac(scope[:8], string_to_sign)
+            header = f"{len(chunk):x};chunk-signature={signature}\r\n".encode()
+            yield header + chunk + b"\r\n"
+            if not chunk:
+                return
+
+    def _hmac(self, datestamp, string_to_sign):
+        key = self.signing_key(datestamp)
+        return hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+
+def streaming_content_length(size, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Compute the Content-Length of an aws-chunked body.
+
+    Args:
+        size (int): Size of the decoded body in bytes.
+        chunk_size (int, optional): Size of each signed chunk. Defaults to
+            64 KiB.
+
+    Returns:
+        int: Size of the encoded body in bytes.
+    """
+    full, last = divmod(size, chunk_size)
+    length = full * (len(f"{chunk_size:x}") + _CHUNK_OVERHEAD + chunk_size)
+    if last:
+        length += len(f"{last:x}") + _CHUNK_OVERHEAD + last
+    return length + 1 + _CHUNK_OVERHEAD
+
+
+@lru_cache(maxsize=64)
+def _signing_key(secret_key, datestamp, region, service):
+    key = ("AWS4" + secret_key).encode()
+    for part in (datestamp, region, service, "aws4_request"):
+        key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+    return key
+
+
+def _canonical_path(path):
+    # S3 signs the path URI-encoded once, with slashes kept.
+    return quote(unquote(path or "/"), safe="/~")
+
+
+def _canonical_query(query):
+    if not query:
+        return ""
+    pairs = parse_qsl(query, keep_blank_values=True)
+    return "&".join(
+        f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for name, value in sorted(pairs)
+    )
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
@@ -0,0 +1,148 @@
+import io
+
+DEFAULT_BUFFER_SIZE = 256 * 1024
+
+
+class RangeReader(io.RawIOBase):
+    """
+    A seekable, read-only file object over an S3 object backed by ranged GETs.
+
+    Only the bytes that are actually read are downloaded. Small reads are
+    served from a read-ahead buffer of `buffer_size` bytes; reads at least
+    that large are fetched directly without going through the buffer.
+    """
+
+    def __init__(self, fetch, size, buffer_size=DEFAULT_BUFFER_SIZE, etag=None):
+        """
+        Initialize the reader.
+
+        Args:
+            fetch (callable): Function called as fetch(start, end) that returns
+                the bytes of the inclusive range [start, end] of the object.
+            size (int): Size of the object in bytes.
+            buffer_size (int, optional): Size of the read-ahead buffer.
+                Defaults to DEFAULT_BUFFER_SIZE.
+            etag (str, optional): ETag of the object the reader was opened on.
+                Defaults to None.
+        """
+        super().__init__()
+        self._fetch = fetch
+        self.size = size
+        self.buffer_size = buffer_size
+        self.etag = etag
+        self._pos = 0
+        self._buffer = b""
+        self._buffer_start = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Move to a new position in the object.
+
+        Args:
+            offset (int): Offset relative to `whence`.
+            whence (int, optional): io.SEEK_SET, io.SEEK_CUR or io.SEEK_END.
+                Defaults to io.SEEK_SET.
+
+        Returns:
+            int: The new absolute position.
+        """
+        self._checkClosed()
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+        self._pos = pos
+        return pos
+
+    def read(self, size=-1):
+        """
+        Read up to `size` bytes from the current position.
+
+        Args:
+            size (int, optional): Number of bytes to read; -1 reads to the end.
+                Defaults to -1.
+
+        Returns:
+            bytes: The data read; empty at the end of the object.
+        """
+        self._checkClosed()
+        if size is None or size < 0:
+            end = self.size
+        else:
+            end = min(self.size, self._pos + size)
+        chunks = []
+        while self._pos < end:
+            offset = self._pos - self._buffer_start
+            if 0 <= offset < len(self._buffer):
+                chunk = self._buffer[offset : offset + end - self._pos]
+            elif end - self._pos >= self.buffer_size:
+                chunk = self._fetch(self._pos, end - 1)
+            else:
+                self._buffer_start = self._pos
+                self._buffer = self._fetch(
+                    self._pos, min(self.size, self._pos + self.buffer_size) - 1
+                )
+                if not self._buffer:
+                    raise EOFError(f"Object ended before byte {self._pos}")
+                continue
+            if not chunk:
+                raise EOFError(f"Object ended before byte {self._pos}")
+            chunks.append(chunk)
+            self._pos += len(chunk)
+        if len(chunks) == 1:
+            return chunks[0]
+        return b"".join(chunks)
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        """
+        Read bytes into a pre-allocated writable buffer.
+
+        Args:
+            b (bytearray | memoryview): Buffer to fill.
+
+        Returns:
+            int: Number of bytes read.
+        """
+        data = self.read(len(b))
+        n = len(data)
+        memoryview(b).cast("B")[:n] = data
+        return n
+
+    def iter_chunks(self, chunk_size=DEFAULT_BUFFER_SIZE):
+        """
+        Generate the rest of the object in chunks.
+
+        Args:
+            chunk_size (int, optional): Maximum size of each chunk.
+                Defaults to DEFAULT_BUFFER_SIZE.
+
+        Yields:
+            bytes: Consecutive chunks of the object.
+        """
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self._buffer = b""
+        super().close()
@@ -0,0 +1,447 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# Local file remembering the ETag of every hashed file, by size and mtime.
+HASH_CACHE_NAME = ".s3_sync_cache.json"
+_CHUNK_SIZE = 1024 * 1024
+_MiB = 1024 * 1024
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Files with this prefix are the hash cache or downloads in progress.
+_INTERNAL_PREFIX = ".s3_sync"
+
+SyncResult = namedtuple(
+    "SyncResult",
+    ["transferred", "deleted", "unchanged", "bytes", "errors", "dry_run"],
+)
+SyncResult.__doc__ = """
+Outcome of a sync, or what it would do when `dry_run` is True.
+
+transferred and deleted list the relative paths copied and removed,
+unchanged counts the files already in sync, bytes sums the sizes of the
+transferred files and errors maps every path that failed to its exception.
+"""
+
+
+def sync(
+    s3_dict,
+    local_dir,
+    prefix="",
+    direction="upload",
+    compare="etag",
+    delete=False,
+    dry_run=False,
+    max_workers=None,
+    hash_cache=HASH_CACHE_NAME,
+):
+    """
+    Mirror a local directory to a prefix of the bucket, or the reverse.
+
+    Both sides are listed once: the bucket with ListObjectsV2, whose
+    entries carry the size, ETag and modification time of every object,
+    and the directory with os.walk. Only new and changed files are then
+    transferred, concurrently and streamed from and to disk.
+
+    With compare='etag', files of different sizes are changed, and files
+    of equal size are hashed and compared with the object's ETag,
+    including the ETags of multipart uploads. Hashes are kept in
+    `hash_cache` by path, size and mtime, so unchanged files are not read
+    again on the next run. With compare='mtime', a file is changed if its
+    size differs or the source is newer than the destination. Downloaded
+    files get the object's modification time.
+
+    Files are uploaded as they are, without the S3Dict's codec, so that
+    their sizes and ETags stay comparable. Objects stored compressed are
+    decompressed on download, and the hash cache remembers the ETag each
+    such file was decompressed from, so it is not downloaded again until
+    either side changes; without a hash cache it is downloaded on every
+    run. ETags of objects stored with SSE-KMS are not MD5 digests; compare
+    those with 'mtime'.
+
+    Args:
+        s3_dict (S3Dict): Store holding the bucket side.
+        local_dir (str | os.PathLike): Local directory.
+        prefix (str, optional): Prefix of the keys; a file's key is the
+            prefix followed by its path relative to `local_dir`, with '/'
+            separators. Defaults to ''.
+        direction (str, optional): 'upload' to copy the directory to the
+            bucket, 'download' for the reverse. Defaults to 'upload'.
+        compare (str, optional): 'etag' or 'mtime'. Defaults to 'etag'.
+        delete (bool, optional): Also remove the destination's files or
+            objects that the source does not have. Defaults to False.
+        dry_run (bool, optional): Only report what would be transferred
+            and deleted. Defaults to False.
+        max_workers (int, optional): Number of concurrent transfers and
+            hashes. Defaults to the S3Dict's max_workers.
+        hash_cache (str | os.PathLike, optional): File of the hash cache,
+            relative to `local_dir` unless absolute; it is never synced.
+            Defaults to '.s3_sync_cache.json'. None disables the cache.
+
+    Returns:
+        SyncResult: What was transferred, deleted and left unchanged, and
+            the files that failed, including the objects whose keys would
+            lead outside `local_dir`; a failure does not stop the others.
+
+    Raises:
+        ValueError: If `direction` or `compare` is unknown.
+    """
+    if direction not in ("upload", "download"):
+        raise ValueError(f"Unknown direction {direction!r}")
+    if compare not in ("etag", "mtime"):
+        raise ValueError(f"Unknown comparison {compare!r}")
+    max_workers = max_workers or s3_dict.max_workers
+    local_dir = os.fspath(local_dir)
+    cache_path = None
+    if hash_cache is not None:
+        cache_path = os.path.join(local_dir, os.fspath(hash_cache))
+    cache = HashCache(cache_path, (s3_dict.part_size, 8 * _MiB))
+
+    files = _local_files(local_dir, cache_path)
+    objects = {
+        entry["Key"][len(prefix) :]: entry
+        for entry in s3_dict.list_objects(prefix)
+        if not entry["Key"].endswith("/")
+    }
+    errors = {}
+    if direction == "download":
+        # Keys are untrusted: "a/../../x" must not be written outside local_dir.
+        for path in list(objects):
+            try:
+                _local_path(local_dir, path)
+            except ValueError as error:
+                errors[path] = error
+                del objects[path]
+    sources, targets = (files, objects) if direction == "upload" else (objects, files)
+
+    def size_of(path):
+        return files[path].size if direction == "upload" else objects[path]["Size"]
+
+    transfer, to_hash = [], []
+    for path in sources:
+        if path not in targets:
+            transfer.append(path)
+        elif cache.decoded_etag(path, files[path]) == objects[path]["ETag"]:
+            # Decompressed from this very object by an earlier download.
+            continue
+        elif _changed(files[path], objects[path], compare, direction):
+            transfer.append(path)
+        elif compare == "etag":
+            to_hash.append(path)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        def hashed_etag(path):
+            file_path = _local_path(local_dir, path)
+            return cache.etag(file_path, path, files[path], objects[path]["ETag"])
+
+        for path, etag in zip(to_hash, pool.map(hashed_etag, to_hash)):
+            if etag != objects[path]["ETag"]:
+                transfer.append(path)
+        transfer.sort()
+        unchanged = len(sources) - len(transfer)
+        deleted = sorted(set(targets) - set(sources)) if delete else []
+        if dry_run:
+            cache.save()
+            size = sum(map(size_of, transfer))
+            return SyncResult(transfer, deleted, unchanged, size, errors, True)
+
+        def copy(path):
+            try:
+                if direction == "upload":
+                    with open(_local_path(local_dir, path), "rb") as f:
+                        s3_dict.put_raw(prefix + path, f)
+                else:
+                    _download(
+                        s3_dict, prefix + path, local_dir, path, objects[path], cache
+                    )
+            except Exception as error:
+                return error
+            return None
+
+        errors.update(
+            (path, error)
+            for path, error in zip(transfer, pool.map(copy, transfer))
+            if error is not None
+        )
+
+    if direction == "upload":
+        result = s3_dict.delete_many(prefix + path for path in deleted)
+        errors.update(
+            (key[len(prefix) :], error) for key, error in result.errors.items()
+        )
+    else:
+        for path in deleted:
+            try:
+                os.remove(_local_path(local_dir, path))
+            except (OSError, ValueError) as error:
+                errors[path] = error
+    cache.save()
+    transferred = [path for path in transfer if path not in errors]
+    deleted = [path for path in deleted if path not in errors]
+    size = sum(map(size_of, transferred))
+    return SyncResult(transferred, deleted, unchanged, size, errors, False)
+
+
+def s3_etag(path, part_size=None):
+    """
+    Compute the ETag S3 gives a file uploaded in one piece or in parts.
+
+    Args:
+        path (str | os.PathLike): File to hash.
+        part_size (int, optional): Size of the parts of a multipart upload.
+            Defaults to None, for a single PUT.
+
+    Returns:
+        str: The quoted ETag: the MD5 of the content, or the MD5 of the
+            parts' MD5s followed by '-' and the number of parts.
+    """
+    with open(path, "rb") as f:
+        if part_size is None:
+            digest = hashlib.md5()
+            while chunk := f.read(_CHUNK_SIZE):
+                digest.update(chunk)
+            return '"%s"' % digest.hexdigest()
+        digests = []
+        while True:
+            digest = hashlib.md5()
+            remaining = part_size
+            while remaining and (chunk := f.read(min(remaining, _CHUNK_SIZE))):
+                digest.update(chunk)
+                remaining -= len(chunk)
+            if remaining == part_size:
+                break
+            digests.append(digest.digest())
+    return '"%s-%d"' % (hashlib.md5(b"".join(digests)).hexdigest(), len(digests))
+
+
+def multipart_part_size(size, etag, candidates=(8 * _MiB,)):
+    """
+    Guess the part size of a multipart upload from its size and ETag.
+
+    The first of `candidates` that gives the ETag's number of parts is
+    used, otherwise the smallest whole MiB size that does, since
+    uploaders split files into MiB multiples.
+
+    Args:
+        size (int): Size of the object.
+        etag (str): ETag of the object.
+        candidates (tuple, optional): Part sizes to try first. Defaults to
+            8 MiB, the default of boto3 and the AWS CLI.
+
+    Returns:
+        int: Part size, or None if the object was uploaded in one piece or
+            no MiB part size gives its number of parts.
+    """
+    if "-" not in etag:
+        return None
+    parts = int(etag.strip('"').rsplit("-", 1)[1])
+    for part_size in candidates:
+        if -(-size // part_size) == parts:
+            return part_size
+    part_size = -(-size // parts // _MiB) * _MiB or _MiB
+    while -(-size // part_size) > parts:
+        part_size += _MiB
+    return part_size if -(-size // part_size) == parts else None
+
+
+LocalFile = namedtuple("LocalFile", ["size", "mtime_ns"])
+
+
+class HashCache:
+    """
+    ETags of local files, kept in a JSON file by path, size and mtime.
+
+    An entry is only used while the file keeps the size and modification
+    time it had when hashed.
+    """
+
+    def __init__(self, path=None, part_sizes=(8 * _MiB,)):
+        """
+        Load the cache.
+
+        Args:
+            path (str, optional): JSON file of the cache. Defaults to None,
+                for a cache that is not persisted.
+            part_sizes (tuple, optional): Part sizes tried first to match
+                multipart ETags; see `multipart_part_size`. Defaults to 8 MiB.
+        """
+        self.path = path
+        self.part_sizes = part_sizes
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._dirty = False
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self._entries = json.load(f)
+
+    def etag(self, file_path, path, local, remote_etag):
+        """
+        Return the ETag of a file in the form of a remote ETag.
+
+        Args:
+            file_path (str): Path of the file to hash.
+            path (str): Relative path the entry is stored under.
+            local (LocalFile): Size and mtime of the file.
+            remote_etag (str): ETag to compare with, which tells whether
+                to hash the file whole or in parts.
+
+        Returns:
+            str: The file's ETag, or None if the part size of a multipart
+                ETag cannot be guessed.
+        """
+        part_size = multipart_part_size(local.size, remote_etag, self.part_sizes)
+        if "-" in remote_etag and part_size is None:
+            return None
+        key = [local.size, local.mtime_ns, part_size or 0]
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+        etag = s3_etag(file_path, part_size)
+        with self._lock:
+            self._entries[path] = key + [etag]
+            self._dirty = True
+        return etag
+
+    def decoded_etag(self, path, local):
+        """
+        Return the ETag of the compressed object a file was decompressed from.
+
+        Args:
+            path (str): Relative path of the file.
+            local (LocalFile): Size and mtime of the file.
+
+        Returns:
+            str: The object's ETag, or None if the file was not downloaded
+                decompressed or changed since.
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is not None and entry[:3] == [local.size, local.mtime_ns, None]:
+            return entry[3]
+        return None
+
+    def add_decoded(self, path, local, etag):
+        """
+        Remember that a file was decompressed from an object.
+
+        Args:
+            path (str): Relative path of the file.
+            local (LocalFile): Size and mtime of the file.
+            etag (str): ETag of the compressed object.
+        """
+        with self._lock:
+            # No part size: the file's own ETag differs from the object's.
+            self._entries[path] = [local.size, local.mtime_ns, None, etag]
+            self._dirty = True
+
+    def save(self):
+        """
+        Write the cache back to its file if it changed.
+        """
+        if self.path is None or not self._dirty:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=_INTERNAL_PREFIX)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def _local_files(local_dir, skip):
+    """
+    Map the relative path of every file under a directory to its LocalFile.
+    """
+    files = {}
+    skip = os.path.abspath(skip) if skip is not None else None
+    for root, _, names in os.walk(local_dir):
+        for name in names:
+            full = os.path.join(root, name)
+            if os.path.abspath(full) == skip or name.startswith(_INTERNAL_PREFIX):
+                continue
+            stat = os.stat(full)
+            path = os.path.relpath(full, local_dir).replace(os.sep, "/")
+            files[path] = LocalFile(stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _local_path(local_dir, path):
+    """
+    Join a relative path with '/' separators to a directory, refusing paths
+    that lead outside of it.
+
+    Raises:
+        ValueError: If the path is absolute, has empty, '.' or '..'
+            components, or its directory resolves outside `local_dir`, such
+            as through a symbolic link.
+    """
+    parts = path.split("/")
+    if any(part in ("", ".", "..") for part in parts):
+        raise ValueError(f"Unsafe relative path {path!r}")
+    target = os.path.join(local_dir, *parts)
+    root = os.path.realpath(local_dir)
+    directory = os.path.realpath(os.path.dirname(target))
+    try:
+        inside = os.path.commonpath([root, directory]) == root
+    except ValueError:
+        # Paths on different drives.
+        inside = False
+    if not inside:
+        raise ValueError(f"Path {path!r} resolves outside {local_dir!r}")
+    return target
+
+
+def _changed(local, entry, compare, direction):
+    """
+    Tell from sizes and times alone whether a file and object differ.
+    """
+    if local.size != entry["Size"]:
+        return True
+    if compare == "etag":
+        return False
+    modified_ns = _timestamp_ns(entry["LastModified"])
+    if direction == "upload":
+        return local.mtime_ns > modified_ns
+    return modified_ns > local.mtime_ns
+
+
+def _download(s3_dict, key, local_dir, path, entry, cache):
+    """
+    Stream an object to a file, replacing it only once complete, and record
+    objects that were decompressed in the hash cache.
+    """
+    target = _local_path(local_dir, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix=_INTERNAL_PREFIX)
+    os.close(fd)
+    try:
+        if entry["Size"] >= s3_dict.multipart_threshold:
+            s3_dict.download(key, tmp)
+        else:
+            body = s3_dict.stream(key)
+            with open(tmp, "wb") as f:
+                shutil.copyfileobj(body, f, _CHUNK_SIZE)
+        modified_ns = _timestamp_ns(entry["LastModified"])
+        os.utime(tmp, ns=(modified_ns, modified_ns))
+        os.replace(tmp, target)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    size = os.stat(target).st_size
+    # Only a decompressed object differs in size from its file.
+    if size != entry["Size"]:
+        cache.add_decoded(path, LocalFile(size, modified_ns), entry["ETag"])
+
+
+def _timestamp_ns(modified):
+    # Exact, unlike datetime.timestamp(), so that a downloaded file's mtime
+    # compares equal to its object's LastModified.
+    delta = modified - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10**9 + delta.microseconds * 1000
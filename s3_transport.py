@@ -0,0 +1,633 @@
+import base64
+import hashlib
+import itertools
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+from urllib.parse import quote, unquote_plus, urlencode
+from xml.etree import ElementTree
+
+import urllib3
+from botocore.exceptions import ClientError
+
+from logic.s3_sign import SigV4Signer
+
+_pool_managers = {}
+_pool_managers_lock = threading.Lock()
+
+
+class Urllib3Transport:
+    """
+    S3 operations over raw urllib3 requests signed with SigV4.
+
+    Implements the subset of the botocore S3 client used by S3Dict, with the
+    same keyword arguments, response dicts and ClientError codes, so it can
+    be passed as S3Dict's transport. Connections come from the process-wide
+    keep-alive pool returned by `shared_pool_manager`.
+    """
+
+    def __init__(
+        self,
+        region_name,
+        access_key=None,
+        secret_key=None,
+        max_workers=10,
+        endpoint_url=None,
+    ):
+        """
+        Initialize the transport.
+
+        Args:
+            region_name (str): Region of the buckets.
+            access_key (str, optional): AWS access key. Defaults to None,
+                which sends unsigned requests for public buckets.
+            secret_key (str, optional): AWS secret key. Defaults to None.
+            max_workers (int, optional): Maximum number of connections kept
+                per host. Defaults to 10.
+            endpoint_url (str, optional): Alternative endpoint, addressed
+                path-style, such as a local S3 stand-in. Defaults to None.
+        """
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.http = shared_pool_manager(max_workers)
+        self.signer = (
+            SigV4Signer(access_key, secret_key, region_name)
+            if access_key and secret_key
+            else None
+        )
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None):
+        headers = {"Range": Range, "If-Match": IfMatch, "If-None-Match": IfNoneMatch}
+        response = self._request("GetObject", "GET", Bucket, Key, headers=headers)
+        result = _object_metadata(response)
+        result["Body"] = BytesIO(response.data)
+        return result
+
+    def head_object(self, Bucket, Key):
+        response = self._request("HeadObject", "HEAD", Bucket, Key)
+        return _object_metadata(response)
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None):
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        response = self._request(
+            "PutObject",
+            "PUT",
+            Bucket,
+            Key,
+            body=Body,
+            headers=_metadata_headers(Metadata),
+        )
+        return {"ETag": response.headers.get("ETag")}
+
+    def delete_object(self, Bucket, Key):
+        self._request("DeleteObject", "DELETE", Bucket, Key)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        root = ElementTree.Element("Delete")
+        ElementTree.SubElement(root, "Quiet").text = str(
+            Delete.get("Quiet", False)
+        ).lower()
+        for obj in Delete["Objects"]:
+            ElementTree.SubElement(
+                ElementTree.SubElement(root, "Object"), "Key"
+            ).text = obj["Key"]
+        body = ElementTree.tostring(root)
+        # DeleteObjects is the one operation S3 refuses without Content-MD5.
+        md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+        response = self._request(
+            "DeleteObjects",
+            "POST",
+            Bucket,
+            query={"delete": ""},
+            body=body,
+            headers={"Content-MD5": md5},
+        )
+        result = {"Deleted": [], "Errors": []}
+        for elem in _parse(response.data):
+            tag = _local_name(elem.tag)
+            if tag == "Deleted":
+                result["Deleted"].append({"Key": _text(elem, "Key")})
+            elif tag == "Error":
+                result["Errors"].append(
+                    {
+                        "Key": _text(elem, "Key"),
+                        "Code": _text(elem, "Code"),
+                        "Message": _text(elem, "Message"),
+                    }
+                )
+        return result
+
+    def list_objects_v2(
+        self,
+        Bucket,
+        Prefix="",
+        Delimiter=None,
+        StartAfter=None,
+        ContinuationToken=None,
+        MaxKeys=None,
+    ):
+        query = {"list-type": "2", "encoding-type": "url", "prefix": Prefix}
+        for name, value in (
+            ("delimiter", Delimiter),
+            ("start-after", StartAfter),
+            ("continuation-token", ContinuationToken),
+            ("max-keys", MaxKeys),
+        ):
+            if value:
+                query[name] = str(value)
+        response = self._request("ListObjectsV2", "GET", Bucket, query=query)
+        result = {"IsTruncated": False, "KeyCount": 0}
+        contents, common_prefixes = [], []
+        for elem in _parse(response.data):
+            tag = _local_name(elem.tag)
+            if tag == "Contents":
+                contents.append(
+                    {
+                        "Key": unquote_plus(_text(elem, "Key")),
+                        "Size": int(_text(elem, "Size")),
+                        "ETag": _text(elem, "ETag"),
+                        "LastModified": datetime.fromisoformat(
+                            _text(elem, "LastModified").replace("Z", "+00:00")
+                        ),
+                    }
+                )
+            elif tag == "CommonPrefixes":
+                common_prefixes.append({"Prefix": unquote_plus(_text(elem, "Prefix"))})
+            elif tag == "IsTruncated":
+                result["IsTruncated"] = elem.text == "true"
+            elif tag == "NextContinuationToken":
+                result["NextContinuationToken"] = elem.text
+            elif tag == "KeyCount":
+                result["KeyCount"] = int(elem.text)
+        if contents:
+            result["Contents"] = contents
+        if common_prefixes:
+            result["CommonPrefixes"] = common_prefixes
+        return result
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None):
+        response = self._request(
+            "CreateMultipartUpload",
+            "POST",
+            Bucket,
+            Key,
+            query={"uploads": ""},
+            headers=_metadata_headers(Metadata),
+        )
+        return {"UploadId": _text(_parse(response.data), "UploadId")}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        response = self._request(
+            "UploadPart",
+            "PUT",
+            Bucket,
+            Key,
+            query={"partNumber": str(PartNumber), "uploadId": UploadId},
+            body=Body,
+        )
+        return {"ETag": response.headers.get("ETag")}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        root = ElementTree.Element("CompleteMultipartUpload")
+        for part in MultipartUpload["Parts"]:
+            elem = ElementTree.SubElement(root, "Part")
+            ElementTree.SubElement(elem, "PartNumber").text = str(part["PartNumber"])
+            ElementTree.SubElement(elem, "ETag").text = part["ETag"]
+        response = self._request(
+            "CompleteMultipartUpload",
+            "POST",
+            Bucket,
+            Key,
+            query={"uploadId": UploadId},
+            body=ElementTree.tostring(root),
+        )
+        # S3 can report a failed completion in the body of a 200 response.
+        result = _parse(response.data)
+        if _local_name(result.tag) == "Error":
+            raise _client_error("CompleteMultipartUpload", response)
+        return {"ETag": _text(result, "ETag")}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._request(
+            "AbortMultipartUpload", "DELETE", Bucket, Key, query={"uploadId": UploadId}
+        )
+        return {}
+
+    def pool_stats(self):
+        """
+        Report connection reuse of the underlying pool.
+
+        Returns:
+            dict: Counts of connections opened, reused and dropped.
+        """
+        return self.http.stats.snapshot()
+
+    def _url(self, bucket, key="", query=None):
+        if self.endpoint_url:
+            url = f"{self.endpoint_url.rstrip('/')}/{bucket}/{quote(key)}"
+        else:
+            url = f"https://{bucket}.s3.{self.region_name}.amazonaws.com/{quote(key)}"
+        if query:
+            url += "?" + urlencode(query, quote_via=quote)
+        return url
+
+    def _request(
+        self, operation, method, bucket, key="", query=None, body=None, headers=None
+    ):
+        """
+        Send one signed request.
+
+        Args:
+            operation (str): Operation name reported in errors.
+            method (str): HTTP method.
+            bucket (str): Name of the bucket.
+            key (str, optional): Key of the object. Defaults to ''.
+            query (dict, optional): Query parameters. Defaults to None.
+            body (bytes, optional): Request body. Defaults to None.
+            headers (dict, optional): Headers; None values are left out.
+                Defaults to None.
+
+        Returns:
+            urllib3.BaseHTTPResponse: The response.
+
+        Raises:
+            ClientError: If S3 answers with a status of 300 or more.
+        """
+        url = self._url(bucket, key, query)
+        headers = {
+            name: value for name, value in (headers or {}).items() if value is not None
+        }
+        if self.signer is not None:
+            headers = self.signer.sign(method, url, headers)
+        response = self.http.request(
+            method, url, body=body, headers=headers, redirect=False
+        )
+        if response.status >= 300:
+            raise _client_error(operation, response)
+        return response
+
+
+class MemoryTransport:
+    """
+    An in-process fake of the S3 operations used by S3Dict, for tests.
+
+    Objects live in a dict keyed by (bucket, key). Conditional and ranged
+    GETs, delimiter listings with pagination, batch deletes and multipart
+    uploads behave like S3, errors are raised as ClientError with S3's codes,
+    and `calls` counts the operations made.
+    """
+
+    def __init__(self, page_size=1000):
+        """
+        Initialize an empty store.
+
+        Args:
+            page_size (int, optional): Maximum number of entries per listing
+                page. Defaults to 1000.
+        """
+        self.page_size = page_size
+        self.calls = Counter()
+        self._objects = {}
+        self._metadata = {}
+        self._uploads = {}
+        # Never reused, unlike the number of uploads in progress.
+        self._upload_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None, IfNoneMatch=None):
+        data, etag, modified = self._find("GetObject", Bucket, Key, "NoSuchKey")
+        if IfMatch is not None and IfMatch != etag:
+            raise _error("GetObject", "PreconditionFailed", 412)
+        if IfNoneMatch is not None and IfNoneMatch == etag:
+            raise _error("GetObject", "304", 304)
+        result = {
+            "ETag": etag,
+            "LastModified": modified,
+            "Metadata": self._metadata.get((Bucket, Key), {}),
+        }
+        if Range is not None:
+            start, end = Range[len("bytes=") :].split("-")
+            start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+            result["ContentRange"] = f"bytes {start}-{end}/{len(data)}"
+            data = data[start : end + 1]
+        result["ContentLength"] = len(data)
+        result["Body"] = BytesIO(data)
+        return result
+
+    def head_object(self, Bucket, Key):
+        data, etag, modified = self._find("HeadObject", Bucket, Key, "404")
+        return {
+            "ContentLength": len(data),
+            "ETag": etag,
+            "LastModified": modified,
+            "Metadata": self._metadata.get((Bucket, Key), {}),
+        }
+
+    def put_object(self, Bucket, Key, Body=b"", Metadata=None):
+        self._count("PutObject")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        data = bytes(Body)
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        with self._lock:
+            self._objects[Bucket, Key] = (data, etag, _now())
+            self._metadata[Bucket, Key] = dict(Metadata or {})
+        return {"ETag": etag}
+
+    def delete_object(self, Bucket, Key):
+        self._count("DeleteObject")
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+            self._metadata.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete):
+        self._count("DeleteObjects")
+        with self._lock:
+            for obj in Delete["Objects"]:
+                self._objects.pop((Bucket, obj["Key"]), None)
+                self._metadata.pop((Bucket, obj["Key"]), None)
+        return {"Deleted": [{"Key": obj["Key"]} for obj in Delete["Objects"]]}
+
+    def list_objects_v2(
+        self,
+        Bucket,
+        Prefix="",
+        Delimiter=None,
+        StartAfter=None,
+        ContinuationToken=None,
+        MaxKeys=None,
+    ):
+        self._count("ListObjectsV2")
+        after = ContinuationToken or StartAfter or ""
+        limit = min(MaxKeys or self.page_size, self.page_size)
+        with self._lock:
+            keys = sorted(
+                key
+                for bucket, key in self._objects
+                if bucket == Bucket and key.startswith(Prefix) and key > after
+            )
+            objects = {key: self._objects[Bucket, key] for key in keys}
+        contents, common_prefixes = [], []
+        resume_after = None
+        truncated = False
+        for key in keys:
+            if resume_after is not None and key <= resume_after:
+                continue
+            if len(contents) + len(common_prefixes) == limit:
+                truncated = True
+                break
+            cut = key.find(Delimiter, len(Prefix)) if Delimiter else -1
+            if cut >= 0:
+                common_prefix = key[: cut + len(Delimiter)]
+                common_prefixes.append({"Prefix": common_prefix})
+                # Resume after every key sharing this common prefix.
+                resume_after = common_prefix + "\U0010ffff"
+                continue
+            data, etag, modified = objects[key]
+            contents.append(
+                {"Key": key, "Size": len(data), "ETag": etag, "LastModified": modified}
+            )
+            resume_after = key
+        result = {
+            "IsTruncated": truncated,
+            "KeyCount": len(contents) + len(common_prefixes),
+        }
+        if truncated:
+            result["NextContinuationToken"] = resume_after
+        if contents:
+            result["Contents"] = contents
+        if common_prefixes:
+            result["CommonPrefixes"] = common_prefixes
+        return result
+
+    def create_multipart_upload(self, Bucket, Key, Metadata=None):
+        self._count("CreateMultipartUpload")
+        with self._lock:
+            upload_id = str(next(self._upload_ids))
+            self._uploads[upload_id] = {"metadata": dict(Metadata or {})}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self._count("UploadPart")
+        data = bytes(Body)
+        etag = '"%s"' % hashlib.md5(data).hexdigest()
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = (data, etag)
+        return {"ETag": etag}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self._count("CompleteMultipartUpload")
+        with self._lock:
+            uploaded = self._uploads.pop(UploadId)
+        metadata = uploaded.pop("metadata")
+        parts = [uploaded[part["PartNumber"]] for part in MultipartUpload["Parts"]]
+        data = b"".join(part for part, _ in parts)
+        digest = hashlib.md5(
+            b"".join(bytes.fromhex(etag.strip('"')) for _, etag in parts)
+        )
+        etag = '"%s-%d"' % (digest.hexdigest(), len(parts))
+        with self._lock:
+            self._objects[Bucket, Key] = (data, etag, _now())
+            self._metadata[Bucket, Key] = metadata
+        return {"ETag": etag}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self._count("AbortMultipartUpload")
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def _find(self, operation, bucket, key, missing_code):
+        self._count(operation)
+        with self._lock:
+            found = self._objects.get((bucket, key))
+        if found is None:
+            raise _error(operation, missing_code, 404)
+        return found
+
+    def _count(self, operation):
+        with self._lock:
+            self.calls[operation] += 1
+
+
+def shared_pool_manager(maxsize=10):
+    """
+    Return the process-wide keep-alive connection pool for the given size.
+
+    Transports created with the same concurrency share one pool, so TCP and
+    TLS connections are reused across instances as well as calls.
+
+    Args:
+        maxsize (int, optional): Maximum number of connections kept per host.
+            Requests block for a free connection beyond that. Defaults to 10.
+
+    Returns:
+        CountingPoolManager: Shared pool manager.
+    """
+    with _pool_managers_lock:
+        if maxsize not in _pool_managers:
+            _pool_managers[maxsize] = CountingPoolManager(
+                num_pools=10, maxsize=maxsize, block=True
+            )
+        return _pool_managers[maxsize]
+
+
+class PoolStats:
+    """
+    Thread-safe counters of connections opened, reused and dropped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {"opened": 0, "reused": 0, "dropped": 0}
+
+    def incr(self, name):
+        """
+        Increment a counter.
+
+        Args:
+            name (str): Name of the counter.
+        """
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        """
+        Return a copy of the counters.
+
+        Returns:
+            dict: Current value of each counter.
+        """
+        with self._lock:
+            return dict(self._counts)
+
+
+class _CountingPoolMixin:
+    stats = None
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        if not getattr(conn, "_s3dict_used", False):
+            conn._s3dict_used = True
+            self.stats.incr("opened")
+        elif conn.sock is None:
+            # Closed by the server or after an error; it reconnects on use.
+            self.stats.incr("dropped")
+            self.stats.incr("opened")
+        else:
+            self.stats.incr("reused")
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None and self.pool is not None and self.pool.full():
+            self.stats.incr("dropped")
+        super()._put_conn(conn)
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, urllib3.HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, urllib3.HTTPSConnectionPool):
+    pass
+
+
+class CountingPoolManager(urllib3.PoolManager):
+    """
+    A urllib3 PoolManager whose connection pools record reuse statistics.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        pool = super()._new_pool(scheme, host, port, request_context=request_context)
+        pool.stats = self.stats
+        return pool
+
+
+_META_PREFIX = "x-amz-meta-"
+
+
+def _object_metadata(response):
+    headers = response.headers
+    result = {
+        "ContentLength": int(headers.get("Content-Length", 0)),
+        "ETag": headers.get("ETag"),
+    }
+    if "Last-Modified" in headers:
+        result["LastModified"] = parsedate_to_datetime(headers["Last-Modified"])
+    if "Content-Range" in headers:
+        result["ContentRange"] = headers["Content-Range"]
+    result["Metadata"] = {
+        name.lower()[len(_META_PREFIX) :]: value
+        for name, value in headers.items()
+        if name.lower().startswith(_META_PREFIX)
+    }
+    return result
+
+
+def _metadata_headers(metadata):
+    return {_META_PREFIX + name: value for name, value in (metadata or {}).items()}
+
+
+def _client_error(operation, response):
+    """
+    Build the ClientError botocore would raise for an error response.
+
+    Args:
+        operation (str): Operation name.
+        response (urllib3.BaseHTTPResponse): The error response.
+
+    Returns:
+        ClientError: The error, coded from the XML body or else the status.
+    """
+    code, message = str(response.status), response.reason or ""
+    if response.data:
+        try:
+            root = _parse(response.data)
+        except ElementTree.ParseError:
+            root = None
+        if root is not None and _local_name(root.tag) == "Error":
+            code = _text(root, "Code") or code
+            message = _text(root, "Message") or message
+    return _error(operation, code, response.status, message)
+
+
+def _error(operation, code, status, message=""):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        operation,
+    )
+
+
+def _parse(data):
+    return ElementTree.fromstring(data)
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _text(elem, name):
+    for child in elem:
+        if _local_name(child.tag) == name:
+            return child.text or ""
+    return None
+
+
+def _now():
+    return datetime.now(timezone.utc)
@@ -0,0 +1,187 @@
+import threading
+from collections import OrderedDict
+
+
+class WriteBehindError(Exception):
+    """
+    Raised by `flush` when buffered writes failed.
+
+    Attributes:
+        errors (dict): Exception raised for each key that was not written.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        keys = ", ".join(sorted(errors)[:5])
+        more = f" and {len(errors) - 5} more" if len(errors) > 5 else ""
+        super().__init__(f"{len(errors)} buffered writes failed: {keys}{more}")
+
+
+class WriteBehindBuffer:
+    """
+    A bounded buffer of pending writes uploaded by background workers.
+
+    Writes return as soon as the value is buffered. A key written again
+    before its upload starts is uploaded once, with the latest value, and a
+    key is never uploaded by two workers at once, so writes land in order.
+    When the buffered values reach `max_bytes`, new writes block until
+    uploads free enough room.
+    """
+
+    def __init__(self, upload, max_bytes=64 * 1024 * 1024, max_workers=10):
+        """
+        Initialize the buffer; workers are started on the first write.
+
+        Args:
+            upload (callable): Function called as upload(key, data) from the
+                worker threads.
+            max_bytes (int, optional): Maximum total size of the buffered
+                values. Defaults to 64 MiB.
+            max_workers (int, optional): Number of concurrent uploads.
+                Defaults to 10.
+        """
+        self.max_bytes = max_bytes
+        self.max_workers = max_workers
+        self._upload = upload
+        self._pending = OrderedDict()
+        self._in_flight = {}
+        self._errors = {}
+        self._size = 0
+        self._threads = []
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def add(self, key, data):
+        """
+        Buffer a write, blocking while the buffer is full.
+
+        Args:
+            key (str): Key of the object.
+            data (bytes): Value of the object.
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError("Write buffer is closed")
+            self._start_workers()
+            replaced = len(self._pending.get(key, b""))
+            # A value larger than the whole buffer waits for it to drain.
+            while self._size and self._size - replaced + len(data) > self.max_bytes:
+                self._cond.wait()
+                replaced = len(self._pending.get(key, b""))
+            if key in self._pending:
+                self._size -= len(self._pending.pop(key))
+            self._pending[key] = data
+            self._size += len(data)
+            self._errors.pop(key, None)
+            self._cond.notify_all()
+
+    def get(self, key):
+        """
+        Return the latest buffered value of a key.
+
+        Args:
+            key (str): Key of the object.
+
+        Returns:
+            bytes: The value not yet known to be written, or None.
+        """
+        with self._cond:
+            if key in self._pending:
+                return self._pending[key]
+            return self._in_flight.get(key)
+
+    def discard(self, key):
+        """
+        Drop a pending write and wait for an upload of the key in progress.
+
+        Called before writing or deleting the key directly, so a buffered
+        write cannot land after it.
+
+        Args:
+            key (str): Key of the object.
+        """
+        with self._cond:
+            if key in self._pending:
+                self._size -= len(self._pending.pop(key))
+                self._cond.notify_all()
+            while key in self._in_flight:
+                self._cond.wait()
+            self._errors.pop(key, None)
+
+    def flush(self):
+        """
+        Wait until every buffered write has been uploaded.
+
+        Raises:
+            WriteBehindError: If uploads failed since the last flush.
+        """
+        with self._cond:
+            while self._pending or self._in_flight:
+                self._cond.wait()
+            errors, self._errors = self._errors, {}
+        if errors:
+            raise WriteBehindError(errors)
+
+    def close(self):
+        """
+        Flush the buffer and stop the workers.
+
+        Raises:
+            WriteBehindError: If uploads failed since the last flush.
+        """
+        try:
+            self.flush()
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+            for thread in self._threads:
+                thread.join()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending) + len(self._in_flight)
+
+    def _start_workers(self):
+        if not self._threads:
+            self._threads = [
+                threading.Thread(target=self._work, daemon=True)
+                for _ in range(self.max_workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def _next_write(self):
+        """
+        Wait for a pending key that is not being uploaded and claim it.
+
+        Returns:
+            tuple: Key and data, or None once the buffer is closed.
+        """
+        with self._cond:
+            while True:
+                for key in self._pending:
+                    if key not in self._in_flight:
+                        data = self._in_flight[key] = self._pending.pop(key)
+                        return key, data
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            write = self._next_write()
+            if write is None:
+                return
+            key, data = write
+            error = None
+            try:
+                self._upload(key, data)
+            except Exception as exc:
+                error = exc
+            with self._cond:
+                del self._in_flight[key]
+                self._size -= len(data)
+                if error is not None and key not in self._pending:
+                    self._errors[key] = error
+                self._cond.notify_all()
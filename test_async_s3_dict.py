@@ -0,0 +1,152 @@
+import asyncio
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import ClientError
+
+from logic.async_s3_dict import AsyncS3Dict
+
+
+class FakeBody:
+    def __init__(self, data):
+        self.data = data
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def read(self):
+        return self.data
+
+
+class FakePaginator:
+    def __init__(self, objects, page_size):
+        self.objects = objects
+        self.page_size = page_size
+
+    async def paginate(self, Bucket, Prefix):
+        keys = sorted(key for key in self.objects if key.startswith(Prefix))
+        for i in range(0, len(keys), self.page_size):
+            yield {"Contents": [{"Key": key} for key in keys[i : i + self.page_size]]}
+
+
+class FakeAsyncClient:
+    def __init__(self, delay=0):
+        self.objects = {}
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+        self.fast = set()
+
+    async def _request(self, key):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0 if key in self.fast else self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def get_object(self, Bucket, Key):
+        await self._request(Key)
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": FakeBody(self.objects[Key])}
+
+    async def put_object(self, Bucket, Key, Body):
+        await self._request(Key)
+        self.objects[Key] = Body
+
+    async def delete_object(self, Bucket, Key):
+        await self._request(Key)
+        self.objects.pop(Key, None)
+
+    async def head_object(self, Bucket, Key):
+        await self._request(Key)
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {}
+
+    def get_paginator(self, name):
+        return FakePaginator(self.objects, page_size=3)
+
+
+def make_dict(client, **kwargs):
+    s3_dict = AsyncS3Dict("bucket", "us-east-1", **kwargs)
+    s3_dict._client = client
+    return s3_dict
+
+
+def test_get_put_pop_contains():
+    async def scenario():
+        s3_dict = make_dict(FakeAsyncClient())
+        await s3_dict.put("a", BytesIO(b"1"))
+        assert (await s3_dict.get("a")).read() == b"1"
+        assert await s3_dict.contains("a")
+        assert (await s3_dict.pop("a")).read() == b"1"
+        assert not await s3_dict.contains("a")
+
+    asyncio.run(scenario())
+
+
+def test_contains_raises_other_errors():
+    client = FakeAsyncClient()
+
+    async def forbidden(Bucket, Key):
+        raise ClientError({"Error": {"Code": "403"}}, "HeadObject")
+
+    client.head_object = forbidden
+
+    with pytest.raises(ClientError):
+        asyncio.run(make_dict(client).contains("a"))
+
+
+def test_async_iteration_over_keys():
+    async def scenario():
+        client = FakeAsyncClient()
+        client.objects = {f"k{i}": b"" for i in range(7)}
+        client.objects["other"] = b""
+        s3_dict = make_dict(client)
+        assert [key async for key in s3_dict] == sorted(client.objects)
+        assert [key async for key in s3_dict.keys("k")] == sorted(client.objects)[:7]
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_items_are_bounded_by_max_concurrency(ordered):
+    async def scenario():
+        client = FakeAsyncClient(delay=0.01)
+        client.objects = {f"k{i:02}": str(i).encode() for i in range(20)}
+        s3_dict = make_dict(client, max_concurrency=4)
+        items = [
+            (key, value.read()) async for key, value in s3_dict.items(ordered=ordered)
+        ]
+        if ordered:
+            assert items == sorted(client.objects.items())
+        else:
+            assert sorted(items) == sorted(client.objects.items())
+        assert client.max_in_flight == 4
+
+    asyncio.run(scenario())
+
+
+def test_leaving_items_early_cancels_pending_gets():
+    async def scenario():
+        client = FakeAsyncClient(delay=10)
+        client.objects = {f"k{i:02}": b"" for i in range(20)}
+        client.fast = {"k00"}
+        s3_dict = make_dict(client)
+        items = s3_dict.items(window=5)
+        async for _ in items:
+            break
+        await items.aclose()
+        assert client.cancelled == 4
+        assert client.in_flight == 0
+
+    asyncio.run(scenario())
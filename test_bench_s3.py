@@ -0,0 +1,33 @@
+import json
+
+from logic import bench_s3
+
+
+def test_main_runs_concurrent_multipart_cells(tmp_path):
+    output = tmp_path / "results.json"
+
+    # 9MB is above the multipart threshold, and with more objects than
+    # threads, multipart uploads start while others complete
+    status = bench_s3.main(
+        [
+            "--sizes",
+            "9MB",
+            "--concurrency",
+            "4",
+            "--count",
+            "8",
+            "--repeat",
+            "1",
+            "--output",
+            str(output),
+        ]
+    )
+
+    assert status == 0
+    report = json.loads(output.read_text())
+    assert report["meta"]["count"] == 8
+    cells = {(r["implementation"], r["operation"]) for r in report["results"]}
+    operations = ["put", "get", "contains", "keys", "items", "delete"]
+    assert cells == {(i, o) for i in bench_s3.IMPLEMENTATIONS for o in operations}
+    puts = [r for r in report["results"] if r["operation"] == "put"]
+    assert all(r["size"] == 9 * 1024**2 and r["count"] == 8 for r in puts)
@@ -1,22 +1,26 @@
 from io import BytesIO
-from unittest.mock import MagicMock, patch
+from unittest.mock import ANY, patch
 from urllib import request
 
 import pytest
 
-from logic.logic_urllib import S3Dict
+from logic.logic_urllib import ConnectionPool, Response, S3Dict
 
 
 @pytest.fixture
 def s3_dict():
     return S3Dict(bucket='test-bucket', region='test-region', access_key='test-access-key', secret_key='test-secret-key')
 
+def ok(data=b''):
+    return Response(200, {}, data)
+
+def not_found(url):
+    return request.HTTPError(url, 404, 'Not Found', {}, None)
+
 def test_get(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
+    with patch.object(s3_dict.pool, 'request') as mock_request:
         # Set up the mock response
-        mock_response = MagicMock()
-        mock_response.read.return_value = b'Test data'
-        mock_urlopen.return_value = mock_response
+        mock_request.return_value = ok(b'Test data')
         
         # Call the get method
         result = s3_dict.get('key')
@@ -26,45 +30,37 @@ def test_get(s3_dict):
         assert result.getvalue() == b'Test data'
         
         # Assert that the correct URL was used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/key')
+        mock_request.assert_called_once_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/key', headers=ANY)
 
 def test_put(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
+    with patch.object(s3_dict.pool, 'request') as mock_request:
         # Call the put method
         data_to_put = BytesIO(b'Test data')
         s3_dict.put('key', data_to_put)
         
         # Assert that the correct URL and data were used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/key', data=b'Test data')
+        mock_request.assert_called_once_with('PUT', 'https://test-bucket.s3.test-region.amazonaws.com/key', body=b'Test data', headers=ANY)
 
 def test_pop(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
-        with patch.object(request, 'HTTPError') as mock_http_error:
-            # Set up the mock response
-            mock_response = MagicMock()
-            mock_response.read.return_value = b'Test data'
-            mock_urlopen.return_value = mock_response
-            
-            # Call the pop method
-            result = s3_dict.pop('key')
-            
-            # Assert the result
-            assert isinstance(result, BytesIO)
-            assert result.getvalue() == b'Test data'
-            
-            # Assert that the correct URL was used
-            mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/key')
-            
-            # Assert that the delete method was called
-            mock_http_error.assert_called_once()
-            mock_http_error.assert_called_with().code = 204
+    with patch.object(s3_dict.pool, 'request') as mock_request:
+        # Set up the mock response
+        mock_request.return_value = ok(b'Test data')
+        
+        # Call the pop method
+        result = s3_dict.pop('key')
+        
+        # Assert the result
+        assert isinstance(result, BytesIO)
+        assert result.getvalue() == b'Test data'
+        
+        # Assert that the object was fetched and then deleted
+        assert mock_request.call_args_list[0].args == ('GET', 'https://test-bucket.s3.test-region.amazonaws.com/key')
+        assert mock_request.call_args_list[1].args == ('DELETE', 'https://test-bucket.s3.test-region.amazonaws.com/key')
 
 def test_getitem(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
+    with patch.object(s3_dict.pool, 'request') as mock_request:
         # Set up the mock response
-        mock_response = MagicMock()
-        mock_response.read.return_value = b'Test data'
-        mock_urlopen.return_value = mock_response
+        mock_request.return_value = ok(b'Test data')
         
         # Call the __getitem__ method
         result = s3_dict['key']
@@ -74,34 +70,29 @@ def test_getitem(s3_dict):
         assert result.getvalue() == b'Test data'
         
         # Assert that the correct URL was used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/key')
+        mock_request.assert_called_once_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/key', headers=ANY)
 
 def test_setitem(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
+    with patch.object(s3_dict.pool, 'request') as mock_request:
         # Call the __setitem__ method
         data_to_put = BytesIO(b'Test data')
         s3_dict['key'] = data_to_put
         
         # Assert that the correct URL and data were used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/key', data=b'Test data')
+        mock_request.assert_called_once_with('PUT', 'https://test-bucket.s3.test-region.amazonaws.com/key', body=b'Test data', headers=ANY)
 
 def test_delitem(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
-        with patch.object(request, 'HTTPError') as mock_http_error:
-            # Call the __delitem__ method
-            del s3_dict['key']
-            
-            # Assert that the correct URL was used
-            mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/key')
-            
-            # Assert that the delete method was called
-            mock_http_error.assert_called_once()
-            mock_http_error.assert_called_with().code = 204
+    with patch.object(s3_dict.pool, 'request') as mock_request:
+        # Call the __delitem__ method
+        del s3_dict['key']
+        
+        # Assert that the correct URL was used
+        mock_request.assert_called_once_with('DELETE', 'https://test-bucket.s3.test-region.amazonaws.com/key', headers=ANY)
 
 def test_contains(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
+    with patch.object(s3_dict.pool, 'request') as mock_request:
         # Set up the mock response
-        mock_urlopen.side_effect = [None, request.HTTPError('url', 404, 'Not Found', {}, None)]
+        mock_request.side_effect = [ok(), not_found('url')]
         
         # Check if key exists
         assert 'key' in s3_dict
@@ -110,16 +101,26 @@ def test_contains(s3_dict):
         assert 'nonexistent-key' not in s3_dict
         
         # Assert that the correct URLs were used
-        assert mock_urlopen.call_count == 2
-        mock_urlopen.assert_any_call('https://test-bucket.s3.test-region.amazonaws.com/key')
-        mock_urlopen.assert_any_call('https://test-bucket.s3.test-region.amazonaws.com/nonexistent-key')
+        assert mock_request.call_count == 2
+        mock_request.assert_any_call('HEAD', 'https://test-bucket.s3.test-region.amazonaws.com/key', headers=ANY)
+        mock_request.assert_any_call('HEAD', 'https://test-bucket.s3.test-region.amazonaws.com/nonexistent-key', headers=ANY)
+
+def list_page(keys, next_token=None):
+    contents = ''.join(
+        '<Contents><Key>%s</Key><LastModified>2023-07-12T10:00:00.000Z</LastModified>'
+        '<ETag>&quot;etag&quot;</ETag><Size>3</Size></Contents>' % key for key in keys)
+    token = '<NextContinuationToken>%s</NextContinuationToken>' % next_token if next_token else ''
+    xml = ('<?xml version="1.0" encoding="UTF-8"?>'
+           '<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">'
+           '<Name>test-bucket</Name><IsTruncated>%s</IsTruncated>%s%s</ListBucketResult>'
+           % ('true' if next_token else 'false', contents, token)).encode()
+    # Split the page so the parser has to work across chunk boundaries
+    return (chunk for chunk in [xml[:50], xml[50:]])
 
 def test_keys(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
+    with patch.object(s3_dict.pool, 'iter_chunks') as mock_iter_chunks:
         # Set up the mock response
-        mock_response = MagicMock()
-        mock_response.__iter__.return_value = iter([b'<Key>key1</Key>', b'<Key>key2</Key>'])
-        mock_urlopen.return_value = mock_response
+        mock_iter_chunks.return_value = list_page(['key1', 'key2'])
         
         # Call the keys method
         result = list(s3_dict.keys(prefix='prefix'))
@@ -128,37 +129,147 @@ def test_keys(s3_dict):
         assert result == ['key1', 'key2']
         
         # Assert that the correct URL was used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/?prefix=prefix')
+        mock_iter_chunks.assert_called_once_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/?list-type=2&prefix=prefix', headers=ANY)
+
+def test_keys_follows_continuation_tokens(s3_dict):
+    with patch.object(s3_dict.pool, 'iter_chunks') as mock_iter_chunks:
+        mock_iter_chunks.side_effect = [list_page(['key1', 'key2'], next_token='a b'), list_page(['key3'])]
+
+        result = list(s3_dict.keys(prefix='key', metadata=True))
+
+        assert [entry['Key'] for entry in result] == ['key1', 'key2', 'key3']
+        assert result[0]['Size'] == 3
+        assert result[0]['ETag'] == '"etag"'
+        assert result[0]['LastModified'].year == 2023
+        mock_iter_chunks.assert_called_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/?list-type=2&prefix=key&continuation-token=a%20b', headers=ANY)
 
 def test_items(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
-        # Set up the mock response
-        mock_response = MagicMock()
-        mock_response.__iter__.return_value = iter([b'<Key>key1</Key>', b'<Key>key2</Key>'])
-        mock_urlopen.return_value = mock_response
+    with patch.object(s3_dict.pool, 'iter_chunks') as mock_iter_chunks, \
+            patch.object(s3_dict.pool, 'request') as mock_request:
+        # Set up the mock responses
+        mock_iter_chunks.return_value = list_page(['key1', 'key2'])
+        mock_request.side_effect = lambda method, url, headers: ok(url.rsplit('/', 1)[1].encode())
         
         # Call the items method
-        result = list(s3_dict.items(prefix='prefix'))
+        result = [(key, value.getvalue()) for key, value in s3_dict.items(prefix='prefix')]
         
         # Assert the result
-        assert result == [('key1', s3_dict.get('key1')), ('key2', s3_dict.get('key2'))]
+        assert result == [('key1', b'key1'), ('key2', b'key2')]
         
         # Assert that the correct URL was used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/?prefix=prefix')
+        mock_iter_chunks.assert_called_once_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/?list-type=2&prefix=prefix', headers=ANY)
 
 def test_threaded_items(s3_dict):
-    with patch.object(request, 'urlopen') as mock_urlopen:
-        # Set up the mock response
-        mock_response = MagicMock()
-        mock_response.__iter__.return_value = iter([b'<Key>key1</Key>', b'<Key>key2</Key>'])
-        mock_urlopen.return_value = mock_response
+    with patch.object(s3_dict.pool, 'iter_chunks') as mock_iter_chunks, \
+            patch.object(s3_dict.pool, 'request') as mock_request:
+        # Set up the mock responses
+        mock_iter_chunks.return_value = list_page(['key1', 'key2'])
+        mock_request.side_effect = lambda method, url, headers: ok(url.rsplit('/', 1)[1].encode())
         
         # Call the threaded_items method
-        result = list(s3_dict.threaded_items(prefix='prefix'))
+        result = sorted((key, value.getvalue()) for key, value in s3_dict.threaded_items(prefix='prefix'))
         
         # Assert the result
-        assert result == [('key1', s3_dict.get('key1')), ('key2', s3_dict.get('key2'))]
+        assert result == [('key1', b'key1'), ('key2', b'key2')]
         
         # Assert that the correct URL was used
-        mock_urlopen.assert_called_once_with('https://test-bucket.s3.test-region.amazonaws.com/?prefix=prefix')
+        mock_iter_chunks.assert_called_once_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/?list-type=2&prefix=prefix', headers=ANY)
+
+def test_threaded_items_worker_pool(s3_dict):
+    keys = ['key%d' % i for i in range(100)]
+    with patch.object(s3_dict, 'keys', return_value=iter(keys)), \
+            patch.object(s3_dict, 'get', side_effect=lambda key: BytesIO(key.encode())):
+        result = dict(s3_dict.threaded_items(prefix='key', workers=4, queue_size=8))
+
+    assert sorted(result) == sorted(keys)
+    assert all(value.getvalue() == key.encode() for key, value in result.items())
+
+def test_threaded_items_stops_early(s3_dict):
+    import threading
+
+    keys = ['key%d' % i for i in range(1000)]
+    with patch.object(s3_dict, 'keys', return_value=iter(keys)), \
+            patch.object(s3_dict, 'get', side_effect=lambda key: BytesIO(key.encode())):
+        before = threading.active_count()
+        items = s3_dict.threaded_items(workers=4, queue_size=8)
+        next(items)
+        items.close()
+
+    # Closing the generator joins the listing and worker threads
+    assert threading.active_count() == before
+
+def test_connection_pool_reuses_connections():
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    import threading
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '2')
+            self.end_headers()
+            self.wfile.write(b'ok')
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        pool = ConnectionPool(maxsize=2)
+        for _ in range(5):
+            assert pool.request('GET', 'http://127.0.0.1:%d/key' % server.server_port).data == b'ok'
+        assert pool.stats == {'opened': 1, 'reused': 4, 'dropped': 0}
+        pool.close()
+    finally:
+        server.shutdown()
+
+def test_open_reads_ranges(s3_dict):
+    data = b'0123456789' * 10
+
+    def fake_request(method, url, body=None, headers=None):
+        if method == 'HEAD':
+            return Response(200, {'Content-Length': str(len(data)), 'ETag': '"abc"'}, b'')
+        assert headers['If-Match'] == '"abc"'
+        start, end = map(int, headers['Range'][len('bytes='):].split('-'))
+        return Response(206, {}, data[start:end + 1])
+
+    with patch.object(s3_dict.pool, 'request', side_effect=fake_request):
+        with s3_dict.open('key', buffer_size=16) as f:
+            f.seek(50)
+            assert f.read(5) == b'01234'
+            assert b''.join(f.iter_chunks(7)) == data[55:]
+
+def test_requests_are_signed(s3_dict):
+    with patch.object(s3_dict.pool, 'request') as mock_request:
+        mock_request.return_value = ok()
+        s3_dict.get('key')
+        headers = mock_request.call_args.kwargs['headers']
+        assert headers['Authorization'].startswith('AWS4-HMAC-SHA256 Credential=test-access-key/')
+        assert '/test-region/s3/aws4_request' in headers['Authorization']
+        assert headers['x-amz-content-sha256'] == 'UNSIGNED-PAYLOAD'
+
+def test_requests_without_keys_are_unsigned():
+    s3_dict = S3Dict(bucket='test-bucket', region='test-region', access_key=None, secret_key=None)
+    with patch.object(s3_dict.pool, 'request') as mock_request:
+        mock_request.return_value = ok()
+        s3_dict.get('key')
+        mock_request.assert_called_once_with('GET', 'https://test-bucket.s3.test-region.amazonaws.com/key', headers={})
+
+def test_listing_releases_its_connection_once():
+    from logic.s3_fake_server import FakeS3Server
+    with FakeS3Server() as server:
+        s3_dict = S3Dict(bucket='bucket', region='us-east-1', access_key=None, secret_key=None, endpoint=server.endpoint_url)
+        for key in ('a', 'b', 'c'):
+            s3_dict[key] = BytesIO(key.encode())
+        assert list(s3_dict.keys()) == ['a', 'b', 'c']
+        idle = [conn for conns in s3_dict.pool._idle.values() for conn in conns]
+        assert len(idle) == len(set(map(id, idle))) == 1
+
 
+def test_contains_raises_errors_other_than_not_found(s3_dict):
+    with patch.object(s3_dict.pool, 'request') as mock_request:
+        mock_request.side_effect = request.HTTPError('url', 503, 'Slow Down', {}, None)
+        with pytest.raises(request.HTTPError):
+            'key' in s3_dict
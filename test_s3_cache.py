@@ -0,0 +1,106 @@
+import time
+
+import pytest
+
+from logic.s3_cache import MemoryCache
+
+
+@pytest.fixture
+def cache():
+    return MemoryCache(max_bytes=10, ttl=60)
+
+
+def test_lookup_counts_hits_and_misses(cache):
+    assert cache.lookup("key") is None
+    cache.store("key", b"abc", '"etag"')
+    entry = cache.lookup("key")
+    assert entry.data == b"abc"
+    assert entry.etag == '"etag"'
+    assert entry.fresh
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_evicts_least_recently_used_by_size(cache):
+    cache.store("key1", b"aaaa", '"1"')
+    cache.store("key2", b"bbbb", '"2"')
+    cache.lookup("key1")
+    cache.store("key3", b"cccc", '"3"')
+
+    assert cache.lookup("key2") is None
+    assert cache.lookup("key1").data == b"aaaa"
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] == 8
+
+
+def test_values_larger_than_budget_are_not_cached(cache):
+    cache.store("key", b"x" * 11, '"1"')
+    assert cache.lookup("key") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_stale_entries_can_be_revalidated():
+    cache = MemoryCache(ttl=0.01)
+    cache.store("key", b"abc", '"etag"')
+    time.sleep(0.02)
+
+    assert not cache.lookup("key").fresh
+    cache.revalidated("key")
+    assert cache.lookup("key").fresh
+    assert cache.stats()["stale"] == 1
+    assert cache.stats()["revalidations"] == 1
+
+
+def test_invalidate(cache):
+    cache.store("key", b"abc", '"etag"')
+    cache.invalidate("key")
+    assert cache.lookup("key") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_disk_cache_survives_new_instance(tmp_path):
+    from io import BytesIO
+
+    from logic.s3_cache import DiskCache
+
+    view = DiskCache(tmp_path).store("bucket", "key", '"etag"', BytesIO(b"abc"))
+    assert view.readonly
+    assert bytes(view) == b"abc"
+
+    entry = DiskCache(tmp_path, ttl=60).lookup("bucket", "key")
+    assert bytes(entry.data) == b"abc"
+    assert entry.etag == '"etag"'
+    assert entry.fresh
+
+
+def test_disk_cache_replaces_old_etag_and_invalidates(tmp_path):
+    from io import BytesIO
+
+    from logic.s3_cache import DiskCache
+
+    cache = DiskCache(tmp_path)
+    cache.store("bucket", "key", '"1"', BytesIO(b"old"))
+    cache.store("bucket", "key", '"2"', BytesIO(b"new"))
+    entry = cache.lookup("bucket", "key")
+    assert (bytes(entry.data), entry.etag, entry.fresh) == (b"new", '"2"', False)
+
+    cache.invalidate("bucket", "key")
+    assert cache.lookup("bucket", "key") is None
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    import os
+    from io import BytesIO
+
+    from logic.s3_cache import DiskCache
+
+    cache = DiskCache(tmp_path, max_bytes=8)
+    cache.store("bucket", "key1", '"1"', BytesIO(b"aaaa"))
+    cache.store("bucket", "key2", '"2"', BytesIO(b"bbbb"))
+    # Make key2 the least recently used one
+    os.utime(cache.lookup("bucket", "key2").path, (0, 0))
+    cache.store("bucket", "key3", '"3"', BytesIO(b"cccc"))
+
+    assert cache.lookup("bucket", "key2") is None
+    assert bytes(cache.lookup("bucket", "key1").data) == b"aaaa"
+    assert cache.stats()["evictions"] == 1
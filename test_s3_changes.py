@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+import pytest
+
+from logic import s3_changes, s3_transport
+from logic.s3_changes import Checkpoint
+from logic.s3_dict import S3Dict
+from logic.s3_transport import MemoryTransport
+
+
+@pytest.fixture
+def transport():
+    return MemoryTransport()
+
+
+@pytest.fixture
+def s3_dict(transport):
+    return S3Dict("test_bucket", "us-east-1", transport=transport)
+
+
+def test_items_since_manifest(s3_dict, transport):
+    for key in ("data/a", "data/b", "data/c", "other"):
+        s3_dict[key] = BytesIO(key.encode())
+
+    changes = s3_dict.items("data/", since={})
+    assert [(key, value.read()) for key, value in changes] == [
+        ("data/a", b"data/a"),
+        ("data/b", b"data/b"),
+        ("data/c", b"data/c"),
+    ]
+    assert changes.deleted == []
+    saved = json.dumps(changes.checkpoint.to_dict())
+
+    s3_dict["data/b"] = BytesIO(b"new")
+    s3_dict["data/d"] = BytesIO(b"d")
+    del s3_dict["data/c"]
+    gets = transport.calls["GetObject"]
+    heads = transport.calls["HeadObject"]
+
+    changes = s3_dict.items("data/", since=Checkpoint.from_dict(json.loads(saved)))
+    assert [(key, value.read()) for key, value in changes] == [
+        ("data/b", b"new"),
+        ("data/d", b"d"),
+    ]
+    assert changes.deleted == ["data/c"]
+    # Only the changed objects are fetched, and nothing is HEADed
+    assert transport.calls["GetObject"] == gets + 2
+    assert transport.calls["HeadObject"] == heads
+
+    keys = s3_dict.keys("data/", since=changes.checkpoint)
+    assert list(keys) == []
+    assert keys.deleted == []
+    assert sorted(keys.checkpoint.etags) == ["data/a", "data/b", "data/d"]
+
+
+def test_keys_since_timestamp(s3_dict, monkeypatch):
+    def at(*seconds):
+        return iter(
+            datetime(2024, 1, 1, 0, 0, second, tzinfo=timezone.utc)
+            for second in seconds
+        )
+
+    # Objects written, and listings started, at these seconds
+    monkeypatch.setattr(s3_transport, "_now", at(1, 2, 3, 2, 5).__next__)
+    monkeypatch.setattr(s3_changes, "_now", at(4, 6, 7).__next__)
+    for key in ("a", "b", "c"):
+        s3_dict[key] = BytesIO(b"v")
+
+    # A bare time is inclusive: S3 times have one-second resolution
+    keys = s3_dict.keys(since=datetime(2024, 1, 1, 0, 0, 2))
+    changed = iter(keys)
+    assert next(changed) == "b"
+    # Written during the listing, dated before "c", and not listed
+    s3_dict["a0"] = BytesIO(b"v")
+    assert list(changed) == ["c"]
+    assert keys.checkpoint.modified.second == 2
+    assert sorted(keys.checkpoint.boundary) == ["b", "c"]
+
+    s3_dict["a"] = BytesIO(b"w")
+    keys = s3_dict.keys(since=Checkpoint.from_dict(keys.checkpoint.to_dict()))
+    assert list(keys) == ["a", "a0"]
+    assert keys.deleted == []
+    assert list(s3_dict.keys(since=keys.checkpoint)) == []
+
+
+def test_timestamp_checkpoint_trails_the_listing_start(s3_dict, monkeypatch):
+    listed = datetime(2024, 1, 1, 12, tzinfo=timezone.utc)
+    monkeypatch.setattr(s3_changes, "_now", lambda: listed)
+    monkeypatch.setattr(s3_transport, "_now", lambda: listed - timedelta(minutes=1))
+    s3_dict["a"] = BytesIO(b"v")
+
+    keys = s3_dict.keys(since=datetime(2024, 1, 1))
+    assert list(keys) == ["a"]
+    assert keys.checkpoint.modified == listed - s3_changes.CLOCK_SKEW
+    # Recent objects are remembered by ETag until the checkpoint passes them
+    assert keys.checkpoint.boundary == {"a": s3_dict.metadata("a")["ETag"]}
@@ -0,0 +1,93 @@
+import subprocess
+import sys
+import threading
+
+from logic import s3_clients
+from logic.s3_clients import SharedClient
+
+
+def test_import_and_construction_do_not_load_boto3():
+    # Run in a fresh interpreter, since the test session has boto3 loaded
+    code = (
+        "import sys\n"
+        "from logic.s3_dict import S3Dict\n"
+        "S3Dict('bucket', 'us-east-1')\n"
+        "assert 'boto3' not in sys.modules, 'boto3 imported'\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+def test_clients_are_shared_but_not_across_threads(monkeypatch):
+    s3_clients.clear()
+    created = []
+    first = SharedClient("us-east-1", "key", "secret")
+    second = SharedClient("us-east-1", "key", "secret")
+
+    # Leases are held until both threads are inside a request
+    barrier = threading.Barrier(2)
+
+    class Client:
+        def head_bucket(self, **kwargs):
+            barrier.wait(timeout=5)
+            return self
+
+    def create(self):
+        # Other threads can lease while a client is being created
+        assert s3_clients._lock.acquire(blocking=False)
+        s3_clients._lock.release()
+        client = Client()
+        created.append(client)
+        return client
+
+    monkeypatch.setattr(SharedClient, "_create", create)
+    results = []
+    threads = [
+        threading.Thread(target=lambda c=c: results.append(c.head_bucket()))
+        for c in (first, second)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Concurrent requests get a client each, then both are reused by any
+    # SharedClient with the same settings
+    assert len(created) == 2
+    assert results[0] is not results[1]
+    barrier = threading.Barrier(1)  # head_bucket no longer waits
+    assert first.head_bucket() in created
+    assert second.head_bucket() in created
+    assert len(created) == 2
+    s3_clients.clear()
+
+
+def test_method_lookup_does_not_lease(monkeypatch):
+    s3_clients.clear()
+
+    class Client:
+        meta = "meta"
+
+        def head_bucket(self):
+            return "ok"
+
+    monkeypatch.setattr(SharedClient, "_create", lambda self: Client())
+    client = SharedClient("us-east-1", "key", "secret")
+    assert client.meta == "meta"
+
+    leases = []
+    lease = SharedClient._lease
+    monkeypatch.setattr(
+        SharedClient, "_lease", lambda self: leases.append(1) or lease(self)
+    )
+    head_bucket = client.head_bucket
+    assert leases == []
+    assert head_bucket() == "ok" and len(leases) == 1
+    s3_clients.clear()
+
+
+def test_sessions_are_cached_per_credentials():
+    s3_clients.clear()
+    session = s3_clients.get_session("us-east-1", "key", "secret")
+    assert s3_clients.get_session("us-east-1", "key", "secret") is session
+    assert s3_clients.get_session("us-east-1", "other", "secret") is not session
+    s3_clients.clear()
@@ -0,0 +1,185 @@
+import gzip
+import tracemalloc
+from io import BytesIO
+
+import pytest
+
+from logic import s3_codec
+from logic.s3_codec import (
+    CodecStats,
+    DecodingReader,
+    EncodingReader,
+    GzipCodec,
+    available_codecs,
+    get_codec,
+)
+from logic.s3_dict import S3Dict
+from logic.s3_fake_server import FakeS3Server
+from logic.s3_transport import MemoryTransport, Urllib3Transport
+
+TEXT = b"Bamboo fibers are derived from the bamboo plant. " * 2000
+
+
+@pytest.mark.parametrize("name", available_codecs())
+def test_streaming_round_trip(name):
+    codec = get_codec(name)
+    stats = CodecStats()
+    source = BytesIO(TEXT[1000:])
+
+    encoded = EncodingReader(source, codec, TEXT[:1000], stats).read()
+    decoded = DecodingReader(BytesIO(encoded), codec, stats)
+    chunks = iter(lambda: decoded.read(4096), b"")
+
+    assert b"".join(chunks) == TEXT
+    assert len(encoded) < len(TEXT) / 10
+    counts = stats.snapshot()[name]
+    assert counts["encoded_raw_bytes"] == counts["decoded_raw_bytes"] == len(TEXT)
+    assert counts["encoded_bytes"] == counts["decoded_bytes"] == len(encoded)
+    assert counts["ratio"] == len(TEXT) / len(encoded)
+
+
+def test_gzip_output_is_standard_gzip():
+    encoded = EncodingReader(BytesIO(TEXT), GzipCodec()).read()
+    assert gzip.decompress(encoded) == TEXT
+
+
+@pytest.mark.parametrize("name", available_codecs())
+def test_decoding_is_bounded_by_chunks(name, monkeypatch):
+    monkeypatch.setattr(s3_codec, "CHUNK_SIZE", 4096)
+    codec = get_codec(name)
+    encoded = EncodingReader(BytesIO(TEXT * 10), codec).read()
+    decoded = DecodingReader(BytesIO(encoded), codec)
+
+    # One read expands no more than a chunk, however compressible the data
+    assert len(decoded.read(len(TEXT))) == 4096
+    assert decoded.read(1000) + decoded.read() == (TEXT * 10)[4096:]
+
+
+@pytest.mark.parametrize("name", available_codecs())
+def test_truncated_stream_raises(name):
+    codec = get_codec(name)
+    encoded = EncodingReader(BytesIO(TEXT), codec).read()
+
+    with pytest.raises(EOFError):
+        DecodingReader(BytesIO(encoded[:-10]), codec).read()
+
+
+class Zeros:
+    # A stream of zero bytes that is never held in memory as a whole
+    def __init__(self, size):
+        self.remaining = size
+
+    def read(self, size):
+        size = min(size, self.remaining)
+        self.remaining -= size
+        return bytes(size)
+
+
+@pytest.mark.skipif("zstd" not in available_codecs(), reason="needs zstandard")
+def test_zstd_decoding_memory_is_bounded():
+    codec = get_codec("zstd")
+    size = 64 * 1024 * 1024
+    # Two frames, the first expanding several thousand times
+    encoded = EncodingReader(Zeros(size), codec).read()
+    encoded += EncodingReader(BytesIO(b"tail"), codec).read()
+    assert len(encoded) < size / 1000
+    decoded = DecodingReader(BytesIO(encoded), codec)
+
+    tracemalloc.start()
+    try:
+        total, peak_pending = 0, 0
+        while chunk := decoded.read(64 * 1024):
+            peak_pending = max(peak_pending, len(decoded._pending) + len(chunk))
+            total += len(chunk)
+            last = chunk
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert total == size + 4 and last.endswith(b"tail")
+    assert peak_pending <= s3_codec.CHUNK_SIZE
+    assert peak < 4 * s3_codec.CHUNK_SIZE
+
+
+def test_get_codec():
+    codec = GzipCodec(level=1)
+    assert get_codec(codec) is codec
+    assert get_codec("gzip").name == "gzip"
+    with pytest.raises(ValueError):
+        get_codec("brotli")
+
+
+def test_s3_dict_compresses_values_above_the_threshold():
+    transport = MemoryTransport()
+    s3_dict = S3Dict("bucket", "us-east-1", transport=transport, codec="gzip")
+
+    s3_dict["small"] = BytesIO(b"tiny")
+    s3_dict["text"] = BytesIO(TEXT)
+
+    assert transport.head_object(Bucket="bucket", Key="small")["Metadata"] == {}
+    stored = transport.get_object(Bucket="bucket", Key="text")
+    assert stored["Metadata"] == {"codec": "gzip"}
+    assert gzip.decompress(stored["Body"].read()) == TEXT
+    assert s3_dict["small"].read() == b"tiny"
+    assert s3_dict["text"].read() == TEXT
+    assert s3_dict.open("text").read() == TEXT
+    assert s3_dict.download("text") == TEXT
+    assert dict((k, v.read()) for k, v in s3_dict.items())["text"] == TEXT
+
+    # Readers decompress whatever codec they are configured with
+    plain = S3Dict("bucket", "us-east-1", transport=transport)
+    assert plain["text"].read() == TEXT
+    stats = s3_dict.codec_stats()["gzip"]
+    assert stats["encoded_objects"] == 1 and stats["encoded_raw_bytes"] == len(TEXT)
+    assert stats["decoded_objects"] == 4
+
+    s3_dict.put_raw("raw", BytesIO(TEXT))
+    assert transport.head_object(Bucket="bucket", Key="raw")["Metadata"] == {}
+    assert s3_dict.stream("text").read() == s3_dict.stream("raw").read() == TEXT
+    sizes = {entry["Key"]: entry["Size"] for entry in s3_dict.list_objects()}
+    assert sizes["raw"] == len(TEXT) > sizes["text"]
+
+
+def test_index_keeps_stored_and_raw_sizes():
+    transport = MemoryTransport()
+    s3_dict = S3Dict("bucket", "us-east-1", transport=transport, codec="gzip")
+    s3_dict.build_index()
+    s3_dict["text"] = BytesIO(TEXT)
+    s3_dict["small"] = BytesIO(b"tiny")
+
+    meta = s3_dict.metadata("text")
+    stored = transport.head_object(Bucket="bucket", Key="text")["ContentLength"]
+    assert meta["Size"] == stored < len(TEXT)
+    assert meta["RawSize"] == len(s3_dict["text"].read()) == len(TEXT)
+    assert "RawSize" not in s3_dict.metadata("small")
+
+    s3_dict.put_raw("text", BytesIO(TEXT))
+    meta = s3_dict.metadata("text")
+    assert meta["Size"] == len(TEXT) and "RawSize" not in meta
+
+
+def test_compressed_multipart_upload_over_http(tmp_path):
+    data = TEXT * 80
+    with FakeS3Server() as server:
+        transport = Urllib3Transport(
+            "us-east-1", "access", "secret", endpoint_url=server.endpoint_url
+        )
+        s3_dict = S3Dict(
+            "bucket",
+            "us-east-1",
+            transport=transport,
+            codec="gzip",
+            multipart_threshold=5 * 1024 * 1024,
+            part_size=5 * 1024 * 1024,
+        )
+        s3_dict.put("big", BytesIO(data))
+        # Compressed, it fits in a single PUT
+        assert server.transport.calls["CreateMultipartUpload"] == 0
+
+        s3_dict.codec = GzipCodec(level=0)
+        s3_dict.put("stored", BytesIO(data))
+        assert server.transport.calls["CompleteMultipartUpload"] == 1
+
+        assert s3_dict.get("big").read() == data
+        assert s3_dict.download("stored", tmp_path / "stored") == tmp_path / "stored"
+        assert (tmp_path / "stored").read_bytes() == data
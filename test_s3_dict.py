@@ -2,6 +2,7 @@ import pytest
 from io import BytesIO
 from botocore.exceptions import NoCredentialsError
 from logic.s3_dict import S3Dict
+from logic.s3_retry import RetryingTransport, RetryPolicy
 from unittest.mock import Mock
 
 
@@ -22,28 +23,28 @@ def sample_data():
 
 
 def test_put_and_get_with_mocks(s3_dict, sample_data, monkeypatch):
-    # Mock the put method of the S3 object
-    mock_put = Mock()
-    monkeypatch.setattr(s3_dict.s3.Object, "put", mock_put)
-
-    # Mock the load method of the S3 object
-    mock_load = Mock()
-    monkeypatch.setattr(s3_dict.s3.Object, "load", mock_load)
+    # Mock the S3 client every request goes through
+    mock_client = Mock()
+    mock_client.put_object.return_value = {"ETag": '"etag"'}
+    monkeypatch.setattr(s3_dict, "client", mock_client)
 
     # Put objects in the bucket
     for key, value in sample_data.items():
         s3_dict.put(key, BytesIO(value))
-        mock_put.assert_called_with(Body=BytesIO(value))
+        mock_client.put_object.assert_called_with(
+            Bucket="test_bucket", Key=key, Body=value
+        )
 
     # Get objects from the bucket and assert their content
     for key, value in sample_data.items():
-        mock_load.reset_mock()
-        mock_load.return_value = {"Body": BytesIO(value)}
+        mock_client.get_object.reset_mock()
+        mock_client.get_object.return_value = {"Body": BytesIO(value)}
         obj = s3_dict.get(key)
         assert obj.read() == value
-        mock_load.assert_called()
+        mock_client.get_object.assert_called()
 
     # Test non-existent key
+    mock_client.get_object.side_effect = Exception("NoSuchKey")
     with pytest.raises(Exception):
         s3_dict.get("non_existent_key")
 
@@ -151,3 +152,352 @@ def test_bad_testcases(s3_dict, sample_data):
     # Bad testcase: Accessing items with an invalid prefix
     with pytest.raises(Exception):
         list(s3_dict.items(prefix="invalid"))
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_items_prefetch_window(s3_dict, ordered, monkeypatch):
+    # Track how many gets are running at the same time
+    import threading
+    import time
+
+    keys = ["key%03d" % i for i in range(50)]
+    lock = threading.Lock()
+    state = {"in_flight": 0, "peak": 0}
+
+    def fake_get(key):
+        with lock:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        time.sleep(0.001)
+        with lock:
+            state["in_flight"] -= 1
+        return BytesIO(key.encode())
+
+    monkeypatch.setattr(s3_dict, "keys", lambda prefix="": iter(keys))
+    monkeypatch.setattr(s3_dict, "get", fake_get)
+
+    result = list(s3_dict.items(ordered=ordered, window=4, max_workers=4))
+
+    assert state["peak"] <= 4
+    if ordered:
+        assert [key for key, _ in result] == keys
+    else:
+        assert sorted(key for key, _ in result) == keys
+    assert all(value.read() == key.encode() for key, value in result)
+
+
+class FakeMultipartClient:
+    # Records the multipart calls and fails chosen part numbers a few times
+    def __init__(self, failures=None):
+        self.failures = dict(failures or {})
+        self.parts = {}
+        self.completed = None
+        self.aborted = False
+
+    def create_multipart_upload(self, Bucket, Key):
+        return {"UploadId": "upload-1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        if self.failures.get(PartNumber, 0) > 0:
+            self.failures[PartNumber] -= 1
+            raise ConnectionError("connection reset")
+        self.parts[PartNumber] = Body
+        return {"ETag": '"etag-%d"' % PartNumber}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        self.completed = MultipartUpload["Parts"]
+        return {"ETag": '"multipart-etag"'}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted = True
+
+
+def test_put_multipart_retries_failed_parts(s3_dict, monkeypatch):
+    client = FakeMultipartClient(failures={2: 2})
+    retrying = RetryingTransport(client, RetryPolicy(), sleep=lambda seconds: None)
+    monkeypatch.setattr(s3_dict, "client", retrying)
+    s3_dict.multipart_threshold = s3_dict.part_size = 5 * 1024 * 1024
+    data = bytes(range(256)) * (12 * 1024 * 4)
+
+    s3_dict.put("big", BytesIO(data))
+
+    assert [part["PartNumber"] for part in client.completed] == [1, 2, 3]
+    assert b"".join(client.parts[n] for n in (1, 2, 3)) == data
+    assert not client.aborted
+
+
+def test_put_multipart_aborts_on_failure(s3_dict, monkeypatch):
+    client = FakeMultipartClient(failures={1: 10})
+    retrying = RetryingTransport(client, RetryPolicy(), sleep=lambda seconds: None)
+    monkeypatch.setattr(s3_dict, "client", retrying)
+    s3_dict.multipart_threshold = s3_dict.part_size = 5 * 1024 * 1024
+
+    with pytest.raises(ConnectionError):
+        s3_dict.put("big", BytesIO(b"x" * (6 * 1024 * 1024)))
+
+    assert client.aborted
+    assert client.completed is None
+
+
+class FakeRangeClient:
+    # Serves ranged GETs of `data`, optionally with a different ETag
+    def __init__(self, data, etag='"etag"'):
+        self.data = data
+        self.etag = etag
+
+    def get_object(self, Bucket, Key, Range, IfMatch):
+        start, end = map(int, Range[len("bytes=") :].split("-"))
+        body = self.data[start : end + 1]
+        return {
+            "ETag": self.etag,
+            "ContentLength": len(body),
+            "ContentRange": "bytes %d-%d/%d" % (start, end, len(self.data)),
+            "Body": BytesIO(body),
+        }
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.data), "ETag": '"etag"'}
+
+
+@pytest.mark.parametrize("to_file", [False, True])
+def test_download_parts(s3_dict, monkeypatch, tmp_path, to_file):
+    data = bytes(range(256)) * 1000
+    monkeypatch.setattr(s3_dict, "client", FakeRangeClient(data))
+
+    if to_file:
+        path = s3_dict.download("key", tmp_path / "key", part_size=10000, workers=4)
+        assert path.read_bytes() == data
+    else:
+        assert s3_dict.download("key", part_size=10000, workers=4) == data
+
+
+def test_download_detects_changed_object(s3_dict, monkeypatch):
+    data = b"x" * 1000
+    monkeypatch.setattr(s3_dict, "client", FakeRangeClient(data, '"other"'))
+
+    with pytest.raises(Exception, match="changed during download"):
+        s3_dict.download("key", part_size=100)
+
+
+def test_get_revalidates_stale_cache_entry(s3_dict, monkeypatch):
+    from botocore.exceptions import ClientError
+    from logic.s3_cache import MemoryCache
+
+    s3_dict.cache = MemoryCache(ttl=0)
+    client = Mock()
+    client.get_object.return_value = {"Body": BytesIO(b"cached"), "ETag": '"etag"'}
+    monkeypatch.setattr(s3_dict, "client", client)
+
+    assert s3_dict.get("key").read() == b"cached"
+
+    # The second get sends If-None-Match and gets a 304 without a body
+    client.get_object.side_effect = ClientError(
+        {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"
+    )
+    assert s3_dict.get("key").read() == b"cached"
+    client.get_object.assert_called_with(
+        Bucket="test_bucket", Key="key", IfNoneMatch='"etag"'
+    )
+    assert s3_dict.cache.stats()["revalidations"] == 1
+
+
+def test_delete_many_batches_and_reports_errors(s3_dict, monkeypatch):
+    batches = []
+
+    class FakeDeleteClient:
+        def delete_objects(self, Bucket, Delete):
+            keys = [obj["Key"] for obj in Delete["Objects"]]
+            batches.append(len(keys))
+            errors = [
+                {"Key": key, "Code": "AccessDenied", "Message": "Access Denied"}
+                for key in keys
+                if key == "key0042"
+            ]
+            return {"Errors": errors}
+
+    monkeypatch.setattr(s3_dict, "client", FakeDeleteClient())
+    keys = ["key%04d" % i for i in range(2500)]
+
+    result = s3_dict.delete_many(iter(keys))
+
+    assert sorted(batches) == [500, 1000, 1000]
+    assert result.errors == {"key0042": "AccessDenied: Access Denied"}
+    assert sorted(result.deleted) == [key for key in keys if key != "key0042"]
+
+
+def test_delitem_does_not_download(s3_dict, monkeypatch):
+    client = Mock()
+    monkeypatch.setattr(s3_dict, "client", client)
+
+    del s3_dict["key"]
+
+    client.head_object.assert_called_once_with(Bucket="test_bucket", Key="key")
+    client.delete_object.assert_called_once_with(Bucket="test_bucket", Key="key")
+    client.get_object.assert_not_called()
+
+
+def test_memory_transport_round_trip():
+    from logic.s3_transport import MemoryTransport
+
+    transport = MemoryTransport(page_size=2)
+    s3_dict = S3Dict("test_bucket", "us-east-1", transport=transport)
+    for key in ("a", "b/1", "b/2", "c"):
+        s3_dict[key] = BytesIO(key.encode())
+
+    # Each put is exactly one PutObject request
+    assert transport.calls["PutObject"] == 4
+    assert s3_dict["b/1"].read() == b"b/1"
+    assert list(s3_dict.keys()) == ["a", "b/1", "b/2", "c"]
+    assert list(s3_dict.parallel_keys()) == ["a", "b/1", "b/2", "c"]
+    assert s3_dict.metadata("c")["Size"] == 1
+    assert s3_dict.pop("a").read() == b"a"
+    assert "a" not in s3_dict
+    with pytest.raises(KeyError):
+        del s3_dict["a"]
+
+
+def test_write_behind_buffers_and_flushes():
+    from logic.s3_transport import MemoryTransport
+
+    transport = MemoryTransport()
+    with S3Dict(
+        "test_bucket", "us-east-1", transport=transport, write_behind=True
+    ) as s3_dict:
+        write_buffer = s3_dict.write_buffer
+        for i in range(3):
+            s3_dict["key"] = BytesIO(b"v%d" % i)
+        s3_dict["other"] = BytesIO(b"x")
+        # Pending writes are readable before they are uploaded
+        assert s3_dict["key"].read() == b"v2"
+        assert "other" in s3_dict
+        del s3_dict["other"]
+
+    # "key" is uploaded at most twice (v0 may start before v1 and v2 are
+    # coalesced) and "other" at most once, depending on worker timing
+    assert transport.calls["PutObject"] <= 3
+    assert list(s3_dict.keys()) == ["key"]
+    assert s3_dict.get("key").read() == b"v2"
+    # Leaving the block stops the workers; later writes go straight out
+    assert not any(thread.is_alive() for thread in write_buffer._threads)
+    s3_dict["late"] = BytesIO(b"y")
+    assert "late" in s3_dict
+
+
+def test_metrics_are_opt_in():
+    from logic.s3_metrics import Metrics
+    from logic.s3_transport import MemoryTransport
+
+    transport = MemoryTransport()
+    assert S3Dict("test_bucket", "us-east-1", transport=transport).stats() == {}
+
+    s3_dict = S3Dict("test_bucket", "us-east-1", transport=transport, metrics=Metrics())
+    s3_dict["key"] = BytesIO(b"value")
+    assert s3_dict["key"].read() == b"value"
+    assert "other" not in s3_dict
+    del s3_dict["key"]
+
+    stats = s3_dict.stats()
+    assert stats["put"]["bytes_out"] == 5
+    assert stats["get"]["bytes_in"] == 5
+    assert stats["head"]["not_found"] == 1
+    assert stats["delete"]["requests"] == 1
+
+
+def test_contains_raises_errors_other_than_missing_keys(s3_dict, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    client = Mock()
+    monkeypatch.setattr(s3_dict, "client", client)
+    client.head_object.side_effect = ClientError(
+        {"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject"
+    )
+    assert "key" not in s3_dict
+
+    client.head_object.side_effect = ClientError(
+        {"Error": {"Code": "403", "Message": "Forbidden"}}, "HeadObject"
+    )
+    with pytest.raises(ClientError):
+        "key" in s3_dict
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_items_map(ordered):
+    from logic.s3_transport import MemoryTransport
+
+    s3_dict = S3Dict("test_bucket", "us-east-1", transport=MemoryTransport())
+    values = {"data/%02d" % i: b"x" * (i * 100) for i in range(12)}
+    for key, value in values.items():
+        s3_dict[key] = BytesIO(value)
+    s3_dict["other"] = BytesIO(b"y")
+
+    # Bodies from 500 bytes go through shared memory, smaller ones are pickled
+    result = list(
+        s3_dict.items_map(
+            len,
+            prefix="data/",
+            cpu_workers=2,
+            ordered=ordered,
+            shared_memory_threshold=500,
+        )
+    )
+
+    if ordered:
+        assert [key for key, _ in result] == sorted(values)
+    assert dict(result) == {key: len(value) for key, value in values.items()}
+
+
+def test_unordered_transforms_are_yielded_as_they_finish():
+    from concurrent.futures import ThreadPoolExecutor
+    from threading import Event
+    from logic.s3_dict import _prefetch_transforms
+
+    release = Event()
+    with ThreadPoolExecutor(max_workers=2) as workers:
+
+        def transform(key):
+            if key == "slow":
+                return workers.submit(lambda: release.wait() and key)
+            return workers.submit(lambda: key)
+
+        results = _prefetch_transforms(transform, ["slow", "fast"], 2, 2)
+        # "fast" does not wait behind the transform of "slow"
+        assert next(results) == ("fast", "fast")
+        release.set()
+        assert list(results) == [("slow", "slow")]
+
+
+def test_download_to_file_failure_keeps_destination(s3_dict, monkeypatch, tmp_path):
+    class FailingRangeClient(FakeRangeClient):
+        def get_object(self, Bucket, Key, Range, IfMatch):
+            if Range.startswith("bytes=20000-"):
+                raise ConnectionResetError("reset")
+            return super().get_object(Bucket, Key, Range, IfMatch)
+
+    monkeypatch.setattr(s3_dict, "client", FailingRangeClient(b"x" * 50000))
+    dest = tmp_path / "key"
+    dest.write_bytes(b"previous")
+
+    # The part's error surfaces, and the previous file is left untouched
+    with pytest.raises(ConnectionResetError):
+        s3_dict.download("key", dest, part_size=10000, workers=4)
+    assert dest.read_bytes() == b"previous"
+    assert [path.name for path in tmp_path.iterdir()] == ["key"]
+
+
+def test_refresh_index_picks_up_keys_before_local_writes():
+    from logic.s3_transport import MemoryTransport
+
+    transport = MemoryTransport()
+    s3_dict = S3Dict("test_bucket", "us-east-1", transport=transport)
+    other = S3Dict("test_bucket", "us-east-1", transport=transport)
+    with pytest.raises(ValueError):
+        s3_dict.refresh_index()
+
+    s3_dict["log/1"] = BytesIO(b"1")
+    s3_dict.build_index("log/")
+    # Written through to the index, past the key the other writer adds
+    s3_dict["log/3"] = BytesIO(b"3")
+    other["log/2"] = BytesIO(b"2")
+
+    s3_dict.refresh_index()
+    assert list(s3_dict.keys("log/")) == ["log/1", "log/2", "log/3"]
@@ -0,0 +1,70 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from logic.s3_index import KeyIndex
+
+MODIFIED = datetime(2023, 7, 12, tzinfo=timezone.utc)
+
+
+def entry(key, size=1, etag='"etag"'):
+    return {"Key": key, "Size": size, "ETag": etag, "LastModified": MODIFIED}
+
+
+@pytest.fixture
+def index():
+    index = KeyIndex(prefix="data/")
+    index.load([entry("data/a", 1), entry("data/b/1", 2), entry("data/b/2", 3)])
+    return index
+
+
+def test_contains_and_len(index):
+    assert "data/a" in index
+    assert "data/c" not in index
+    assert len(index) == 3
+
+
+def test_keys_by_prefix(index):
+    assert index.keys("data/b/") == ["data/b/1", "data/b/2"]
+    assert index.keys() == ["data/a", "data/b/1", "data/b/2"]
+    assert index.keys("data/z") == []
+
+
+def test_metadata(index):
+    assert index.metadata("data/b/2") == {
+        "Size": 3,
+        "ETag": '"etag"',
+        "LastModified": MODIFIED,
+    }
+    assert index.metadata("missing") is None
+
+
+def test_write_through_keeps_order(index):
+    index.add("data/0", 5, '"new"', MODIFIED)
+    index.add("data/a", 7, '"changed"', MODIFIED)
+    index.discard("data/b/1")
+
+    assert index.keys() == ["data/0", "data/a", "data/b/2"]
+    assert index.metadata("data/a")["Size"] == 7
+    assert index.last_key == "data/b/2"
+
+
+def test_write_through_does_not_move_listing_position(index):
+    index.add("data/z", 1, '"local"', MODIFIED)
+    assert index.last_key == "data/z"
+    assert index.last_listed == "data/b/2"
+    index.extend([entry("data/c")])
+    assert index.last_listed == "data/c"
+
+
+def test_extend_with_incremental_listing(index):
+    index.extend([entry("data/c"), entry("data/d")])
+    assert index.keys() == ["data/a", "data/b/1", "data/b/2", "data/c", "data/d"]
+
+
+def test_staleness(index):
+    assert index.covers("data/x")
+    assert not index.covers("other")
+    assert not index.is_stale()
+    index.max_staleness = -1
+    assert index.is_stale()
@@ -0,0 +1,117 @@
+import pytest
+
+from logic.s3_listing import ParallelListing
+
+
+class FakeListClient:
+    # A minimal ListObjectsV2 over sorted keys, with tiny pages, counting a
+    # common prefix as one entry like S3 does
+    def __init__(self, keys, page_size=3):
+        self.keys = sorted(keys)
+        self.page_size = page_size
+
+    def list_objects_v2(
+        self,
+        Bucket,
+        Prefix="",
+        Delimiter=None,
+        StartAfter="",
+        ContinuationToken=None,
+        MaxKeys=None,
+    ):
+        after = ContinuationToken or StartAfter
+        limit = min(MaxKeys or self.page_size, self.page_size)
+        entries = []
+        for key in self.keys:
+            if not key.startswith(Prefix) or key <= after:
+                continue
+            if Delimiter and Delimiter in key[len(Prefix) :]:
+                common_prefix = key[: key.index(Delimiter, len(Prefix)) + 1]
+                if entries and entries[-1] == ("prefix", common_prefix):
+                    continue
+                if len(entries) == limit:
+                    break
+                entries.append(("prefix", common_prefix))
+                after = common_prefix + "\U0010ffff"
+                continue
+            if len(entries) == limit:
+                break
+            entries.append(("key", key))
+        else:
+            return self._page(entries, None)
+        last = entries[-1][1]
+        return self._page(entries, last if entries[-1][0] == "key" else after)
+
+    def _page(self, entries, token):
+        result = {
+            "Contents": [{"Key": key} for kind, key in entries if kind == "key"],
+            "CommonPrefixes": [
+                {"Prefix": prefix} for kind, prefix in entries if kind == "prefix"
+            ],
+            "IsTruncated": token is not None,
+        }
+        if token is not None:
+            result["NextContinuationToken"] = token
+        return result
+
+
+KEYS = ["logs/%s/%02d" % (day, i) for day in ("a", "b", "c") for i in range(10)] + [
+    "logs/readme",
+]
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_shards_on_common_prefixes(ordered):
+    listing = ParallelListing(
+        FakeListClient(KEYS), "bucket", "logs/", ordered=ordered, max_workers=2
+    )
+    result = list(listing)
+
+    if ordered:
+        assert result == sorted(KEYS)
+    else:
+        assert sorted(result) == sorted(KEYS)
+    # One discovery page holding the 3 common prefixes, then 4 pages for
+    # each of them and one for the rest of the prefix after them
+    assert listing.requests == 1 + 3 * 4 + 1
+
+
+def test_shards_on_boundaries():
+    listing = ParallelListing(
+        FakeListClient(KEYS), "bucket", "logs/", boundaries=["logs/a/05", "logs/b/09"]
+    )
+    assert list(listing) == sorted(KEYS)
+
+
+def test_shards_by_character_without_common_prefixes():
+    keys = ["file-%s%d" % (c, i) for c in "09AZaz" for i in range(3)]
+    listing = ParallelListing(FakeListClient(keys), "bucket", "file-", shards=4)
+    assert list(listing) == sorted(keys)
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+def test_discovery_lists_one_page_and_shards_the_rest(ordered):
+    keys = ["a-loose"] + [
+        "%s/%02d" % (day, i) for day in ("a", "b", "c", "d") for i in range(3)
+    ]
+    keys += ["z-loose"]
+    listing = ParallelListing(
+        FakeListClient(keys, page_size=3), "bucket", "", ordered=ordered
+    )
+    result = list(listing)
+
+    if ordered:
+        assert result == sorted(keys)
+    else:
+        assert sorted(result) == sorted(keys)
+    # The probe page holds a-loose, a/ and b/; a/ and b/ take a page each,
+    # and the 7 keys after b/ are one more shard of 3 pages
+    assert listing.requests == 1 + 1 + 1 + 3
+
+
+def test_flat_keyspace_is_not_listed_twice():
+    keys = ["file-%02d" % i for i in range(30)]
+    listing = ParallelListing(FakeListClient(keys), "bucket", "", shards=1)
+    assert list(listing) == keys
+    # One probe page, then the single shard's 10 pages
+    assert listing.requests == 1 + 10
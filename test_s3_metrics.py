@@ -0,0 +1,77 @@
+from io import BytesIO
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from logic.s3_metrics import InstrumentedTransport, Metrics, OperationEvent
+from logic.s3_transport import MemoryTransport
+
+
+def test_requests_are_counted_per_operation():
+    events = []
+    metrics = Metrics(callbacks=[events.append])
+    client = InstrumentedTransport(MemoryTransport(), metrics)
+
+    client.put_object(Bucket="b", Key="k", Body=BytesIO(b"12345"))
+    client.get_object(Bucket="b", Key="k")["Body"].read()
+    client.list_objects_v2(Bucket="b")
+    with pytest.raises(ClientError):
+        client.head_object(Bucket="b", Key="missing")
+
+    stats = metrics.snapshot()
+    assert stats["put"]["bytes_out"] == 5
+    assert stats["get"]["bytes_in"] == 5
+    assert stats["list"]["requests"] == 1
+    assert stats["head"]["not_found"] == 1 and stats["head"]["errors"] == 0
+    assert all(op["in_flight"] == 0 for op in stats.values())
+    assert [event.method for event in events] == [
+        "put_object",
+        "get_object",
+        "list_objects_v2",
+        "head_object",
+    ]
+    # Non-request attributes are passed through
+    assert client.calls["PutObject"] == 1
+
+
+def test_errors_retries_and_in_flight():
+    metrics = Metrics()
+    client = Mock()
+    client.delete_object.side_effect = ClientError(
+        {
+            "Error": {"Code": "SlowDown", "Message": "Slow"},
+            "ResponseMetadata": {"RetryAttempts": 4},
+        },
+        "DeleteObject",
+    )
+
+    def get_object(**kwargs):
+        assert metrics.snapshot()["get"]["in_flight"] == 1
+        return {"ContentLength": 3, "ResponseMetadata": {"RetryAttempts": 1}}
+
+    client.get_object.side_effect = get_object
+    wrapped = InstrumentedTransport(client, metrics)
+
+    wrapped.get_object(Bucket="b", Key="k")
+    with pytest.raises(ClientError):
+        wrapped.delete_object(Bucket="b", Key="k")
+
+    stats = metrics.snapshot()
+    assert stats["get"]["retries"] == 1 and stats["get"]["in_flight"] == 0
+    assert stats["delete"]["errors"] == 1 and stats["delete"]["retries"] == 4
+
+
+def test_histogram_and_percentiles():
+    metrics = Metrics(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.005, 0.05, 0.5):
+        metrics.started("get")
+        metrics.finished(OperationEvent("get", "get_object", seconds, 0, 0, None, 0))
+
+    stats = metrics.snapshot()["get"]
+    assert stats["histogram"] == [[0.01, 2], [0.1, 1], [None, 1]]
+    assert stats["p50"] == 0.01
+    assert stats["p99"] == stats["max_seconds"] == 0.5
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
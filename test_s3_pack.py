@@ -0,0 +1,95 @@
+from io import BytesIO
+
+import pytest
+
+from logic.s3_dict import S3Dict
+from logic.s3_transport import MemoryTransport
+
+
+@pytest.fixture
+def transport():
+    return MemoryTransport()
+
+
+def open_pack(transport, **kwargs):
+    return S3Dict("bucket", "us-east-1", transport=transport).packed(**kwargs)
+
+
+def stored_keys(transport):
+    page = transport.list_objects_v2(Bucket="bucket")
+    return [obj["Key"] for obj in page.get("Contents", [])]
+
+
+def test_batches_values_into_one_shard(transport):
+    pack = open_pack(transport)
+    for i in range(100):
+        pack[f"key{i:03d}"] = BytesIO(b"value %d" % i)
+    # Pending values are readable before they are flushed
+    assert pack["key007"].read() == b"value 7"
+    assert stored_keys(transport) == []
+
+    pack.flush()
+
+    shards = [key for key in stored_keys(transport) if key.endswith(".pack")]
+    segments = [key for key in stored_keys(transport) if key.endswith(".idx")]
+    assert len(shards) == len(segments) == 1
+    gets = transport.calls["GetObject"]
+    assert pack["key042"].read() == b"value 42"
+    assert transport.calls["GetObject"] == gets + 1
+    assert "key099" in pack and "missing" not in pack
+    assert pack.keys("key00") == [f"key00{i}" for i in range(10)]
+    assert len(pack) == 100
+    with pytest.raises(KeyError):
+        pack["missing"]
+
+
+def test_index_is_reloaded_with_overwrites_and_tombstones(transport):
+    with open_pack(transport) as pack:
+        pack["a"] = BytesIO(b"1")
+        pack["b"] = BytesIO(b"2")
+    with open_pack(transport) as pack:
+        pack["a"] = BytesIO(b"one")
+        del pack["b"]
+        with pytest.raises(KeyError):
+            del pack["b"]
+
+    pack = open_pack(transport)
+    assert pack.keys() == ["a"]
+    assert pack["a"].read() == b"one"
+    assert dict((k, v.read()) for k, v in pack.items()) == {"a": b"one"}
+
+
+def test_full_batch_is_flushed(transport):
+    pack = open_pack(transport, shard_size=10)
+    pack["a"] = BytesIO(b"12345")
+    assert stored_keys(transport) == []
+    pack["b"] = BytesIO(b"67890")
+    assert len(stored_keys(transport)) == 2
+
+
+def test_compaction_rewrites_sparse_shards(transport):
+    with open_pack(transport) as pack:
+        pack["kept"] = BytesIO(b"k" * 100)
+        pack["gone"] = BytesIO(b"g" * 100)
+    with open_pack(transport) as pack:
+        for i in range(10):
+            pack[f"x{i}"] = BytesIO(b"x" * 100)
+    with open_pack(transport) as pack:
+        # Leaves the second shard sparse, with a tombstone for a key of the
+        # first, which stays dense enough to be kept
+        for i in range(9):
+            del pack[f"x{i}"]
+        del pack["gone"]
+        pack.flush()
+
+        result = pack.compact(min_live_ratio=0.5)
+
+        # The 900 bytes of deleted values; x9 was copied, not freed
+        assert result == {"shards": 1, "bytes": 900}
+        assert pack.stats()["shards"] == 2
+    assert len([key for key in stored_keys(transport) if key.endswith(".pack")]) == 2
+
+    pack = open_pack(transport)
+    assert pack.keys() == ["kept", "x9"]
+    assert pack["x9"].read() == b"x" * 100
+    assert "gone" not in pack
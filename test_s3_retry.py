@@ -0,0 +1,136 @@
+import threading
+from io import BytesIO
+
+import pytest
+from botocore.exceptions import ClientError, NoCredentialsError
+
+from logic.s3_dict import S3Dict
+from logic.s3_fake_server import FakeS3Server
+from logic.s3_retry import AdaptiveConcurrency, RetryingTransport, RetryPolicy
+from logic.s3_transport import Urllib3Transport
+
+
+def client_error(code, status):
+    return ClientError(
+        {
+            "Error": {"Code": code, "Message": code},
+            "ResponseMetadata": {"HTTPStatusCode": status},
+        },
+        "GetObject",
+    )
+
+
+class FlakyClient:
+    # Fails each call with the next queued error, then succeeds
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.bodies = []
+
+    def put_object(self, Bucket, Key, Body):
+        self.bodies.append(Body.read())
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"ETag": '"etag"'}
+
+
+def test_policy_separates_retryable_errors_from_missing_keys():
+    policy = RetryPolicy()
+    assert policy.is_retryable(client_error("SlowDown", 503))
+    assert policy.is_throttle(client_error("SlowDown", 503))
+    assert policy.is_retryable(client_error("InternalError", 500))
+    assert not policy.is_throttle(client_error("InternalError", 500))
+    assert policy.is_retryable(ConnectionResetError())
+    for error in (
+        client_error("NoSuchKey", 404),
+        client_error("404", 404),
+        client_error("PreconditionFailed", 412),
+        client_error("AccessDenied", 403),
+        NoCredentialsError(),
+        ValueError(),
+    ):
+        assert not policy.is_retryable(error)
+    for attempt in range(1, 10):
+        assert 0 <= policy.backoff(attempt) <= min(5.0, 0.05 * 2 ** (attempt - 1))
+
+
+def test_transport_retries_and_rewinds_the_body():
+    client = FlakyClient(client_error("SlowDown", 503), ConnectionResetError())
+    delays = []
+    transport = RetryingTransport(client, RetryPolicy(), sleep=delays.append)
+
+    response = transport.put_object(Bucket="b", Key="k", Body=BytesIO(b"data"))
+
+    assert client.bodies == [b"data"] * 3
+    assert response["ResponseMetadata"]["RetryAttempts"] == 2
+    assert len(delays) == 2
+
+
+def test_transport_gives_up_and_does_not_retry_missing_keys():
+    client = FlakyClient(*[client_error("SlowDown", 503)] * 3)
+    transport = RetryingTransport(
+        client, RetryPolicy(max_attempts=3), sleep=lambda seconds: None
+    )
+    with pytest.raises(ClientError) as error:
+        transport.put_object(Bucket="b", Key="k", Body=BytesIO(b""))
+    assert error.value.response["ResponseMetadata"]["RetryAttempts"] == 2
+
+    client = FlakyClient(client_error("NoSuchKey", 404))
+    transport = RetryingTransport(client, RetryPolicy(), sleep=lambda seconds: None)
+    with pytest.raises(ClientError):
+        transport.put_object(Bucket="b", Key="k", Body=BytesIO(b""))
+    assert len(client.bodies) == 1
+
+
+def test_adaptive_concurrency_is_aimd():
+    concurrency = AdaptiveConcurrency(maximum=8, initial=4)
+    sequences = [concurrency.acquire() for _ in range(4)]
+    blocked = threading.Thread(target=concurrency.acquire)
+    blocked.start()
+    blocked.join(0.05)
+    assert blocked.is_alive()
+
+    # Throttles of requests sent together cut the limit once
+    for sequence in sequences:
+        concurrency.release()
+        concurrency.throttled(sequence)
+    blocked.join(5)
+    assert concurrency.limit == 2
+    concurrency.release()
+
+    # A full window of successes raises it by one
+    for _ in range(2):
+        concurrency.succeeded()
+    assert concurrency.limit == 3
+    concurrency.throttled(concurrency.acquire())
+    concurrency.release()
+    assert concurrency.limit == 1
+    concurrency.throttled(concurrency.acquire())
+    concurrency.release()
+    assert concurrency.limit == 1
+
+
+def test_bulk_operations_back_off_when_throttled():
+    with FakeS3Server(latency=0.005, max_in_flight=2) as server:
+        for i in range(40):
+            server.transport.put_object(
+                Bucket="bucket", Key=f"k{i:02d}", Body=b"%d" % i
+            )
+        transport = Urllib3Transport(
+            "us-east-1", "access", "secret", 8, endpoint_url=server.endpoint_url
+        )
+        s3_dict = S3Dict(
+            "bucket",
+            "us-east-1",
+            max_workers=8,
+            transport=transport,
+            retry_policy=RetryPolicy(max_attempts=8, base_delay=0.005),
+            adaptive_concurrency=True,
+        )
+
+        values = {key: value.read() for key, value in s3_dict.items()}
+        assert values == {f"k{i:02d}": b"%d" % i for i in range(40)}
+        assert server.throttled > 0
+        assert s3_dict.concurrency.limit < 8
+
+        result = s3_dict.clear()
+        assert len(result.deleted) == 40 and not result.errors
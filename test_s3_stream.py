@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+from logic.s3_stream import RangeReader
+
+
+@pytest.fixture
+def data():
+    return bytes(range(256)) * 40
+
+
+@pytest.fixture
+def requests():
+    return []
+
+
+@pytest.fixture
+def reader(data, requests):
+    def fetch(start, end):
+        requests.append((start, end))
+        return data[start : end + 1]
+
+    return RangeReader(fetch, len(data), buffer_size=1024)
+
+
+def test_read_all(reader, data):
+    assert reader.read() == data
+    assert reader.read(10) == b""
+
+
+def test_small_reads_use_read_ahead_buffer(reader, data, requests):
+    assert reader.read(10) == data[:10]
+    assert reader.read(10) == data[10:20]
+    assert requests == [(0, 1023)]
+
+
+def test_large_reads_bypass_buffer(reader, data, requests):
+    assert reader.read(5000) == data[:5000]
+    assert requests == [(0, 4999)]
+
+
+def test_seek_only_fetches_needed_range(reader, data, requests):
+    reader.seek(-100, io.SEEK_END)
+    assert reader.read() == data[-100:]
+    assert requests == [(len(data) - 100, len(data) - 1)]
+    reader.seek(5)
+    reader.seek(5, io.SEEK_CUR)
+    assert reader.tell() == 10
+    assert reader.read(3) == data[10:13]
+
+
+def test_readinto(reader, data):
+    buffer = bytearray(100)
+    assert reader.readinto(buffer) == 100
+    assert bytes(buffer) == data[:100]
+
+
+def test_iter_chunks(reader, data):
+    chunks = list(reader.iter_chunks(3000))
+    assert [len(chunk) for chunk in chunks] == [3000, 3000, 3000, 1240]
+    assert b"".join(chunks) == data
+
+
+def test_buffered_text_wrapper(data):
+    text = b"line 1\nline 2\n"
+    reader = RangeReader(lambda start, end: text[start : end + 1], len(text))
+    assert io.TextIOWrapper(io.BufferedReader(reader)).readlines() == [
+        "line 1\n",
+        "line 2\n",
+    ]
@@ -0,0 +1,157 @@
+import os
+from io import BytesIO
+
+import pytest
+
+from logic import s3_sync
+from logic.s3_dict import S3Dict
+from logic.s3_transport import MemoryTransport
+
+
+@pytest.fixture
+def s3_dict():
+    return S3Dict("test_bucket", "us-east-1", transport=MemoryTransport())
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
+
+def test_upload_transfers_only_changes(s3_dict, tmp_path):
+    write(tmp_path / "a.txt", b"alpha")
+    write(tmp_path / "sub" / "b.txt", b"beta")
+    s3_dict["dir/extra"] = BytesIO(b"extra")
+
+    result = s3_dict.sync(tmp_path, "dir/", dry_run=True)
+    assert result.transferred == ["a.txt", "sub/b.txt"]
+    assert result.bytes == 9 and result.dry_run
+    assert list(s3_dict.keys("dir/")) == ["dir/extra"]
+
+    result = s3_dict.sync(tmp_path, "dir/")
+    assert result.transferred == ["a.txt", "sub/b.txt"]
+    assert s3_dict["dir/sub/b.txt"].read() == b"beta"
+    assert not (tmp_path / s3_sync.HASH_CACHE_NAME).exists()
+
+    # Same size, new content: caught by the ETag
+    write(tmp_path / "a.txt", b"ALPHA")
+    result = s3_dict.sync(tmp_path, "dir/", delete=True)
+    assert result.transferred == ["a.txt"]
+    assert result.deleted == ["extra"]
+    assert result.unchanged == 1
+    assert s3_dict["dir/a.txt"].read() == b"ALPHA"
+    # The hash cache written by this run is not uploaded
+    assert (tmp_path / s3_sync.HASH_CACHE_NAME).exists()
+    assert list(s3_dict.keys("dir/")) == ["dir/a.txt", "dir/sub/b.txt"]
+
+
+def test_multipart_etags_and_hash_cache(tmp_path, monkeypatch):
+    s3_dict = S3Dict(
+        "test_bucket",
+        "us-east-1",
+        transport=MemoryTransport(),
+        multipart_threshold=5 * 1024 * 1024,
+        part_size=5 * 1024 * 1024,
+    )
+    write(tmp_path / "big", os.urandom(6 * 1024 * 1024))
+    s3_dict.sync(tmp_path)
+    assert s3_dict.metadata("big")["ETag"].endswith('-2"')
+
+    hashed = []
+    s3_etag = s3_sync.s3_etag
+    monkeypatch.setattr(
+        s3_sync, "s3_etag", lambda *args: hashed.append(args) or s3_etag(*args)
+    )
+    assert s3_dict.sync(tmp_path).transferred == []
+    assert s3_dict.sync(tmp_path).transferred == []
+    # Hashed once in parts, then answered from the cache
+    assert len(hashed) == 1 and hashed[0][1] == 5 * 1024 * 1024
+
+
+def test_download_by_mtime(s3_dict, tmp_path):
+    s3_dict["dir/a"] = BytesIO(b"alpha")
+    s3_dict["dir/b/c"] = BytesIO(b"gamma")
+    write(tmp_path / "stale", b"old")
+
+    result = s3_dict.sync(
+        tmp_path, "dir/", direction="download", compare="mtime", delete=True
+    )
+    assert result.transferred == ["a", "b/c"]
+    assert result.deleted == ["stale"]
+    assert (tmp_path / "b" / "c").read_bytes() == b"gamma"
+    assert not (tmp_path / "stale").exists()
+
+    # Downloaded files carry the objects' times, so nothing is newer
+    result = s3_dict.sync(tmp_path, "dir/", direction="download", compare="mtime")
+    assert result.transferred == [] and result.unchanged == 2
+
+    s3_dict["dir/a"] = BytesIO(b"ALPHA")
+    os.utime(tmp_path / "a", ns=(0, 0))
+    result = s3_dict.sync(tmp_path, "dir/", direction="download", compare="mtime")
+    assert result.transferred == ["a"]
+    assert (tmp_path / "a").read_bytes() == b"ALPHA"
+
+
+def test_download_refuses_paths_outside_the_directory(s3_dict, tmp_path):
+    local_dir = tmp_path / "local"
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    local_dir.mkdir()
+    (local_dir / "link").symlink_to(outside, target_is_directory=True)
+    for key in ("dir/a", "dir/../escaped", "dir/b//c", "dir/link/x"):
+        s3_dict[key] = BytesIO(b"v")
+
+    result = s3_dict.sync(local_dir, "dir/", direction="download", delete=True)
+
+    assert result.transferred == ["a"]
+    assert sorted(result.errors) == ["../escaped", "b//c", "link/x"]
+    assert all(isinstance(e, ValueError) for e in result.errors.values())
+    assert not (tmp_path / "escaped").exists()
+    assert list(outside.iterdir()) == []
+    # Deleting the extra local files leaves the link alone
+    assert (local_dir / "link").is_symlink()
+
+
+@pytest.mark.parametrize("compare", ["etag", "mtime"])
+def test_sync_converges_with_a_codec(tmp_path, compare):
+    transport = MemoryTransport()
+    s3_dict = S3Dict("test_bucket", "us-east-1", transport=transport, codec="gzip")
+    text = b"compressible " * 1000
+    write(tmp_path / "up" / "a", text)
+
+    assert s3_dict.sync(tmp_path / "up", "up/", compare=compare).transferred == ["a"]
+    assert s3_dict.sync(tmp_path / "up", "up/", compare=compare).transferred == []
+    # Uploaded as is, so that the object's ETag is the file's
+    assert transport.head_object(Bucket="test_bucket", Key="up/a")["Metadata"] == {}
+
+    s3_dict["down/b"] = BytesIO(text)
+    down = tmp_path / "down"
+    for direction, expected in [("download", ["b"]), ("download", []), ("upload", [])]:
+        result = s3_dict.sync(down, "down/", direction=direction, compare=compare)
+        assert result.transferred == expected
+    assert (down / "b").read_bytes() == text
+
+    # A new version of the object is still downloaded
+    s3_dict["down/b"] = BytesIO(text * 2)
+    result = s3_dict.sync(down, "down/", direction="download", compare=compare)
+    assert result.transferred == ["b"]
+    assert (down / "b").read_bytes() == text * 2
+
+
+def test_failure_after_download_is_reported(tmp_path, monkeypatch):
+    s3_dict = S3Dict(
+        "test_bucket", "us-east-1", transport=MemoryTransport(), codec="gzip"
+    )
+    s3_dict["dir/a"] = BytesIO(b"compressible " * 1000)
+    error = OSError("cache full")
+
+    def add_decoded(*args):
+        raise error
+
+    monkeypatch.setattr(s3_sync.HashCache, "add_decoded", add_decoded)
+    result = s3_dict.sync(tmp_path, "dir/", direction="download")
+
+    # The file is in place; the error is the real one, not the temporary
+    # file's removal failing after it was renamed
+    assert result.errors == {"a": error}
+    assert (tmp_path / "a").read_bytes() == b"compressible " * 1000
@@ -0,0 +1,165 @@
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from unittest.mock import Mock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from logic.s3_dict import S3Dict
+from logic.s3_transport import MemoryTransport, Urllib3Transport
+
+LIST_PAGE = b"""<?xml version="1.0" encoding="UTF-8"?>
+<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <Name>bucket</Name><Prefix>data/</Prefix><KeyCount>2</KeyCount>
+  <IsTruncated>true</IsTruncated>
+  <NextContinuationToken>token</NextContinuationToken>
+  <Contents>
+    <Key>data/a+b%2Bc</Key><LastModified>2023-07-12T10:00:00.000Z</LastModified>
+    <ETag>"etag"</ETag><Size>3</Size>
+  </Contents>
+  <CommonPrefixes><Prefix>data/sub/</Prefix></CommonPrefixes>
+</ListBucketResult>"""
+
+
+def response(status=200, data=b"", headers=None, reason="OK"):
+    return Mock(status=status, data=data, headers=headers or {}, reason=reason)
+
+
+@pytest.fixture
+def transport():
+    transport = Urllib3Transport("eu-west-1", "access", "secret")
+    transport.http = Mock()
+    return transport
+
+
+def test_urllib3_get_object_is_signed(transport):
+    transport.http.request.return_value = response(
+        206,
+        b"abc",
+        {"ETag": '"etag"', "Content-Length": "3", "Content-Range": "bytes 0-2/10"},
+    )
+
+    result = transport.get_object(Bucket="bucket", Key="a b", Range="bytes=0-2")
+
+    assert result["Body"].read() == b"abc"
+    assert result["ContentRange"] == "bytes 0-2/10"
+    method, url = transport.http.request.call_args.args
+    headers = transport.http.request.call_args.kwargs["headers"]
+    assert (method, url) == ("GET", "https://bucket.s3.eu-west-1.amazonaws.com/a%20b")
+    assert headers["Range"] == "bytes=0-2"
+    assert "If-Match" not in headers
+    assert headers["Authorization"].startswith("AWS4-HMAC-SHA256 Credential=access/")
+
+
+def test_urllib3_errors_are_client_errors(transport):
+    transport.http.request.return_value = response(
+        404,
+        b"<Error><Code>NoSuchKey</Code><Message>Missing</Message></Error>",
+        reason="Not Found",
+    )
+    with pytest.raises(ClientError) as error:
+        transport.get_object(Bucket="bucket", Key="key")
+    assert error.value.response["Error"]["Code"] == "NoSuchKey"
+
+    # HEAD responses have no body, so the status is the code, as in botocore
+    transport.http.request.return_value = response(404, reason="Not Found")
+    with pytest.raises(ClientError) as error:
+        transport.head_object(Bucket="bucket", Key="key")
+    assert error.value.response["Error"]["Code"] == "404"
+
+
+def test_urllib3_list_objects_v2(transport):
+    transport.http.request.return_value = response(200, LIST_PAGE)
+
+    page = transport.list_objects_v2(
+        Bucket="bucket", Prefix="data/", Delimiter="/", ContinuationToken="prev"
+    )
+
+    assert page["IsTruncated"] and page["NextContinuationToken"] == "token"
+    assert page["Contents"][0]["Key"] == "data/a b+c"
+    assert page["Contents"][0]["Size"] == 3
+    assert page["CommonPrefixes"] == [{"Prefix": "data/sub/"}]
+    url = transport.http.request.call_args.args[1]
+    assert "continuation-token=prev" in url and "delimiter=%2F" in url
+
+
+def test_urllib3_delete_objects_sends_content_md5(transport):
+    transport.http.request.return_value = response(
+        200,
+        b"<DeleteResult><Deleted><Key>a</Key></Deleted>"
+        b"<Error><Key>b</Key><Code>AccessDenied</Code><Message>No</Message></Error>"
+        b"</DeleteResult>",
+    )
+
+    result = transport.delete_objects(
+        Bucket="bucket", Delete={"Objects": [{"Key": "a"}, {"Key": "b"}]}
+    )
+
+    assert result["Deleted"] == [{"Key": "a"}]
+    assert result["Errors"] == [{"Key": "b", "Code": "AccessDenied", "Message": "No"}]
+    assert "Content-MD5" in transport.http.request.call_args.kwargs["headers"]
+
+
+def test_memory_conditional_and_ranged_gets():
+    transport = MemoryTransport()
+    etag = transport.put_object(Bucket="b", Key="k", Body=BytesIO(b"0123456789"))[
+        "ETag"
+    ]
+
+    part = transport.get_object(Bucket="b", Key="k", Range="bytes=2-4", IfMatch=etag)
+    assert part["Body"].read() == b"234"
+    assert part["ContentRange"] == "bytes 2-4/10"
+    for kwargs, code in (
+        ({"IfNoneMatch": etag}, "304"),
+        ({"IfMatch": '"other"'}, "PreconditionFailed"),
+    ):
+        with pytest.raises(ClientError) as error:
+            transport.get_object(Bucket="b", Key="k", **kwargs)
+        assert error.value.response["Error"]["Code"] == code
+
+
+def test_memory_concurrent_multipart_uploads():
+    transport = MemoryTransport()
+    first = transport.create_multipart_upload(Bucket="b", Key="first")["UploadId"]
+    second = transport.create_multipart_upload(Bucket="b", Key="second")["UploadId"]
+    transport.complete_multipart_upload(
+        Bucket="b", Key="first", UploadId=first, MultipartUpload={"Parts": []}
+    )
+    # A finished upload's ID is not given to the next one
+    third = transport.create_multipart_upload(Bucket="b", Key="third")["UploadId"]
+    assert third not in (first, second)
+
+    s3_dict = S3Dict(
+        "b",
+        "us-east-1",
+        transport=transport,
+        multipart_threshold=5 * 1024 * 1024,
+        part_size=5 * 1024 * 1024,
+    )
+    values = {f"big{i}": bytes([i]) * (6 * 1024 * 1024) for i in range(4)}
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda key: s3_dict.put(key, BytesIO(values[key])), values))
+
+    assert transport.calls["CompleteMultipartUpload"] == 1 + 4
+    for key, value in values.items():
+        assert s3_dict[key].read() == value
+
+
+def test_memory_listing_pages_and_common_prefixes():
+    transport = MemoryTransport(page_size=2)
+    for key in ("a", "d/1", "d/2", "d/3", "e", "f"):
+        transport.put_object(Bucket="b", Key=key, Body=b"")
+
+    pages, kwargs = [], {"Bucket": "b", "Delimiter": "/"}
+    while True:
+        page = transport.list_objects_v2(**kwargs)
+        pages.append(
+            [obj["Key"] for obj in page.get("Contents", [])]
+            + [p["Prefix"] for p in page.get("CommonPrefixes", [])]
+        )
+        if not page["IsTruncated"]:
+            break
+        kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+    assert pages == [["a", "d/"], ["e", "f"]]
+    assert transport.calls["ListObjectsV2"] == 2
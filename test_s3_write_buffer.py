@@ -0,0 +1,103 @@
+import threading
+
+import pytest
+
+from logic.s3_write_buffer import WriteBehindBuffer, WriteBehindError
+
+
+class GatedUploader:
+    # Records uploads; each one waits until the gate is opened
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.gate = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def __call__(self, key, data):
+        self.started.release()
+        self.gate.wait(5)
+        with self.lock:
+            self.uploads.append((key, data))
+        if key in self.fail:
+            raise ConnectionError(f"cannot upload {key}")
+
+
+def test_writes_to_the_same_key_are_coalesced():
+    uploader = GatedUploader()
+    buffer = WriteBehindBuffer(uploader, max_workers=1)
+
+    buffer.add("busy", b"0")
+    assert uploader.started.acquire(timeout=5)
+    for i in range(5):
+        buffer.add("key", b"%d" % i)
+    assert buffer.get("key") == b"4"
+
+    uploader.gate.set()
+    buffer.flush()
+
+    assert uploader.uploads == [("busy", b"0"), ("key", b"4")]
+    assert buffer.get("key") is None
+
+
+def test_rewrite_during_upload_is_uploaded_after_it():
+    uploader = GatedUploader()
+    buffer = WriteBehindBuffer(uploader, max_workers=4)
+
+    buffer.add("key", b"old")
+    assert uploader.started.acquire(timeout=5)
+    buffer.add("key", b"new")
+    assert buffer.get("key") == b"new"
+
+    uploader.gate.set()
+    buffer.flush()
+
+    assert uploader.uploads == [("key", b"old"), ("key", b"new")]
+
+
+def test_full_buffer_blocks_writers():
+    uploader = GatedUploader()
+    buffer = WriteBehindBuffer(uploader, max_bytes=10, max_workers=1)
+    buffer.add("a", b"x" * 6)
+    blocked = threading.Thread(target=buffer.add, args=("b", b"y" * 6))
+    blocked.start()
+
+    blocked.join(0.1)
+    assert blocked.is_alive()
+
+    uploader.gate.set()
+    blocked.join(5)
+    assert not blocked.is_alive()
+    buffer.flush()
+    assert [key for key, _ in uploader.uploads] == ["a", "b"]
+
+
+def test_flush_raises_aggregated_errors_once():
+    uploader = GatedUploader(fail={"b", "c"})
+    uploader.gate.set()
+    buffer = WriteBehindBuffer(uploader, max_workers=2)
+    for key in ("a", "b", "c"):
+        buffer.add(key, b"data")
+
+    with pytest.raises(WriteBehindError) as error:
+        buffer.flush()
+
+    assert sorted(error.value.errors) == ["b", "c"]
+    assert isinstance(error.value.errors["b"], ConnectionError)
+    buffer.flush()
+
+
+def test_discard_drops_pending_write():
+    uploader = GatedUploader()
+    buffer = WriteBehindBuffer(uploader, max_workers=1)
+    buffer.add("busy", b"0")
+    assert uploader.started.acquire(timeout=5)
+    buffer.add("key", b"1")
+
+    buffer.discard("key")
+    uploader.gate.set()
+    buffer.close()
+
+    assert uploader.uploads == [("busy", b"0")]
+    with pytest.raises(ValueError):
+        buffer.add("key", b"2")